@@ -7,54 +7,195 @@ sys.path.insert(0, str(project_root))
 
 
 from src.agents.agent import Agent
-from src.config.config import AgentConfig
+from src.config.config import AgentConfig, ServerConfig
 from src.config.logger import setup_logger
-from fastapi import FastAPI, Request, Form
-from fastapi.responses import HTMLResponse
-from fastapi.staticfiles import StaticFiles
-from fastapi.templating import Jinja2Templates
+from fastapi import FastAPI, HTTPException
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
+from contextlib import asynccontextmanager
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+import asyncio
+import json
 import uuid
 
 # setting up logger
-app = FastAPI()
 logger = setup_logger("agent")
+server_config = ServerConfig()
 
-agent = Agent(
-    config=AgentConfig(),
-    logger=logger
-)
-
-# # Mount static files
-# app.mount("/static", StaticFiles(directory="static"), name="static")
-
-# # Templates
-# templates = Jinja2Templates(directory="templates")
-
-# @app.get("/health")
-# def health():
-#     return {"status": "ok"}
-
-# @app.get("/", response_class=HTMLResponse)
-# async def home(request: Request):
-#     return templates.TemplateResponse("index.html", {"request": request})
-
-# @app.post("/chat", response_class=HTMLResponse)
-# async def chat(request: Request, query: str = Form(...), conversation_id: str = Form(None)):
-#     if not conversation_id:
-#         conversation_id = str(uuid.uuid4())
-
-#     try:
-#         result = agent.run(query, conversation_id)
-#         response = result.get("output", "No response generated")
-#         metrics = result.get("metrics", {})
-#     except Exception as e:
-#         response = f"Error: {str(e)}"
-#         metrics = {}
-
-#     return templates.TemplateResponse("index.html", {
-#         "request": request,
-#         "query": query,
-#         "response": response,
-#         "conversation_id": conversation_id,
-#         "metrics": metrics
-#     })
+# Built per worker at startup, so nothing opens sqlite/chroma handles at import time
+agent: Optional[Agent] = None
+
+# Per-worker admission control: chats beyond max_in_flight get a 503 instead of queueing.
+# Only touched from the event loop, so a plain counter is enough
+_in_flight = 0
+_ingest_lock = asyncio.Lock()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global agent
+
+    # Blocking work (tool calls, ingest) runs on one bounded pool, never on the event loop
+    executor = ThreadPoolExecutor(
+        max_workers=server_config.thread_pool_size,
+        thread_name_prefix="agent-worker",
+    )
+    asyncio.get_running_loop().set_default_executor(executor)
+
+    agent = Agent(
+        config=AgentConfig(),
+        logger=logger
+    )
+    if server_config.warm_up:
+        await asyncio.to_thread(agent.warm_up)
+    yield
+    executor.shutdown(wait=False, cancel_futures=True)
+
+
+app = FastAPI(lifespan=lifespan)
+
+
+class ChatRequest(BaseModel):
+    query: str
+    conversation_id: Optional[str] = None
+
+
+class IngestRequest(BaseModel):
+    location: str
+    prune: bool = False
+
+
+def _admit():
+    global _in_flight
+    if _in_flight >= server_config.max_in_flight:
+        raise HTTPException(
+            status_code=503,
+            detail="Server busy, retry shortly",
+            headers={"Retry-After": "1"},
+        )
+    _in_flight += 1
+
+
+def _release():
+    global _in_flight
+    _in_flight -= 1
+
+
+@app.get("/health")
+async def health():
+    return {
+        "status": "ok",
+        "in_flight": _in_flight,
+        "ingesting": _ingest_lock.locked(),
+    }
+
+
+@app.post("/chat")
+async def chat(request: ChatRequest):
+    conversation_id = request.conversation_id or str(uuid.uuid4())
+
+    _admit()
+    try:
+        result = await asyncio.wait_for(
+            agent.arun(request.query, conversation_id),
+            timeout=server_config.request_timeout_seconds,
+        )
+    except asyncio.TimeoutError:
+        logger.error("Chat request timed out", extra={"conversation_id": conversation_id})
+        raise HTTPException(status_code=504, detail="Agent timed out")
+    finally:
+        _release()
+
+    return {**result, "conversation_id": conversation_id}
+
+
+@app.post("/chat/stream")
+async def chat_stream(request: ChatRequest):
+    """Server-sent events: token deltas and tool-call notices, then a final "done" event"""
+    conversation_id = request.conversation_id or str(uuid.uuid4())
+
+    # Admission is decided before the response starts, so a full server still answers 503
+    _admit()
+
+    async def events():
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + server_config.request_timeout_seconds
+        stream = agent.astream(request.query, conversation_id)
+        try:
+            while True:
+                try:
+                    event = await asyncio.wait_for(stream.__anext__(), timeout=deadline - loop.time())
+                except StopAsyncIteration:
+                    break
+                event["conversation_id"] = conversation_id
+                yield f"data: {json.dumps(event, default=str)}\n\n"
+        except Exception as e:
+            error_msg = "Agent timed out" if isinstance(e, asyncio.TimeoutError) else str(e)
+            logger.error("Chat stream failed", extra={"error": error_msg})
+            error = {"type": "done", "output": None, "error": error_msg, "conversation_id": conversation_id}
+            yield f"data: {json.dumps(error)}\n\n"
+        finally:
+            _release()
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        # Keep proxies from buffering the stream
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+def _ingest_location(location: str) -> str:
+    """The request location under the ingest root; anything that could leave the root is rejected"""
+    if server_config.ingest_root is None:
+        raise HTTPException(status_code=403, detail="Ingest is disabled: no ingest_root is configured")
+
+    relative = Path(location)
+    if relative.is_absolute() or ".." in relative.parts:
+        raise HTTPException(status_code=400, detail="location must be a relative path inside the ingest root")
+    # Symlinks out of the root are dropped file by file by the loader
+    return str(Path(server_config.ingest_root) / relative)
+
+
+@app.post("/ingest")
+async def ingest(request: IngestRequest):
+    """
+    Ingest a directory, JSONL file or glob pattern, relative to the ingest
+    root. One ingest at a time: ingesting servers run a single worker
+    """
+    location = _ingest_location(request.location)
+    if _ingest_lock.locked():
+        raise HTTPException(status_code=409, detail="An ingest is already running")
+
+    # Imported here so the pipeline is the same instance the rag_search tool uses
+    from utils.tools import get_rag_pipeline
+
+    async with _ingest_lock:
+        try:
+            report = await asyncio.to_thread(
+                lambda: get_rag_pipeline().ingest_from(location, request.prune, root=server_config.ingest_root)
+            )
+        except (OSError, ValueError) as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+    return report.get_summary()
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    # Each worker is a separate process with its own agent, pool and admission limit.
+    # They don't share the keyword index, query cache or ingest lock, so an ingest in
+    # one would leave the others serving stale results: ingesting servers run one worker
+    workers = server_config.workers
+    if server_config.ingest_root is not None and workers > 1:
+        logger.warning("Ingest is enabled; running 1 worker instead of %d", workers)
+        workers = 1
+
+    uvicorn.run(
+        "backend.main:app",
+        host=server_config.host,
+        port=server_config.port,
+        workers=workers,
+    )
@@ -1,5 +1,6 @@
 import streamlit as st
 import requests
+import json
 import uuid
 from datetime import datetime
 
@@ -206,51 +207,85 @@ if prompt := st.chat_input("Ask me anything about your documents...", disabled=s
     </div>
     """, unsafe_allow_html=True)
     
-    # Generate response from backend
-    with st.spinner("🤔 Thinking..."):
-        try:
-            # Call backend API
-            response = requests.post(
-                f"{BACKEND_URL}/chat",
-                json={
-                    "query": prompt,
-                    "conversation_id": st.session_state.conversation_id
-                },
-                timeout=60
-            )
-            
+    # Stream response from backend
+    placeholder = st.empty()
+    status = st.empty()
+    status.markdown("🤔 Thinking...")
+
+    def render_assistant(content):
+        placeholder.markdown(f"""
+        <div class="chat-message assistant-message">
+            <strong>🤖 Assistant</strong><br>
+            {content}
+        </div>
+        """, unsafe_allow_html=True)
+
+    try:
+        # Call backend API (server-sent events)
+        with requests.post(
+            f"{BACKEND_URL}/chat/stream",
+            json={
+                "query": prompt,
+                "conversation_id": st.session_state.conversation_id
+            },
+            stream=True,
+            timeout=(5, 60)
+        ) as response:
+
             if response.status_code == 200:
-                data = response.json()
-                assistant_response = data.get("output", "No response generated")
-                metrics = data.get("metrics", {})
-                
+                streamed = ""
+                data = {}
+                for line in response.iter_lines(decode_unicode=True):
+                    if not line or not line.startswith("data: "):
+                        continue
+
+                    event = json.loads(line[len("data: "):])
+                    if event["type"] == "token":
+                        streamed += event["content"]
+                        status.empty()
+                        render_assistant(streamed + "▌")
+                    elif event["type"] == "tool_call":
+                        # Text before a tool call is the model thinking aloud; the answer comes after
+                        streamed = ""
+                        status.markdown(f"🔧 Calling {event['tool']}...")
+                    elif event["type"] == "done":
+                        data = event
+
+                status.empty()
+                assistant_response = data.get("output") or data.get("error") or "No response generated"
+                metrics = data.get("metrics") or {}
+
                 # Update metrics
                 st.session_state.metrics = metrics
-                
+
                 # Add assistant response to chat history
                 st.session_state.messages.append({"role": "assistant", "content": assistant_response})
-                
+
                 # Rerun to display the new message
                 st.rerun()
             else:
+                status.empty()
                 error_message = f"Error: Backend returned status code {response.status_code}"
                 st.error(error_message)
                 st.session_state.messages.append({"role": "assistant", "content": error_message})
-                
-        except requests.exceptions.Timeout:
-            error_message = "Error: Request timed out. The backend might be processing a complex query."
-            st.error(error_message)
-            st.session_state.messages.append({"role": "assistant", "content": error_message})
-            
-        except requests.exceptions.ConnectionError:
-            error_message = "Error: Could not connect to backend. Please ensure the FastAPI server is running."
-            st.error(error_message)
-            st.session_state.messages.append({"role": "assistant", "content": error_message})
-            
-        except Exception as e:
-            error_message = f"Error: {str(e)}"
-            st.error(error_message)
-            st.session_state.messages.append({"role": "assistant", "content": error_message})
+
+    except requests.exceptions.Timeout:
+        status.empty()
+        error_message = "Error: Request timed out. The backend might be processing a complex query."
+        st.error(error_message)
+        st.session_state.messages.append({"role": "assistant", "content": error_message})
+
+    except requests.exceptions.ConnectionError:
+        status.empty()
+        error_message = "Error: Could not connect to backend. Please ensure the FastAPI server is running."
+        st.error(error_message)
+        st.session_state.messages.append({"role": "assistant", "content": error_message})
+
+    except Exception as e:
+        status.empty()
+        error_message = f"Error: {str(e)}"
+        st.error(error_message)
+        st.session_state.messages.append({"role": "assistant", "content": error_message})
 
 # Footer
 st.markdown("---")
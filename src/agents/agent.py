@@ -6,121 +6,481 @@ project_root = Path(__file__).parent.parent
 sys.path.insert(0, str(project_root))
 
 import os
+import asyncio
+import inspect
 import logging
+import threading
+from contextvars import ContextVar
 from datetime import datetime
 from time import perf_counter
 
-from openai import OpenAI
+import openai
+from openai import OpenAI, AsyncOpenAI
+from openai.resources.chat.completions import Completions
+from openai.types.chat import ChatCompletionMessage, ChatCompletionMessageToolCall
 from dotenv import load_dotenv
 
-from tenacity import (
-    retry,
-    retry_if_exception_type,
-    wait_exponential,
-    stop_after_attempt,
-    before_sleep_log
-)
-
 from config.config import AgentConfig
 from config.logger import generate_run_id
-from utils.tools import tool_map, tools
+from rag.index import get_encoding
+from rag.rate_limit import estimate_chat_tokens, get_limiter, priority
+from rag.resilience import ResiliencePolicy, is_transient
+from utils.tools import tool_map, tools, batch_tool_map, get_rag_pipeline
 from utils.metrics import AgentMetrics
-from utils.ctx_manager import ContextWindowManager, ConversationManager
+from utils.ctx_manager import ContextCompactor, ContextWindowManager, ConversationManager
+from utils.conversation_store import make_conversation_backend
+from utils.llm_cache import LLMResponseCache
 
 load_dotenv()
 
-client = OpenAI(
-    api_key=os.getenv("OPENAI_API_KEY"),
-    base_url=os.getenv("OPENAI_BASE_URL"),
-)
+# Clients are built on first use. Retries are left to the agent's
+# ResiliencePolicy (classification, Retry-After, breaker)
+_client = None
+_async_client = None
+_client_lock = threading.Lock()
+
+
+def get_client() -> OpenAI:
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = OpenAI(
+                    api_key=os.getenv("OPENAI_API_KEY"),
+                    base_url=os.getenv("OPENAI_BASE_URL"),
+                    max_retries=0,
+                )
+    return _client
+
+
+def get_async_client() -> AsyncOpenAI:
+    global _async_client
+    if _async_client is None:
+        with _client_lock:
+            if _async_client is None:
+                _async_client = AsyncOpenAI(
+                    api_key=os.getenv("OPENAI_API_KEY"),
+                    base_url=os.getenv("OPENAI_BASE_URL"),
+                    max_retries=0,
+                )
+    return _async_client
+
+# run_id / conversation_id of the run in progress. A context variable keeps
+# concurrent runs (threads or asyncio tasks) on one Agent from mixing logs
+_run_context: ContextVar[dict] = ContextVar("agent_run_context", default={})
 
 # ---------------------------------------------------------------------
 # Custom Error Types (VERY IMPORTANT)
 # ---------------------------------------------------------------------
 
-class TransientLLMError(TypeError):
-    """Retryable LLM failure (timeouts, 5xx, parsing issues)"""
+class TransientLLMError(RuntimeError):
+    """Transient LLM failure (rate limit, timeout, 5xx) that outlasted retries"""
 
 
 class FatalLLMError(RuntimeError):
     """Non-retryable LLM failure"""
 
+
+def check_request_params(request: dict):
+    """
+    Fail at startup, naming the argument, if the installed openai client's
+    chat.completions.create() doesn't accept something the agent sends
+    (rather than a TypeError on every call after a version change)
+    """
+    unknown = sorted(set(request) - set(inspect.signature(Completions.create).parameters))
+    if unknown:
+        raise FatalLLMError(
+            f"openai {openai.__version__} chat.completions.create() does not accept {unknown}; "
+            "pass them via extra_body or upgrade openai"
+        )
+
 # AGENT BASE CLASS
 class Agent:
     def __init__(self, config: AgentConfig, logger):
-        self.logger = logger
+        self._logger = logger
         self.model = config.model
         self.max_iterations = config.max_iterations
         self.max_tokens = config.max_tokens_per_call
         self.temperature = config.temperature
         self.max_context_tokens = config.max_context_tokens
         self.require_approval = config.require_approval
+        self.tool_timeout = config.tool_timeout_seconds
+        self.max_concurrent_tools = config.max_concurrent_tools
+        self.enable_streaming = config.enable_streaming
+
+        self.conversations = ConversationManager(
+            backend=make_conversation_backend(config),
+            max_conversations=config.max_conversations,
+            ttl_seconds=config.conversation_ttl_seconds,
+            max_messages=config.max_history_messages,
+        )
+
+        self.llm_cache = (
+            LLMResponseCache(
+                max_entries=config.llm_cache_size,
+                ttl_seconds=config.llm_cache_ttl,
+                path=config.llm_cache_path,
+                any_temperature=config.llm_cache_any_temperature,
+            )
+            if config.llm_cache_enabled else None
+        )
+
+        self.llm_policy = ResiliencePolicy(
+            "chat",
+            max_attempts=config.llm_max_attempts,
+            failure_threshold=config.circuit_failure_threshold,
+            reset_timeout=config.circuit_reset_seconds,
+            hedge_after=config.llm_hedge_after_ms / 1000 if config.llm_hedge_after_ms else None,
+            limiter=get_limiter("chat", rpm=config.llm_rpm, tpm=config.llm_tpm, path=config.rate_limit_path),
+            logger=logging.getLogger("agent"),
+        )
+
+        self.summary_max_tokens = config.summary_max_tokens
+        self.compactor = (
+            ContextCompactor(self._summarize, max_conversations=config.max_conversations)
+            if config.context_strategy == "summarize" else None
+        )
 
         self.allowed_tools = [
             tool for tool in tools
             if tool["function"]["name"] in config.allowed_tools
         ]
+        check_request_params(self._llm_request([], stream=True))
+
+    @property
+    def logger(self):
+        return logging.LoggerAdapter(self._logger, _run_context.get())
+
+    def _llm_request(self, messages, stream: bool = False) -> dict:
+        request = dict(
+            model=self.model,
+            temperature=self.temperature,
+            tools=self.allowed_tools,
+            tool_choice="auto",
+            messages=messages,
+            max_tokens=self.max_tokens,
+        )
+        if stream:
+            request["stream"] = True
+            # Usage only arrives on a final chunk, and only when asked for. Sent in the
+            # body: the pinned openai client predates the stream_options argument
+            request["extra_body"] = {"stream_options": {"include_usage": True}}
+        return request
+
+    def _tokens(self, request: dict) -> int:
+        return estimate_chat_tokens(request) if self.llm_policy.limiter is not None else 0
+
+    def _create(self, request: dict):
+        self.logger.info("📡 Calling LLM")
+        return self.llm_policy.call(
+            lambda: get_client().chat.completions.create(**request),
+            tokens=self._tokens(request),
+        )
+
+    async def _acreate(self, request: dict):
+        self.logger.info("📡 Calling LLM")
+        # A hedged stream would leave the losing connection open
+        return await self.llm_policy.acall(
+            lambda: get_async_client().chat.completions.create(**request),
+            hedge=not request.get("stream"),
+            tokens=self._tokens(request),
+        )
 
+    @staticmethod
+    def _classify(error: Exception) -> Exception:
+        if is_transient(error):
+            return TransientLLMError(str(error))
+        return FatalLLMError(str(error))
 
-    @retry(
-        retry=retry_if_exception_type(TransientLLMError),
-        wait=wait_exponential(multiplier=1, min=1, max=10),
-        stop=stop_after_attempt(3),
-        reraise=True,
-        before_sleep=before_sleep_log(logging.getLogger("agent"), logging.WARNING),
-    )
     def _call_llm(self, messages):
         """
         One LLM call.
-        Retries ONLY for transient failures.
+        Retries ONLY for transient failures (see llm_policy).
         """
 
         try:
-            self.logger.info("📡 Calling LLM")
-            return client.chat.completions.create(
-                model=self.model,
-                temperature=self.temperature,
-                tools=self.allowed_tools,
-                tool_choice="auto",
-                messages=messages,
-                max_tokens=self.max_tokens,
+            request = self._llm_request(messages)
+            if self.llm_cache is not None and self.llm_cache.cacheable(request):
+                return self.llm_cache.get_or_create(request, lambda: self._create(request))
+            return self._create(request)
+
+        except Exception as e:
+            raise self._classify(e) from e
+
+    async def _acall_llm(self, messages, stream: bool = False):
+        """Async twin of _call_llm. With stream=True, only opening the stream is retried"""
+
+        try:
+            request = self._llm_request(messages, stream)
+            if self.llm_cache is not None and self.llm_cache.cacheable(request):
+                return await self.llm_cache.aget_or_create(request, lambda: self._acreate(request))
+            return await self._acreate(request)
+
+        except Exception as e:
+            raise self._classify(e) from e
+
+    def _batch_groups(self, tool_calls) -> dict:
+        """
+        Tool calls that can share a batch call (e.g. several rag_search
+        calls in one turn): {tool_name: [(tool_call.id, args)]}, only for
+        tools with a batch variant that are called more than once.
+        """
+        groups = {}
+        for tool_call in tool_calls:
+            tool_name = tool_call.function.name
+            if tool_name not in batch_tool_map:
+                continue
+            try:
+                _, input_model = tool_map[tool_name]
+                args = input_model.model_validate_json(tool_call.function.arguments)
+            except Exception:
+                continue
+            groups.setdefault(tool_name, []).append((tool_call.id, args))
+
+        return {tool_name: calls for tool_name, calls in groups.items() if len(calls) >= 2}
+
+    def _run_batch(self, tool_name: str, calls: list) -> dict:
+        """
+        Serve one group with a single call to the tool's batch variant.
+        Returns {tool_call.id: (result, latency_ms share)}, or {} if it
+        failed so that the calls fall back to the per-call path.
+        """
+        try:
+            start_time = perf_counter()
+            outputs = batch_tool_map[tool_name]([args for _, args in calls])
+            latency_ms = (perf_counter() - start_time) * 1000
+        except Exception as e:
+            self.logger.error(
+                "Batched tool call failed",
+                extra={"tool": tool_name, "error": str(e)}
+            )
+            return {}
+
+        self.logger.info(
+            "Batched tool calls",
+            extra={"tool": tool_name, "calls": len(calls), "latency_ms": latency_ms}
+        )
+        return {call_id: (output, latency_ms / len(calls)) for (call_id, _), output in zip(calls, outputs)}
+
+    def _run_batched_tools(self, tool_calls) -> dict:
+        """Run every batch group in turn; {tool_call.id: (result, latency_ms share)}"""
+        results = {}
+        for tool_name, calls in self._batch_groups(tool_calls).items():
+            results.update(self._run_batch(tool_name, calls))
+        return results
+
+    def _run_tool(self, tool_call, batched: dict, metrics: AgentMetrics, iteration: int) -> dict:
+        """Execute one tool call and return its tool message"""
+        tool_name = tool_call.function.name
+
+        self.logger.info(
+            "Tool call",
+            extra={
+                "tool": tool_name,
+                "iteration": iteration + 1,
+            },
+        )
+        
+        # if tool_name not in [t["function"]["name"] for t in self.allowed_tools]:
+        #     raise RuntimeError(f"Tool not allowed: {tool_name}")
+
+        # print(f"🔧 Calling tool: {tool_name}")
+
+        try:
+            func, input_model = tool_map[tool_name]
+            args = input_model.model_validate_json(
+                tool_call.function.arguments
             )
 
-        except TypeError as e:
-            # Retryable
-            raise TransientLLMError(str(e))
+            metrics.log_tool_call(tool_name, args.model_dump())
+
+            if tool_call.id in batched:
+                result, latency_ms = batched[tool_call.id]
+            else:
+                start_time = perf_counter()
+                result = func(**args.model_dump())
+                latency_ms = (perf_counter() - start_time) * 1000
+            metrics.log_tool_latency(tool_name, latency_ms)
+            
+            self.logger.info(
+                "Tool executed",
+                extra={
+                    "tool": tool_name,
+                    "latency_ms": latency_ms,
+                    "iteration": iteration + 1,
+                }
+            )
+
+            print("   ✓ Tool success")
+            return {
+                "role": "tool",
+                "tool_call_id": tool_call.id,
+                "content": str(result),
+            }
 
         except Exception as e:
-            # Non-retryable
-            raise FatalLLMError(str(e))
+            return self._tool_error(tool_call, f"Tool {tool_name} failed: {e}", metrics)
+
+    def _tool_error(self, tool_call, error_msg: str, metrics: AgentMetrics) -> dict:
+        self.logger.error(
+            "Tool execution failed",
+            extra={
+                "tool": tool_call.function.name,
+                "error": error_msg
+            }
+        )
+        metrics.log_error(error_msg)
+
+        return {
+            "role": "tool",
+            "tool_call_id": tool_call.id,
+            "content": error_msg,
+        }
+
+    async def _arun_tools(self, tool_calls, metrics: AgentMetrics, iteration: int) -> list:
+        """
+        Run one turn's tool calls concurrently (at most max_concurrent_tools
+        at a time, each within tool_timeout) and return their tool messages
+        in the original call order. Batch groups run alongside the other
+        calls, as one call each.
+        """
+        semaphore = asyncio.Semaphore(self.max_concurrent_tools)
+
+        async def run_batch(tool_name: str, calls: list):
+            async with semaphore:
+                try:
+                    return await asyncio.wait_for(
+                        asyncio.to_thread(self._run_batch, tool_name, calls),
+                        timeout=self.tool_timeout,
+                    )
+                except asyncio.TimeoutError:
+                    return None
+
+        batches = {}
+        for tool_name, calls in self._batch_groups(tool_calls).items():
+            task = asyncio.ensure_future(run_batch(tool_name, calls))
+            batches.update((call_id, task) for call_id, _ in calls)
+
+        async def run_one(tool_call):
+            batched = {}
+            if tool_call.id in batches:
+                batched = await batches[tool_call.id]
+                if batched is None:
+                    # The batch thread is still running: don't send the same calls upstream again
+                    error_msg = f"Tool {tool_call.function.name} timed out after {self.tool_timeout}s"
+                    return self._tool_error(tool_call, error_msg, metrics)
+
+            async with semaphore:
+                try:
+                    return await asyncio.wait_for(
+                        asyncio.to_thread(self._run_tool, tool_call, batched, metrics, iteration),
+                        timeout=self.tool_timeout,
+                    )
+                except asyncio.TimeoutError:
+                    error_msg = f"Tool {tool_call.function.name} timed out after {self.tool_timeout}s"
+                    return self._tool_error(tool_call, error_msg, metrics)
 
+        return await asyncio.gather(*(run_one(tool_call) for tool_call in tool_calls))
 
-    def _execute(self, query: str, conversation_id: str):
+    def _start(self, query: str, history: list) -> AgentMetrics:
         metrics = AgentMetrics()
         metrics.start_time = datetime.now()
 
-        messages = ConversationManager().get_or_create(conversation_id)
-        messages.append({"role": "user", "content": query})
+        history.append({"role": "user", "content": query})
+        return metrics
+
+    def _summarize(self, summary: str, transcript: str) -> str:
+        """Fold a transcript of evicted turns into the running summary (runs off the request path)"""
+        request = dict(
+            model=self.model,
+            temperature=0,
+            max_tokens=self.summary_max_tokens,
+            messages=[
+                {
+                    "role": "system",
+                    "content": (
+                        "Update the summary of a conversation between a user and an assistant "
+                        "with the new messages. Keep facts, decisions, open questions and tool "
+                        "findings the assistant may need later. Be concise."
+                    ),
+                },
+                {
+                    "role": "user",
+                    "content": f"Current summary:\n{summary or '(none)'}\n\nNew messages:\n{transcript}",
+                },
+            ],
+        )
+        # Background work: chat requests get the rate-limit budget first
+        with priority("bulk"):
+            response = self.llm_policy.call(
+                lambda: get_client().chat.completions.create(**request),
+                tokens=self._tokens(request),
+            )
+        return response.choices[0].message.content or summary
 
-        for iteration in range(self.max_iterations):
-            metrics.iterations = iteration + 1
+    def _prepare_iteration(self, conversation_id: str, messages: list, metrics: AgentMetrics, iteration: int) -> list:
+        metrics.iterations = iteration + 1
 
-            self.logger.info(
-                "Iteration start",
-                extra={"iteration": iteration + 1}
+        self.logger.info(
+            "Iteration start",
+            extra={"iteration": iteration + 1}
+        )
+
+        # Context management (on a copy: the stored history stays complete)
+        if self.compactor:
+            return self.compactor.build_context(
+                conversation_id, messages, self.max_context_tokens, offset=self.conversations.offset(conversation_id)
             )
 
-            # Context management
-            messages = ContextWindowManager().truncate_messages(
-                messages=messages,
-                max_tokens=self.max_context_tokens,
+        return ContextWindowManager().truncate_messages(
+            messages=list(messages),
+            max_tokens=self.max_context_tokens,
+        )
+
+        # print(
+        #     f"📝 Context: "
+        #     f"{ContextWindowManager().count_tokens(messages)} tokens, "
+        #     f"{len(messages)} messages"
+        # )
+
+    def _record_response(self, response, messages: list, metrics: AgentMetrics):
+        """Account for an LLM response and add the assistant turn to the history"""
+        if getattr(response, "usage", None):
+            metrics.tokens_used += response.usage.total_tokens
+
+        return self._record_message(response.choices[0].message, messages)
+
+    def _record_message(self, message, messages: list):
+        if not message.tool_calls:
+            messages.append(
+                {"role": "assistant", "content": message.content}
             )
+        else:
+            # Tool results must follow the assistant message that requested them
+            messages.append(message.model_dump(exclude_none=True))
+
+        return message
 
-            # print(
-            #     f"📝 Context: "
-            #     f"{ContextWindowManager().count_tokens(messages)} tokens, "
-            #     f"{len(messages)} messages"
-            # )
+    def _final_answer(self, message, metrics: AgentMetrics) -> dict:
+        metrics.end_time = datetime.now()
+        return {
+            "output": message.content,
+            "metrics": metrics.print_summary(),
+        }
+
+    def _max_iterations_reached(self, metrics: AgentMetrics) -> dict:
+        metrics.end_time = datetime.now()
+        return {
+            "output": None,
+            "error": "Max iterations reached",
+            "metrics": metrics.get_summary(),
+        }
+
+    def _execute(self, query: str, conversation_id: str, history: list):
+        metrics = self._start(query, history)
+
+        for iteration in range(self.max_iterations):
+            messages = self._prepare_iteration(conversation_id, history, metrics, iteration)
 
             try:
                 response = self._call_llm(messages)
@@ -155,111 +515,175 @@ class Agent:
                 metrics.log_error(str(e))
                 break
 
-            if getattr(response, "usage", None):
-                metrics.tokens_used += response.usage.total_tokens
-
-            message = response.choices[0].message
+            message = self._record_response(response, history, metrics)
 
             # ----------------------------------------------------------
             # NO TOOL CALL → FINAL ANSWER
             # ----------------------------------------------------------
 
             if not message.tool_calls:
-                messages.append(
-                    {"role": "assistant", "content": message.content}
-                )
-                metrics.end_time = datetime.now()
-                return {
-                    "output": message.content,
-                    "metrics": metrics.print_summary(),
-                }
+                return self._final_answer(message, metrics)
 
+            batched = self._run_batched_tools(message.tool_calls)
 
             for tool_call in message.tool_calls:
-                tool_name = tool_call.function.name
-
-                self.logger.info(
-                    "Tool call",
-                    extra={
-                        "tool": tool_name,
-                        "iteration": iteration + 1,
-                    },
-                )
-                
-                # if tool_name not in [t["function"]["name"] for t in self.allowed_tools]:
-                #     raise RuntimeError(f"Tool not allowed: {tool_name}")
+                history.append(self._run_tool(tool_call, batched, metrics, iteration))
 
-                # print(f"🔧 Calling tool: {tool_name}")
+        # -----------------------------------------------------------------
+        # MAX ITERATIONS EXCEEDED
+        # -----------------------------------------------------------------
 
-                try:
-                    func, input_model = tool_map[tool_name]
-                    args = input_model.model_validate_json(
-                        tool_call.function.arguments
-                    )
+        return self._max_iterations_reached(metrics)
 
-                    metrics.log_tool_call(tool_name, args.model_dump())
-
-                    start_time = perf_counter()
-                    result = func(**args.model_dump())
-                    latency_ms = (perf_counter() - start_time) * 1000
-                    metrics.log_tool_latency(tool_name, latency_ms)
-                    
-                    self.logger.info(
-                        "Tool executed",
-                        extra={
-                            "tool": tool_name,
-                            "latency_ms": latency_ms,
-                            "iteration": iteration + 1,
-                        }
-                    )
-                    
-                    messages.append(
-                        {
-                            "role": "tool",
-                            "tool_call_id": tool_call.id,
-                            "content": str(result),
-                        }
-                    )
+    async def _aexecute(self, query: str, conversation_id: str, history: list):
+        metrics = self._start(query, history)
 
-                    print("   ✓ Tool success")
+        for iteration in range(self.max_iterations):
+            messages = self._prepare_iteration(conversation_id, history, metrics, iteration)
 
-                except Exception as e:
-                    error_msg = f"Tool {tool_name} failed: {e}"
-                    self.logger.error(
-                        "Tool execution failed",
-                        extra={
-                            "tool": tool_name,
-                            "error": str(e)
-                        }
-                    )
-                    metrics.log_error(error_msg)
-
-                    messages.append(
-                        {
-                            "role": "tool",
-                            "tool_call_id": tool_call.id,
-                            "content": error_msg,
-                        }
-                    )
+            try:
+                response = await self._acall_llm(messages)
 
-        # -----------------------------------------------------------------
-        # MAX ITERATIONS EXCEEDED
-        # -----------------------------------------------------------------
+            except FatalLLMError as e:
+                self.logger.error("Fatal LLM error", extra={"error": str(e)})
+                metrics.log_error(str(e))
+                break
 
-        metrics.end_time = datetime.now()
-        return {
-            "output": None,
-            "error": "Max iterations reached",
-            "metrics": metrics.get_summary(),
-        }
+            except Exception as e:
+                self.logger.error("LLM failed after retries", extra={"error": str(e)})
+                metrics.log_error(str(e))
+                break
 
-    def run(self, query: str, conversation_id: str):
-        run_id = generate_run_id()
-        
-        self.logger = logging.LoggerAdapter(
-            self.logger,
-            {"run_id": run_id, "conversation_id": conversation_id}
+            message = self._record_response(response, history, metrics)
+
+            if not message.tool_calls:
+                return self._final_answer(message, metrics)
+
+            # Independent tool calls from one turn run concurrently
+            history.extend(await self._arun_tools(message.tool_calls, metrics, iteration))
+
+        return self._max_iterations_reached(metrics)
+
+    async def _astream_turn(self, messages: list, metrics: AgentMetrics):
+        """
+        Stream one LLM turn. Yields content deltas as they arrive, then the
+        assembled ChatCompletionMessage (tool-call deltas are stitched
+        together by index).
+        """
+        stream = await self._acall_llm(messages, stream=True)
+
+        content = []
+        calls = {}
+        async for chunk in stream:
+            usage = getattr(chunk, "usage", None)
+            if usage:
+                # Clients whose chunk model has no usage field keep it as a plain dict
+                metrics.tokens_used += usage["total_tokens"] if isinstance(usage, dict) else usage.total_tokens
+            if not chunk.choices:
+                continue
+
+            delta = chunk.choices[0].delta
+            if delta.content:
+                content.append(delta.content)
+                yield delta.content
+
+            for tool_delta in delta.tool_calls or []:
+                call = calls.setdefault(tool_delta.index, {"id": None, "name": "", "arguments": ""})
+                if tool_delta.id:
+                    call["id"] = tool_delta.id
+                if tool_delta.function:
+                    call["name"] += tool_delta.function.name or ""
+                    call["arguments"] += tool_delta.function.arguments or ""
+
+        tool_calls = [
+            ChatCompletionMessageToolCall(
+                id=call["id"],
+                type="function",
+                function={"name": call["name"], "arguments": call["arguments"]},
+            )
+            for _, call in sorted(calls.items())
+        ]
+        yield ChatCompletionMessage(
+            role="assistant",
+            content="".join(content) or None,
+            tool_calls=tool_calls or None,
         )
-        
+
+    async def _astream(self, query: str, conversation_id: str, history: list):
+        metrics = self._start(query, history)
+
+        for iteration in range(self.max_iterations):
+            messages = self._prepare_iteration(conversation_id, history, metrics, iteration)
+
+            message = None
+            try:
+                async for item in self._astream_turn(messages, metrics):
+                    if isinstance(item, str):
+                        yield {"type": "token", "content": item}
+                    else:
+                        message = item
+
+            except FatalLLMError as e:
+                self.logger.error("Fatal LLM error", extra={"error": str(e)})
+                metrics.log_error(str(e))
+                break
+
+            except Exception as e:
+                self.logger.error("LLM stream failed", extra={"error": str(e)})
+                metrics.log_error(str(e))
+                break
+
+            self._record_message(message, history)
+
+            if not message.tool_calls:
+                yield {"type": "done", **self._final_answer(message, metrics)}
+                return
+
+            for tool_call in message.tool_calls:
+                yield {"type": "tool_call", "tool": tool_call.function.name}
+
+            history.extend(await self._arun_tools(message.tool_calls, metrics, iteration))
+
+        yield {"type": "done", **self._max_iterations_reached(metrics)}
+
+    def _begin_run(self, conversation_id: str):
+        _run_context.set({"run_id": generate_run_id(), "conversation_id": conversation_id})
         self.logger.info("Agent run started")
-        return self._execute(query, conversation_id)
+
+    def run(self, query: str, conversation_id: str):
+        self._begin_run(conversation_id)
+        with self.conversations.session(conversation_id) as history:
+            return self._execute(query, conversation_id, history)
+
+    async def arun(self, query: str, conversation_id: str):
+        """Asyncio-native run: non-blocking LLM calls and concurrent tool calls"""
+        self._begin_run(conversation_id)
+        async with self.conversations.asession(conversation_id) as history:
+            return await self._aexecute(query, conversation_id, history)
+
+    async def astream(self, query: str, conversation_id: str):
+        """
+        Run the agent, yielding events as they happen:
+        {"type": "token"} content deltas, {"type": "tool_call"} notices and
+        a final {"type": "done"} carrying the same payload as run().
+        With streaming disabled, only the "done" event is produced.
+        """
+        if not self.enable_streaming:
+            yield {"type": "done", **await self.arun(query, conversation_id)}
+            return
+
+        self._begin_run(conversation_id)
+        async with self.conversations.asession(conversation_id) as history:
+            async for event in self._astream(query, conversation_id, history):
+                yield event
+
+    def warm_up(self):
+        """
+        Build what the first request would otherwise pay for: API clients,
+        the RAG pipeline (vector store, indexes) and the tokenizer
+        """
+        get_client()
+        get_async_client()
+        get_rag_pipeline()
+        get_encoding("gpt-4o-mini")
+        self.logger.info("Agent warmed up")
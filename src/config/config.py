@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field
-from typing import List
+from typing import List, Literal, Optional
 
 class AgentConfig(BaseModel):
     """Agent configuration"""
@@ -8,14 +8,88 @@ class AgentConfig(BaseModel):
     max_tokens_per_call: int = Field(default=500, ge=100, le=4000)
     max_context_tokens: int = Field(default=3000)
     temperature: float = Field(default=0.7, ge=0.0, le=2.0)
-    enable_streaming: bool = False
+    enable_streaming: bool = True
     require_approval: bool = False
     allowed_tools: List[str] = ["web-search", "calculator"] or []
+    tool_timeout_seconds: float = Field(default=30.0, gt=0, description="Per-tool timeout in async runs")
+    max_concurrent_tools: int = Field(default=4, ge=1, description="Tool calls run at once in async runs")
+    conversation_store: Literal["memory", "sqlite", "redis"] = Field(default="sqlite", description="Conversation persistence backend")
+    conversation_db_path: str = "./conversations.sqlite"
+    conversation_redis_url: str = "redis://localhost:6379/0"
+    max_conversations: int = Field(default=1000, ge=1, description="Histories cached in memory per process")
+    conversation_ttl_seconds: float = Field(default=3600.0, gt=0, description="Idle time before a cached history is dropped")
+    max_history_messages: int = Field(default=200, ge=2, description="Recent messages of a conversation kept in memory (the store keeps all)")
+    context_strategy: Literal["truncate", "summarize"] = Field(default="summarize", description="How history beyond max_context_tokens is handled")
+    summary_max_tokens: int = Field(default=300, ge=50, description="Length cap of the rolling conversation summary")
+    llm_cache_enabled: bool = True
+    llm_cache_any_temperature: bool = Field(default=False, description="Also cache responses at temperature > 0")
+    llm_cache_size: int = Field(default=1024, ge=1, description="Responses kept in memory")
+    llm_cache_ttl: float = Field(default=3600.0, gt=0, description="Seconds a cached response stays valid")
+    llm_cache_path: Optional[str] = Field(default="./llm_cache.sqlite", description="On-disk tier; None keeps it in memory")
+    llm_max_attempts: int = Field(default=3, ge=1, description="Attempts per LLM call on transient errors")
+    llm_hedge_after_ms: Optional[float] = Field(default=None, description="Send a duplicate LLM request if the first takes longer; None disables hedging")
+    circuit_failure_threshold: int = Field(default=5, ge=1, description="Consecutive transient failures that open the LLM circuit")
+    circuit_reset_seconds: float = Field(default=30.0, gt=0, description="How long an open circuit refuses calls")
+    llm_rpm: Optional[int] = Field(default=None, ge=1, description="Chat requests per minute budget; None disables limiting")
+    llm_tpm: Optional[int] = Field(default=None, ge=1, description="Chat tokens per minute budget (prompt + max_tokens)")
+    rate_limit_path: Optional[str] = Field(default=None, description="sqlite file shared by workers for rate-limit budgets")
     
+class ServerConfig(BaseModel):
+    """API server configuration"""
+    host: str = "0.0.0.0"
+    port: int = 8000
+    workers: int = Field(default=2, ge=1, description="Uvicorn worker processes")
+    thread_pool_size: int = Field(default=16, ge=1, description="Threads for blocking work (tools, ingest) per worker")
+    max_in_flight: int = Field(default=32, ge=1, description="Concurrent chat requests per worker before 503")
+    request_timeout_seconds: float = Field(default=120.0, gt=0, description="Chat request timeout")
+    warm_up: bool = Field(default=True, description="Build clients and the RAG pipeline at startup instead of on the first request")
+    ingest_root: Optional[str] = Field(default=None, description="Directory /ingest may read from (None disables /ingest); ingesting runs a single worker")
+
 class RagConfig(BaseModel):
     """RAG system configuration"""
     chunk_size: int = Field(default=500, description="Character per chunk")
     chunk_overlap: int = Field(default=50, description="Overlap between chunks")
+    chunking_strategy: Literal["chars", "tokens"] = Field(default="chars", description="Chunk by character count or by token budget")
+    chunk_tokens: int = Field(default=400, ge=16, description="Tokens per chunk when chunking by tokens")
+    chunk_overlap_tokens: int = Field(default=40, ge=0, description="Token overlap between chunks when chunking by tokens")
+    chunking_workers: int = Field(default=1, ge=1, description="Processes used to chunk documents (1 = in-process)")
+    chunking_docs_per_task: int = Field(default=64, ge=1, description="Documents sent to a chunking worker at a time")
     top_k: int = Field(default=1, description="Number of chunks to retrieve")
-    embedding_model: str = ""
-    collection_name: str = "knowledge_base"
\ No newline at end of file
+    retrieval_mode: Literal["dense", "sparse", "hybrid"] = Field(default="hybrid", description="Embedding search, BM25 keyword search, or both fused")
+    rrf_k: int = Field(default=60, ge=1, description="Reciprocal rank fusion constant")
+    rerank_strategy: Literal["none", "lexical", "mmr", "cross_encoder"] = Field(default="mmr", description="How over-fetched candidates are reranked")
+    rerank_overfetch: int = Field(default=3, ge=1, description="Candidates fetched per requested chunk when reranking")
+    rerank_budget_ms: float = Field(default=50.0, gt=0, description="Skip reranking when it is predicted to take longer than this")
+    query_cache_size: int = Field(default=1024, ge=0, description="Cached retrieval results (0 disables the cache)")
+    query_cache_ttl: float = Field(default=300.0, gt=0, description="Seconds a cached retrieval result stays valid")
+    query_cache_similarity: Optional[float] = Field(default=None, ge=0.0, le=1.0, description="Cosine similarity for near-duplicate cache hits (None = exact match only)")
+    embedding_model: str = "text-embedding-3-small"
+    embedding_provider: Literal["openai", "sentence_transformers"] = Field(default="openai", description="OpenAI API, or a local sentence-transformers model named by embedding_model")
+    embedding_batch_size: int = Field(default=100, ge=1, description="Chunks per embedding request")
+    embedding_workers: int = Field(default=4, ge=1, description="Concurrent embedding requests")
+    embedding_max_retries: int = Field(default=3, ge=1, description="Attempts per embedding batch")
+    embedding_hedge_after_ms: Optional[float] = Field(default=None, description="Send a duplicate embedding request if the first takes longer; None disables hedging")
+    embedding_rpm: Optional[int] = Field(default=None, ge=1, description="Embedding requests per minute budget; None disables limiting")
+    embedding_tpm: Optional[int] = Field(default=None, ge=1, description="Embedding tokens per minute budget")
+    rate_limit_path: Optional[str] = Field(default=None, description="sqlite file shared by workers for rate-limit budgets")
+    embedding_cache_dir: str = Field(default="./embedding_cache", description="Empty string disables the cache")
+    embedding_cache_size: int = Field(default=100_000, ge=1, description="Max cached embeddings")
+    collection_name: str = "knowledge_base"
+    persist_dir: str = "./chroma_db"
+    vector_backend: Literal["chroma", "numpy"] = Field(default="chroma", description="chromadb collection, or the native memory-mapped index")
+    vector_dtype: Literal["float32", "float16", "int8"] = Field(
+        default="float32",
+        description="How the numpy backend stores embeddings. float16 halves memory but exact scans run ~4-5x slower "
+        "than float32 (numpy widens it without SIMD); int8 quarters memory at about float32 speed",
+    )
+    vector_metric: Literal["cosine", "dot"] = Field(default="cosine", description="Similarity used by the numpy backend")
+    vector_dims: Optional[int] = Field(default=None, ge=1, description="Numpy backend: search only the first N embedding dimensions (Matryoshka truncation); None = all")
+    vector_rescore_factor: int = Field(default=0, ge=0, description="Numpy backend: keep full float32 vectors and rescore top_k x this many compressed-search candidates exactly; 0 = off")
+    ann_index: Literal["none", "ivf"] = Field(default="none", description="Approximate index for the numpy backend (none = exact search)")
+    ann_nlist: Optional[int] = Field(default=None, ge=1, description="IVF lists; None = sqrt of the corpus size")
+    ann_nprobe: int = Field(default=8, ge=1, description="IVF lists scanned per query: higher is slower with better recall")
+    ann_min_rows: int = Field(default=20_000, ge=1, description="Chunks before the IVF index is trained; smaller corpora are searched exactly")
+    shard_by: Literal["none", "field", "hash"] = Field(default="none", description="Partition the knowledge base by a metadata field (e.g. tenant), by chunk ID hash, or not at all")
+    shard_field: str = Field(default="tenant", description="Scalar metadata field naming a chunk's shard when shard_by is 'field'")
+    shard_count: int = Field(default=8, ge=1, description="Shards when shard_by is 'hash'")
+    shard_workers: int = Field(default=8, ge=1, description="Shards searched or written concurrently")
\ No newline at end of file
@@ -0,0 +1,159 @@
+# Inverted-file (IVF) approximate nearest-neighbour index for the numpy vector backend
+import os
+from array import array
+from pathlib import Path
+from typing import List, Optional
+
+import numpy as np
+
+_BLOCK_ROWS = 16384
+
+
+def nearest_centroids(vectors: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    """Index of the closest centroid (L2) for each vector"""
+    half_norms = 0.5 * np.einsum("ij,ij->i", centroids, centroids)
+    assignment = np.empty(len(vectors), dtype=np.int64)
+    for start in range(0, len(vectors), _BLOCK_ROWS):
+        block = vectors[start : start + _BLOCK_ROWS]
+        assignment[start : start + len(block)] = np.argmax(block @ centroids.T - half_norms, axis=1)
+    return assignment
+
+
+def kmeans(vectors: np.ndarray, k: int, iterations: int = 10, seed: int = 0) -> np.ndarray:
+    """Lloyd's k-means; clusters that empty out are re-seeded from random points"""
+    rng = np.random.default_rng(seed)
+    centroids = vectors[rng.choice(len(vectors), k, replace=False)].astype(np.float32)
+
+    for _ in range(iterations):
+        assignment = nearest_centroids(vectors, centroids)
+        order = np.argsort(assignment, kind="stable")
+        clusters, starts, counts = np.unique(assignment[order], return_index=True, return_counts=True)
+        sums = np.add.reduceat(vectors[order], starts, axis=0)
+        centroids[clusters] = sums / counts[:, None]
+
+        empty = np.setdiff1d(np.arange(k), clusters)
+        if len(empty):
+            centroids[empty] = vectors[rng.choice(len(vectors), len(empty), replace=False)]
+    return centroids
+
+
+class IVFIndex:
+    """
+    Inverted-file index: k-means centroids partition the stored rows, and a
+    query only scores the rows listed under its `nprobe` closest centroids.
+    More probes mean higher recall and higher latency.
+
+    Lists hold backend row numbers. Deleted rows are skipped by the backend
+    at query time and dropped when it compacts. The centroids are retrained
+    once the corpus has grown `retrain_growth` times past what they were
+    trained on.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        nlist: Optional[int] = None,
+        nprobe: int = 8,
+        min_rows: int = 20_000,
+        retrain_growth: float = 4.0,
+    ):
+        self.path = Path(path)
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.min_rows = min_rows
+        self.retrain_growth = retrain_growth
+        self.reload()
+
+    def reload(self):
+        """Load the saved index, or start untrained"""
+        self.centroids: Optional[np.ndarray] = None
+        self.trained_rows = 0
+        # Backend rows [0, rows) have been assigned to lists
+        self.rows = 0
+        self._lists: List[array] = []
+
+        if self.path.exists():
+            self._load()
+
+    @property
+    def trained(self) -> bool:
+        return self.centroids is not None
+
+    def needs_training(self, live_rows: int) -> bool:
+        if live_rows < self.min_rows:
+            return False
+        return not self.trained or live_rows >= self.retrain_growth * self.trained_rows
+
+    def sample_size(self, live_rows: int) -> int:
+        """Training points needed: enough per centroid without running k-means over everything"""
+        return min(live_rows, 64 * self._nlist_for(live_rows))
+
+    def _nlist_for(self, live_rows: int) -> int:
+        return self.nlist or max(16, int(np.sqrt(live_rows)))
+
+    def train(self, sample: np.ndarray, live_rows: int):
+        """Fit centroids on a sample; every row must be added again afterwards"""
+        nlist = min(self._nlist_for(live_rows), len(sample))
+        print(f"🧭 Training IVF index: {nlist} lists on {len(sample)} vectors...")
+        self._set_centroids(kmeans(np.asarray(sample, dtype=np.float32), nlist))
+        self.trained_rows = live_rows
+        self.rows = 0
+        self._lists = [array("I") for _ in range(nlist)]
+
+    def _set_centroids(self, centroids: np.ndarray):
+        self.centroids = centroids
+        self._half_norms = 0.5 * np.einsum("ij,ij->i", centroids, centroids)
+
+    def add(self, rows: np.ndarray, vectors: np.ndarray, covered: int):
+        """File rows under their closest centroid; `covered` is the new assigned-prefix length"""
+        if len(rows):
+            assignment = nearest_centroids(vectors, self.centroids)
+            order = np.argsort(assignment, kind="stable")
+            lists, starts = np.unique(assignment[order], return_index=True)
+            for list_id, group in zip(lists, np.split(rows[order].astype(np.uint32), starts[1:])):
+                self._lists[list_id].frombytes(group.tobytes())
+        self.rows = max(self.rows, covered)
+
+    def probe(self, query: np.ndarray, nprobe: Optional[int] = None) -> np.ndarray:
+        """Candidate rows for one query: everything under its nprobe closest centroids"""
+        scores = self.centroids @ query - self._half_norms
+        nprobe = min(nprobe or self.nprobe, len(self.centroids))
+        best = np.argpartition(-scores, nprobe - 1)[:nprobe]
+        return np.concatenate([np.frombuffer(self._lists[i], dtype=np.uint32) for i in best]).astype(np.int64)
+
+    def remap(self, mapping: np.ndarray):
+        """Renumber rows after compaction; mapping[old] is the new row, or -1 if dropped"""
+        for i, rows in enumerate(self._lists):
+            moved = mapping[np.frombuffer(rows, dtype=np.uint32)]
+            self._lists[i] = array("I", moved[moved >= 0].astype(np.uint32).tobytes())
+        self.rows = int((mapping[: self.rows] >= 0).sum())
+
+    def truncate(self, rows: int):
+        """Forget rows past `rows` (assigned by a writer that never saved them)"""
+        for i, listed in enumerate(self._lists):
+            kept = np.frombuffer(listed, dtype=np.uint32)
+            self._lists[i] = array("I", kept[kept < rows].tobytes())
+        self.rows = min(self.rows, rows)
+
+    def save(self):
+        """Persist to disk, replacing the previous file atomically"""
+        if not self.trained:
+            return
+        offsets = np.zeros(len(self._lists) + 1, dtype=np.uint64)
+        offsets[1:] = np.cumsum([len(rows) for rows in self._lists])
+        tmp_path = self.path.with_suffix(".tmp.npz")
+        np.savez(
+            tmp_path,
+            centroids=self.centroids,
+            offsets=offsets,
+            rows=np.concatenate([np.frombuffer(rows, dtype=np.uint32) for rows in self._lists]),
+            meta=np.array([self.trained_rows, self.rows], dtype=np.int64),
+        )
+        os.replace(tmp_path, self.path)
+
+    def _load(self):
+        data = np.load(self.path)
+        self._set_centroids(data["centroids"])
+        self.trained_rows, self.rows = (int(value) for value in data["meta"])
+        offsets, rows = data["offsets"], data["rows"]
+        self._lists = [array("I", rows[offsets[i]:offsets[i + 1]].tobytes()) for i in range(len(self.centroids))]
@@ -0,0 +1,79 @@
+# Recall vs latency of the IVF index against exact search on the numpy backend.
+# Run from src/:  python -m rag.ann_benchmark --rows 200000 --dim 384
+import argparse
+import shutil
+import tempfile
+from time import perf_counter
+from typing import List
+
+import numpy as np
+
+from .ann import IVFIndex
+from .backends import NumpyBackend
+
+
+def clustered_vectors(rows: int, dim: int, clusters: int, rng: np.random.Generator) -> np.ndarray:
+    """Synthetic embeddings: gaussian blobs, so there is structure for IVF to exploit"""
+    centers = rng.normal(size=(clusters, dim)).astype(np.float32)
+    return centers[rng.integers(0, clusters, rows)] + 0.5 * rng.normal(size=(rows, dim)).astype(np.float32)
+
+
+def timed_search(backend: NumpyBackend, queries: np.ndarray, top_k: int):
+    """Result ids and latency (ms) of one-query-at-a-time searches"""
+    ids: List[List[str]] = []
+    latencies = []
+    for query in queries:
+        start = perf_counter()
+        hits = backend.query([query], top_k)[0]
+        latencies.append((perf_counter() - start) * 1000)
+        ids.append([hit["id"] for hit in hits])
+    return ids, np.array(latencies)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Recall vs latency of the IVF index against exact search")
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--clusters", type=int, default=500)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--nlist", type=int, default=None)
+    parser.add_argument("--nprobe", default="1,2,4,8,16,32,64")
+    parser.add_argument("--dtype", default="float32", choices=["float32", "float16", "int8"])
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    path = tempfile.mkdtemp(prefix="ann_benchmark_")
+    try:
+        print(f"Building {args.rows} x {args.dim} {args.dtype} index in {path}...")
+        ann = IVFIndex(f"{path}/ivf.npz", nlist=args.nlist, min_rows=1)
+        backend = NumpyBackend(path, dtype=args.dtype, ann=ann)
+        vectors = clustered_vectors(args.rows, args.dim, args.clusters, rng)
+        for start in range(0, args.rows, 10_000):
+            batch = vectors[start : start + 10_000]
+            ids = [f"chunk_{i}" for i in range(start, start + len(batch))]
+            backend.upsert(ids, batch, [""] * len(batch), [{}] * len(batch))
+
+        start = perf_counter()
+        backend.save()
+        print(f"Trained {len(ann.centroids)} lists in {perf_counter() - start:.1f}s")
+
+        # Queries near (not at) stored vectors; ground truth from a backend without the index
+        queries = vectors[rng.integers(0, args.rows, args.queries)]
+        queries = queries + 0.2 * rng.normal(size=queries.shape).astype(np.float32)
+        exact, exact_ms = timed_search(NumpyBackend(path), queries, args.top_k)
+
+        print(f"\n{'nprobe':>8} {'recall@' + str(args.top_k):>10} {'p50 ms':>8} {'p95 ms':>8} {'scanned':>8}")
+        print(f"{'exact':>8} {1.0:>10.3f} {np.median(exact_ms):>8.2f} {np.percentile(exact_ms, 95):>8.2f} {1.0:>8.1%}")
+        for nprobe in (int(n) for n in args.nprobe.split(",")):
+            ann.nprobe = nprobe
+            found, ms = timed_search(backend, queries, args.top_k)
+            recall = np.mean([len(set(a) & set(e)) / len(e) for a, e in zip(found, exact)])
+            scanned = np.mean([len(ann.probe(q)) for q in backend._prepare(queries)[1]]) / args.rows
+            print(f"{nprobe:>8} {recall:>10.3f} {np.median(ms):>8.2f} {np.percentile(ms, 95):>8.2f} {scanned:>8.1%}")
+    finally:
+        shutil.rmtree(path, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
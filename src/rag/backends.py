@@ -0,0 +1,764 @@
+# Storage engines behind VectorStore: a chromadb collection, or a native memory-mapped matrix
+import json
+import os
+import shutil
+import threading
+from array import array
+from pathlib import Path
+from time import monotonic, sleep
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
+
+import numpy as np
+
+from .ann import IVFIndex
+from .filters import MetadataIndex, from_chroma_metadata, to_chroma, to_chroma_metadata, validate_where
+
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process writer lock
+    fcntl = None
+
+DTYPES = {"float32": np.float32, "float16": np.float16, "int8": np.int8}
+
+
+class VectorBackend:
+    """
+    Where chunk embeddings, texts and metadata are stored and searched.
+
+    VectorStore embeds, keeps the manifest and the keyword index; a backend
+    only stores. Chunks come back as dicts with "id", "text" and
+    "metadata" (plus "distance" from query, lower is closer).
+    """
+
+    def count(self) -> int:
+        raise NotImplementedError
+
+    def upsert(self, ids: List[str], embeddings: List[List[float]], documents: List[str], metadatas: List[Dict]):
+        raise NotImplementedError
+
+    def delete(self, ids: List[str]):
+        raise NotImplementedError
+
+    def get(self, ids: List[str]) -> List[Dict]:
+        """Chunks for the IDs that exist, in no particular order"""
+        raise NotImplementedError
+
+    def iter_documents(self, page_size: int = 1000) -> Iterator[Tuple[List[str], List[str]]]:
+        """Every stored (ids, documents), a page at a time"""
+        raise NotImplementedError
+
+    def query(
+        self, embeddings: List[List[float]], top_k: int, where: Optional[Dict[str, Any]] = None
+    ) -> List[List[Dict]]:
+        """Nearest chunks for each query embedding, closest first, among chunks matching `where`"""
+        raise NotImplementedError
+
+    def match_ids(self, ids: List[str], where: Dict[str, Any]) -> Set[str]:
+        """Those of `ids` whose chunks match a where filter (see filters.validate_where)"""
+        raise NotImplementedError
+
+    def save(self):
+        """Make writes durable; called after each ingest or delete"""
+
+    def clear(self):
+        raise NotImplementedError
+
+
+class ChromaBackend(VectorBackend):
+    """A chromadb persistent collection (embeddings are precomputed, so it has no embedding function)"""
+
+    def __init__(self, persist_dir: str = "./chroma_db", collection_name: str = "knowledge_base"):
+        import chromadb
+
+        self.client = chromadb.PersistentClient(path=persist_dir)
+        self.collection = self.client.get_or_create_collection(name=collection_name, embedding_function=None)
+
+    def count(self) -> int:
+        return self.collection.count()
+
+    def upsert(self, ids: List[str], embeddings: List[List[float]], documents: List[str], metadatas: List[Dict]):
+        self.collection.upsert(
+            ids=ids,
+            embeddings=embeddings,
+            documents=documents,
+            metadatas=[to_chroma_metadata(metadata) for metadata in metadatas],
+        )
+
+    def delete(self, ids: List[str]):
+        self.collection.delete(ids=ids)
+
+    def get(self, ids: List[str]) -> List[Dict]:
+        page = self.collection.get(ids=ids, include=["documents", "metadatas"])
+        return [
+            {
+                "text": page["documents"][i],
+                "metadata": from_chroma_metadata(page["metadatas"][i] if page["metadatas"] else None),
+                "id": chunk_id
+            }
+            for i, chunk_id in enumerate(page["ids"])
+        ]
+
+    def iter_documents(self, page_size: int = 1000) -> Iterator[Tuple[List[str], List[str]]]:
+        offset = 0
+        while True:
+            page = self.collection.get(include=["documents"], limit=page_size, offset=offset)
+            if not page["ids"]:
+                break
+            yield page["ids"], page["documents"]
+            offset += len(page["ids"])
+
+    def query(
+        self, embeddings: List[List[float]], top_k: int, where: Optional[Dict[str, Any]] = None
+    ) -> List[List[Dict]]:
+        results = self.collection.query(
+            query_embeddings=embeddings,
+            n_results=top_k,
+            where=to_chroma(where) if where else None
+        )
+
+        # Format results, one list per query
+        all_chunks = []
+        for q in range(len(embeddings)):
+            chunks = []
+            if results['documents'] and results['documents'][q]:
+                for i, doc in enumerate(results['documents'][q]):
+                    chunks.append({
+                        "text": doc,
+                        "metadata": from_chroma_metadata(results['metadatas'][q][i] if results['metadatas'] else None),
+                        "distance": results['distances'][q][i] if results['distances'] else 0,
+                        "id": results['ids'][q][i] if results['ids'] else f"chunk_{i}"
+                    })
+            all_chunks.append(chunks)
+        return all_chunks
+
+    def match_ids(self, ids: List[str], where: Dict[str, Any]) -> Set[str]:
+        if not ids:
+            return set()
+        return set(self.collection.get(ids=ids, where=to_chroma(where), include=[])["ids"])
+
+    def clear(self):
+        name = self.collection.name
+        self.client.delete_collection(name)
+        self.collection = self.client.get_or_create_collection(name=name, embedding_function=None)
+
+
+class _Column:
+    """Append-only column of strings: one UTF-8 blob file plus row offsets"""
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.offsets_path = path.with_suffix(".offsets.npy")
+        self._lock = threading.Lock()
+        self._offsets = array("Q", [0])
+        if self.offsets_path.exists():
+            self._offsets = array("Q", np.load(self.offsets_path).tobytes())
+        self._file = open(path, "a+b")
+
+    def __len__(self) -> int:
+        return len(self._offsets) - 1
+
+    def truncate(self, rows: int):
+        """Forget rows past `rows` (written by an interrupted ingest that never saved)"""
+        del self._offsets[rows + 1:]
+
+    def append(self, values: List[str]):
+        data = [value.encode("utf-8") for value in values]
+        with self._lock:
+            end = self._offsets[-1]
+            self._file.seek(0, os.SEEK_END)
+            if self._file.tell() != end:
+                self._file.truncate(end)
+            self._file.write(b"".join(data))
+            self._file.flush()
+            for item in data:
+                end += len(item)
+                self._offsets.append(end)
+
+    def get(self, row: int) -> str:
+        start, end = self._offsets[row], self._offsets[row + 1]
+        with self._lock:
+            self._file.seek(start)
+            return self._file.read(end - start).decode("utf-8")
+
+    def all(self) -> List[str]:
+        with self._lock:
+            self._file.seek(0)
+            blob = self._file.read(self._offsets[-1])
+        offsets = self._offsets
+        return [blob[offsets[i]:offsets[i + 1]].decode("utf-8") for i in range(len(self))]
+
+    def save(self):
+        tmp_path = self.offsets_path.with_suffix(".tmp.npy")
+        np.save(tmp_path, np.frombuffer(self._offsets, dtype=np.uint64))
+        os.replace(tmp_path, self.offsets_path)
+
+    def rewrite(self, rows: np.ndarray):
+        """Keep only `rows`, in order. Written as a new file, so other processes' handles stay valid"""
+        with self._lock:
+            self._file.seek(0)
+            blob = self._file.read(self._offsets[-1])
+            offsets = array("Q", [0])
+            tmp_path = self.path.with_name(self.path.name + ".tmp")
+            with open(tmp_path, "wb") as f:
+                for row in rows:
+                    item = blob[self._offsets[row]:self._offsets[row + 1]]
+                    f.write(item)
+                    offsets.append(offsets[-1] + len(item))
+            self._file.close()
+            os.replace(tmp_path, self.path)
+            self._file = open(self.path, "a+b")
+            self._offsets = offsets
+        self.save()
+
+    def close(self):
+        self._file.close()
+
+
+class NumpyBackend(VectorBackend):
+    """
+    Native store: embeddings are rows of one memory-mapped matrix (float32,
+    or float16 / int8 with a per-row scale) and ids, texts and metadata are
+    append-only columns beside it. Search is exact (one matrix product per
+    block of rows and an argpartition top-k) until an IVF index is given
+    and the corpus reaches its `min_rows`; then only probed lists are scored.
+
+    With `dims` set, only the first `dims` dimensions are searched
+    (Matryoshka truncation, as text-embedding-3 models support). With
+    `rescore_factor` set, full float32 vectors are kept in a side file
+    and top_k * rescore_factor candidates are rescored exactly from it,
+    so the compact matrix is all a search scans.
+
+    float16 saves memory, not time: numpy widens it to float32 with no SIMD
+    help, so an exact float16 scan runs several times slower than float32
+    (int8 widens cheaply and stays close). Pair it with `dims` or an IVF
+    index, which shrink what is scanned, when latency matters.
+
+    Files are mapped rather than read, so opening is instant and worker
+    processes share one copy through the OS page cache. Updates append rows
+    and tombstone the old ones; other processes pick up saved changes when
+    the header file changes. Writers take an exclusive file lock from their
+    first upsert or delete until save(), and first load whatever another
+    process saved, so two writers never overwrite each other's rows.
+    """
+    GROW_BY = 4096
+    BLOCK_ROWS = 65536
+    DECODE_BYTES = 512 * 1024
+    WRITE_LOCK_TIMEOUT = 300.0
+
+    def __init__(
+        self,
+        path: str,
+        dtype: str = "float32",
+        metric: str = "cosine",
+        ann: Optional[IVFIndex] = None,
+        dims: Optional[int] = None,
+        rescore_factor: int = 0,
+    ):
+        if dtype not in DTYPES:
+            raise ValueError(f"Unknown vector dtype '{dtype}' (expected one of {', '.join(DTYPES)})")
+        if metric not in ("cosine", "dot"):
+            raise ValueError(f"Unknown metric '{metric}' (expected 'cosine' or 'dot')")
+        if rescore_factor and dtype == "float32" and not dims:
+            print("⚠️  rescore_factor has nothing to rescore: full-size float32 vectors are already exact")
+
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.header_path = self.path / "index.json"
+        self._requested = (dtype, metric, dims, rescore_factor > 0)
+        self.ann = ann
+        self.rescore_factor = rescore_factor
+
+        self._lock = threading.RLock()
+        self._columns: Dict[str, _Column] = {}
+        self._epoch = 0
+        # Held from the first write until save(); the gate keeps this process's threads to one acquirer
+        self._write_gate = threading.Lock()
+        self._write_lock = None
+        self._load()
+
+    def _load(self):
+        header = json.loads(self.header_path.read_text()) if self.header_path.exists() else {}
+        layout = self._requested
+        if header:
+            layout = (header["dtype"], header["metric"], header.get("dims"), header.get("rescore", False))
+            if layout != self._requested:
+                print(f"⚠️  Vector index is stored as {layout[0]}/{layout[1]} (dims={layout[2]}, rescore={layout[3]}); clear it to change")
+        self.dtype, self.metric, self.dims, self.rescore = layout
+
+        # Searched dimensions, and dimensions of the embeddings as given
+        self.dim: Optional[int] = header.get("dim")
+        self.full_dim: Optional[int] = header.get("full_dim", self.dim)
+        self._rows = header.get("rows", 0)
+
+        for column in self._columns.values():
+            column.close()
+        self._columns = {name: _Column(self.path / f"{name}.bin") for name in ("ids", "documents", "metadatas")}
+        for column in self._columns.values():
+            column.truncate(self._rows)
+
+        alive_path = self.path / "alive.u8"
+        self._alive = bytearray(alive_path.read_bytes()[: self._rows]) if alive_path.exists() else bytearray()
+        self._ids = self._columns["ids"].all()
+        self._row_of = {chunk_id: row for row, chunk_id in enumerate(self._ids) if self._alive[row]}
+        # Built on the first filtered search, then kept up to date
+        self._metadata_index: Optional[MetadataIndex] = None
+
+        self._vectors: Optional[np.memmap] = None
+        self._scales: Optional[np.memmap] = None
+        self._full: Optional[np.memmap] = None
+        if self.dim:
+            self._open_vectors()
+
+        if self.ann is not None:
+            self.ann.reload()
+            if self.ann.trained:
+                self.ann.truncate(self._rows)
+                self._index_rows(self.ann.rows, self._rows)
+
+        self._dirty = False
+        self._header_stamp = self._stamp()
+        self._epoch += 1
+
+    def _stamp(self) -> Tuple[int, int]:
+        # The header is replaced, never edited, so a new inode means a new save
+        if not self.header_path.exists():
+            return (0, 0)
+        stat = self.header_path.stat()
+        return (stat.st_ino, stat.st_mtime_ns)
+
+    def _refresh(self):
+        """Pick up rows another process saved since we loaded (our own unsaved writes win)"""
+        if not self._dirty and self._stamp() != self._header_stamp:
+            self._load()
+
+    def _begin_write(self):
+        """Make this process the writer until the next save(), on top of the latest saved state"""
+        with self._write_gate:
+            if self._write_lock is not None:
+                return
+            # Waits outside self._lock, so searches in this process carry on meanwhile
+            write_lock = open(self.path.with_name(self.path.name + ".lock"), "a+b")
+            deadline = monotonic() + self.WRITE_LOCK_TIMEOUT
+            while fcntl is not None:
+                try:
+                    fcntl.flock(write_lock.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    break
+                except BlockingIOError:
+                    if monotonic() > deadline:
+                        write_lock.close()
+                        raise TimeoutError(f"Another process has been writing {self.path} for over {self.WRITE_LOCK_TIMEOUT:g}s")
+                    sleep(0.1)
+
+            with self._lock:
+                self._write_lock = write_lock
+                # Appending from a stale row count would truncate the other writer's saved rows
+                if self._stamp() != self._header_stamp:
+                    self._load()
+
+    def _end_write(self):
+        if self._write_lock is not None:
+            if fcntl is not None:
+                fcntl.flock(self._write_lock.fileno(), fcntl.LOCK_UN)
+            self._write_lock.close()
+            self._write_lock = None
+
+    def _matrices(self) -> List[Tuple[str, str, type, Optional[int]]]:
+        """(attribute, file name, dtype, columns) of every per-row matrix"""
+        matrices = [("_vectors", f"vectors.{self.dtype}", DTYPES[self.dtype], self.dim)]
+        if self.dtype == "int8":
+            matrices.append(("_scales", "scales.f32", np.float32, None))
+        if self.rescore:
+            matrices.append(("_full", "full.f32", np.float32, self.full_dim))
+        return matrices
+
+    def _open_vectors(self, min_rows: int = 0):
+        """(Re)map the matrices, growing their files to hold at least `min_rows` rows"""
+        path = self.path / f"vectors.{self.dtype}"
+        row_bytes = self.dim * np.dtype(DTYPES[self.dtype]).itemsize
+        capacity = path.stat().st_size // row_bytes if path.exists() else 0
+        if capacity < max(min_rows, 1):
+            capacity = max(min_rows, capacity + max(self.GROW_BY, capacity // 2))
+
+        for attr, name, dtype, columns in self._matrices():
+            setattr(self, attr, None)
+            matrix_path = self.path / name
+            size = capacity * np.dtype(dtype).itemsize * (columns or 1)
+            if not matrix_path.exists() or matrix_path.stat().st_size < size:
+                with open(matrix_path, "ab") as f:
+                    f.truncate(size)
+            shape = (capacity, columns) if columns else (capacity,)
+            setattr(self, attr, np.memmap(matrix_path, dtype=dtype, mode="r+", shape=shape))
+
+    def _normalize(self, vectors: np.ndarray) -> np.ndarray:
+        if self.metric == "cosine":
+            vectors = vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        return vectors
+
+    def _prepare(self, vectors: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Full vectors, and the (truncated) vectors that are searched"""
+        full = self._normalize(vectors)
+        return full, self._normalize(full[:, : self.dims]) if self.dims else full
+
+    def _encode(self, vectors: np.ndarray) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+        """Rows as stored, and their int8 scales"""
+        if self.dtype == "int8":
+            scales = np.maximum(np.abs(vectors).max(axis=1), 1e-12) / 127
+            return np.round(vectors / scales[:, None]).astype(np.int8), scales.astype(np.float32)
+        return vectors.astype(DTYPES[self.dtype]), None
+
+    def count(self) -> int:
+        with self._lock:
+            self._refresh()
+            return len(self._row_of)
+
+    def upsert(self, ids: List[str], embeddings: List[List[float]], documents: List[str], metadatas: List[Dict]):
+        if not ids:
+            return
+        full, vectors = self._prepare(np.asarray(embeddings, dtype=np.float32))
+
+        self._begin_write()
+        with self._lock:
+            try:
+                if self.full_dim is None:
+                    if self.dims and self.dims > full.shape[1]:
+                        raise ValueError(f"dims={self.dims} is more than the embedding dimension ({full.shape[1]})")
+                    self.full_dim, self.dim = full.shape[1], vectors.shape[1]
+                elif full.shape[1] != self.full_dim:
+                    raise ValueError(f"Embedding dimension {full.shape[1]} doesn't match the index ({self.full_dim})")
+            except ValueError:
+                # Nothing was written: don't keep other writers out until a save() that may never come
+                if not self._dirty:
+                    self._end_write()
+                raise
+
+            start, end = self._rows, self._rows + len(ids)
+            if self._vectors is None or end > len(self._vectors):
+                self._open_vectors(end)
+
+            encoded, scales = self._encode(vectors)
+            self._vectors[start:end] = encoded
+            if scales is not None:
+                self._scales[start:end] = scales
+            if self.rescore:
+                self._full[start:end] = full
+
+            self._columns["ids"].append(ids)
+            self._columns["documents"].append(documents)
+            self._columns["metadatas"].append([json.dumps(metadata or {}) for metadata in metadatas])
+            self._ids.extend(ids)
+            if self._metadata_index is not None:
+                self._metadata_index.add(start, metadatas)
+            if self.ann is not None and self.ann.trained:
+                self.ann.add(np.arange(start, end), vectors, covered=end)
+
+            # Replaced chunks (including repeats within this batch) are tombstoned
+            for i, chunk_id in enumerate(ids):
+                self._remove(chunk_id)
+                self._row_of[chunk_id] = start + i
+            self._alive.extend(b"\x01" * len(ids))
+            self._rows = end
+            self._dirty = True
+
+    def _remove(self, chunk_id: str):
+        row = self._row_of.pop(chunk_id, None)
+        if row is not None:
+            self._alive[row] = 0
+
+    def delete(self, ids: List[str]):
+        if not ids:
+            return
+        self._begin_write()
+        with self._lock:
+            for chunk_id in ids:
+                self._remove(chunk_id)
+            self._dirty = True
+
+    def _chunk(self, row: int) -> Dict:
+        return {
+            "text": self._columns["documents"].get(row),
+            "metadata": json.loads(self._columns["metadatas"].get(row)),
+            "id": self._ids[row]
+        }
+
+    def get(self, ids: List[str]) -> List[Dict]:
+        with self._lock:
+            self._refresh()
+            return [self._chunk(self._row_of[chunk_id]) for chunk_id in ids if chunk_id in self._row_of]
+
+    def iter_documents(self, page_size: int = 1000) -> Iterator[Tuple[List[str], List[str]]]:
+        with self._lock:
+            self._refresh()
+            ids = list(self._row_of)
+        for i in range(0, len(ids), page_size):
+            page = self.get(ids[i : i + page_size])
+            yield [chunk["id"] for chunk in page], [chunk["text"] for chunk in page]
+
+    def _filter_mask(self, where: Dict[str, Any], rows: int) -> np.ndarray:
+        if self._metadata_index is None:
+            self._metadata_index = MetadataIndex()
+            self._metadata_index.add(0, [json.loads(metadata) for metadata in self._columns["metadatas"].all()])
+        return self._metadata_index.mask(where, rows)
+
+    def match_ids(self, ids: List[str], where: Dict[str, Any]) -> Set[str]:
+        validate_where(where)
+        with self._lock:
+            self._refresh()
+            rows = np.array([self._row_of[chunk_id] for chunk_id in ids if chunk_id in self._row_of], dtype=np.int64)
+            if not len(rows):
+                return set()
+            return {self._ids[row] for row in rows[self._filter_mask(where, self._rows)[rows]]}
+
+    def query(
+        self, embeddings: List[List[float]], top_k: int, where: Optional[Dict[str, Any]] = None
+    ) -> List[List[Dict]]:
+        if where:
+            validate_where(where)
+        full_queries, queries = self._prepare(np.asarray(embeddings, dtype=np.float32))
+        # Approximate candidates to rescore exactly, when full vectors are kept
+        n_candidates = top_k * max(self.rescore_factor, 1) if self.rescore else top_k
+
+        # Score a snapshot outside the lock, so concurrent searches overlap (numpy drops the GIL)
+        with self._lock:
+            self._refresh()
+            if not self._row_of or top_k <= 0:
+                return [[] for _ in embeddings]
+            epoch, rows = self._epoch, self._rows
+            vectors, scales, full = self._vectors, self._scales, self._full
+            allowed = np.frombuffer(bytes(self._alive[:rows]), dtype=np.uint8).astype(bool)
+            if where:
+                # Filter first: only rows that pass are ever scored
+                allowed &= self._filter_mask(where, rows)
+            n_allowed = int(allowed.sum())
+
+            candidates = filtered = None
+            if self.ann is not None and self.ann.trained and n_allowed > self.ann.min_rows:
+                candidates = [self.ann.probe(query) for query in queries]
+            elif n_allowed < rows // 2:
+                # Gather the rows that pass rather than scoring everything and masking
+                filtered = np.flatnonzero(allowed)
+
+        # (rows, scores) per query, best first
+        hits = []
+        if candidates is not None:
+            for query, probed in zip(queries, candidates):
+                probed = np.sort(probed[allowed[probed]])
+                scores = self._decode(vectors, scales, probed) @ query
+                best = self._top_k(scores, n_candidates)
+                hits.append((probed[best], scores[best]))
+        else:
+            scores = self._scores(queries, vectors, scales, rows if filtered is None else filtered)
+            if filtered is None and n_allowed < rows:
+                scores[:, ~allowed] = -np.inf
+            for q in range(len(queries)):
+                best = self._top_k(scores[q], n_candidates)
+                hits.append((best if filtered is None else filtered[best], scores[q, best]))
+
+        if self.rescore:
+            hits = [
+                self._rescore(full, query, rows_q, scores_q, top_k)
+                for query, (rows_q, scores_q) in zip(full_queries, hits)
+            ]
+
+        with self._lock:
+            if self._epoch != epoch:
+                # Rows were renumbered (compaction or reload) while we scored
+                return self.query(embeddings, top_k, where)
+
+            return [
+                [
+                    {**self._chunk(row), "distance": self._distance(float(score))}
+                    for row, score in zip(best_rows, best_scores)
+                    if self._alive[row] and score > -np.inf
+                ]
+                for best_rows, best_scores in hits
+            ]
+
+    @staticmethod
+    def _top_k(scores: np.ndarray, k: int) -> np.ndarray:
+        k = min(k, len(scores))
+        if not k:
+            return np.zeros(0, dtype=np.int64)
+        best = np.argpartition(-scores, k - 1)[:k]
+        return best[np.argsort(-scores[best])]
+
+    def _rescore(
+        self, full: np.memmap, query: np.ndarray, rows: np.ndarray, scores: np.ndarray, top_k: int
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Exact scores from the full vectors for the approximate candidates; only these rows are read"""
+        rows = np.sort(rows[scores > -np.inf])
+        exact = np.asarray(full[rows]) @ query
+        best = self._top_k(exact, top_k)
+        return rows[best], exact[best]
+
+    @staticmethod
+    def _decode(vectors: np.memmap, scales: Optional[np.memmap], rows) -> np.ndarray:
+        """Stored rows (a slice or row numbers) back as float32"""
+        block = np.asarray(vectors[rows], dtype=np.float32)
+        if scales is not None:
+            block = block * scales[rows][:, None]
+        return block
+
+    def _scores(self, queries: np.ndarray, vectors: np.memmap, scales: Optional[np.memmap], rows) -> np.ndarray:
+        """Similarity of each query to rows [0, rows) or to the listed rows, a block at a time to bound memory"""
+        count = rows if isinstance(rows, int) else len(rows)
+        scores = np.empty((len(queries), count), dtype=np.float32)
+        # float16 / int8 rows are widened a cache-sized block at a time, so the float32 copy never reaches RAM.
+        # For float16 that cast, not the product, is most of the time (see the class docstring)
+        block_rows = self.BLOCK_ROWS
+        if vectors.dtype != np.float32:
+            block_rows = max(64, self.DECODE_BYTES // (4 * vectors.shape[1]))
+        for start in range(0, count, block_rows):
+            end = min(start + block_rows, count)
+            index = slice(start, end) if isinstance(rows, int) else rows[start:end]
+            scores[:, start:end] = queries @ np.asarray(vectors[index], dtype=np.float32).T
+            if scales is not None:
+                # A row's scale factors out of its dot products
+                scores[:, start:end] *= scales[index]
+        return scores
+
+    def _index_rows(self, start: int, end: int):
+        """Add live rows [start, end) to the IVF lists"""
+        alive = np.frombuffer(bytes(self._alive[:end]), dtype=np.uint8)
+        for block_start in range(start, end, self.BLOCK_ROWS):
+            block_end = min(block_start + self.BLOCK_ROWS, end)
+            rows = block_start + np.flatnonzero(alive[block_start:block_end])
+            self.ann.add(rows, self._decode(self._vectors, self._scales, rows), covered=block_end)
+
+    def _train_ann(self):
+        live = np.flatnonzero(np.frombuffer(bytes(self._alive[: self._rows]), dtype=np.uint8))
+        rng = np.random.default_rng(0)
+        sample = np.sort(rng.choice(live, self.ann.sample_size(len(live)), replace=False))
+        self.ann.train(self._decode(self._vectors, self._scales, sample), len(live))
+        self._index_rows(0, self._rows)
+
+    def _distance(self, score: float) -> float:
+        return 1.0 - score if self.metric == "cosine" else -score
+
+    def save(self):
+        with self._lock:
+            if not self._dirty:
+                self._end_write()
+                return
+            if self._rows - len(self._row_of) > max(1000, self._rows // 4):
+                self._compact()
+            if self.ann is not None:
+                if self.ann.needs_training(len(self._row_of)):
+                    self._train_ann()
+                self.ann.save()
+
+            if self._vectors is not None:
+                for attr, _, _, _ in self._matrices():
+                    getattr(self, attr).flush()
+            for column in self._columns.values():
+                column.save()
+
+            # Header last: it is what tells readers there is something new
+            self._write(self.path / "alive.u8", bytes(self._alive))
+            header = {
+                "dim": self.dim,
+                "full_dim": self.full_dim,
+                "dims": self.dims,
+                "dtype": self.dtype,
+                "metric": self.metric,
+                "rescore": self.rescore,
+                "rows": self._rows,
+            }
+            self._write(self.header_path, json.dumps(header).encode("utf-8"))
+            self._header_stamp = self._stamp()
+            self._dirty = False
+            self._end_write()
+
+    @staticmethod
+    def _write(path: Path, data: bytes):
+        tmp_path = path.with_name(path.name + ".tmp")
+        tmp_path.write_bytes(data)
+        os.replace(tmp_path, path)
+
+    def _compact(self):
+        """Rewrite every file without tombstoned rows (as new files, so readers' maps stay valid)"""
+        live = np.flatnonzero(np.frombuffer(bytes(self._alive[: self._rows]), dtype=np.uint8))
+
+        if self._vectors is not None:
+            for attr, name, _, _ in self._matrices():
+                path, source = self.path / name, getattr(self, attr)
+                tmp_path = path.with_name(path.name + ".tmp")
+                copy = np.memmap(tmp_path, dtype=source.dtype, mode="w+", shape=(max(len(live), 1),) + source.shape[1:])
+                for start in range(0, len(live), self.BLOCK_ROWS):
+                    copy[start : start + self.BLOCK_ROWS] = source[live[start : start + self.BLOCK_ROWS]]
+                copy.flush()
+                del copy
+                os.replace(tmp_path, path)
+
+        for column in self._columns.values():
+            column.rewrite(live)
+
+        if self.ann is not None and self.ann.trained:
+            mapping = np.full(self._rows, -1, dtype=np.int64)
+            mapping[live] = np.arange(len(live))
+            self.ann.remap(mapping)
+
+        self._rows = len(live)
+        self._alive = bytearray(b"\x01" * self._rows)
+        self._ids = self._columns["ids"].all()
+        self._row_of = {chunk_id: row for row, chunk_id in enumerate(self._ids)}
+        self._metadata_index = None
+        if self._vectors is not None:
+            self._open_vectors()
+        self._epoch += 1
+
+    def clear(self):
+        self._begin_write()
+        with self._lock:
+            for column in self._columns.values():
+                column.close()
+            self._columns = {}
+            self._vectors = self._scales = self._full = None
+            shutil.rmtree(self.path, ignore_errors=True)
+            self.path.mkdir(parents=True, exist_ok=True)
+            self._load()
+            self._end_write()
+
+
+def make_backend(config) -> VectorBackend:
+    """Build the storage engine selected by RagConfig.vector_backend, sharded per RagConfig.shard_by"""
+    if config.vector_backend == "chroma":
+        numpy_only = ("vector_dtype", "vector_metric", "vector_dims", "vector_rescore_factor", "ann_index")
+        ignored = [
+            f"{name}={getattr(config, name)!r}" for name in numpy_only
+            if getattr(config, name) != type(config).model_fields[name].default
+        ]
+        if ignored:
+            print(f"⚠️  Ignored by vector_backend='chroma' (numpy backend only): {', '.join(ignored)}")
+
+    def open_backend(path: Path) -> VectorBackend:
+        if config.vector_backend == "chroma":
+            return ChromaBackend(str(path), config.collection_name)
+        ann = None
+        if config.ann_index == "ivf":
+            ann = IVFIndex(
+                str(path / "ivf.npz"),
+                nlist=config.ann_nlist,
+                nprobe=config.ann_nprobe,
+                min_rows=config.ann_min_rows,
+            )
+        return NumpyBackend(
+            str(path),
+            dtype=config.vector_dtype,
+            metric=config.vector_metric,
+            ann=ann,
+            dims=config.vector_dims,
+            rescore_factor=config.vector_rescore_factor,
+        )
+
+    if config.shard_by != "none":
+        from .sharding import ShardedBackend
+        return ShardedBackend(
+            str(Path(config.persist_dir) / f"{config.collection_name}.shards"),
+            open_backend,
+            field=config.shard_field if config.shard_by == "field" else None,
+            shard_count=config.shard_count,
+            max_workers=config.shard_workers,
+        )
+    if config.vector_backend == "numpy":
+        return open_backend(Path(config.persist_dir) / f"{config.collection_name}.vectors")
+    return open_backend(Path(config.persist_dir))
@@ -0,0 +1,105 @@
+# Footprint, recall and latency of compressed vector storage on the numpy backend.
+# Run from src/:  python -m rag.compression_benchmark --rows 100000 --dim 1536
+# or with real embeddings:  python -m rag.compression_benchmark --embeddings vectors.npy
+import argparse
+import shutil
+import tempfile
+from itertools import product
+from pathlib import Path
+from typing import List, Optional
+
+import numpy as np
+
+from .ann_benchmark import timed_search
+from .backends import NumpyBackend
+
+
+def matryoshka_vectors(rows: int, dim: int, clusters: int, rng: np.random.Generator) -> np.ndarray:
+    """
+    Synthetic embeddings whose variance decays along the dimensions, as in
+    Matryoshka-trained models, so that leading dimensions carry the most signal
+    """
+    decay = (1.0 / np.sqrt(1 + np.arange(dim) / 16)).astype(np.float32)
+    centers = rng.normal(size=(clusters, dim)).astype(np.float32) * decay
+    noise = 0.5 * rng.normal(size=(rows, dim)).astype(np.float32) * decay
+    return centers[rng.integers(0, clusters, rows)] + noise
+
+
+def load_embeddings(path: str, dim: Optional[int]) -> np.ndarray:
+    """A .npy matrix, or a raw float32 file (e.g. the embedding cache) with --dim"""
+    if path.endswith(".npy"):
+        return np.load(path, mmap_mode="r").astype(np.float32)
+    if not dim:
+        raise SystemExit("--dim is required for raw float32 embeddings")
+    return np.fromfile(path, dtype=np.float32).reshape(-1, dim)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Footprint, recall and latency of compressed vector storage")
+    parser.add_argument("--embeddings", default=None, help=".npy matrix, or raw float32 file with --dim")
+    parser.add_argument("--rows", type=int, default=50_000)
+    parser.add_argument("--dim", type=int, default=None, help="Embedding size (synthetic default: 1536)")
+    parser.add_argument("--clusters", type=int, default=500)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--dtypes", default="float32,float16,int8")
+    parser.add_argument("--dims", default="full,512,256", help="Searched dimensions; 'full' = no truncation")
+    parser.add_argument("--rescore", default="0,4", help="Rescore factors; 0 = no rescoring")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    if args.embeddings:
+        vectors = load_embeddings(args.embeddings, args.dim)[: args.rows]
+        queries = vectors[rng.integers(0, len(vectors), args.queries)]
+        queries = queries + 0.05 * queries.std() * rng.normal(size=queries.shape).astype(np.float32)
+    else:
+        vectors = matryoshka_vectors(args.rows, args.dim or 1536, args.clusters, rng)
+        queries = matryoshka_vectors(args.queries, args.dim or 1536, args.clusters, rng)
+        queries = vectors[rng.integers(0, args.rows, args.queries)] + 0.3 * (queries - queries.mean(axis=0))
+    rows, dim = vectors.shape
+
+    root = Path(tempfile.mkdtemp(prefix="compression_benchmark_"))
+    try:
+        print(f"{rows} x {dim} embeddings, {args.queries} queries, top_k={args.top_k}")
+        print(
+            f"\n{'dtype':>8} {'dims':>5} {'rescore':>7} {'scan B':>7} {'disk B':>7} "
+            f"{'smaller':>7} {'recall@' + str(args.top_k):>9} {'p50 ms':>7} {'speedup':>7}"
+        )
+
+        exact: List[List[str]] = []
+        baseline_ms = baseline_bytes = 0.0
+        settings = [("float32", None, 0)] + [
+            (dtype, None if dims == "full" else int(dims), int(factor))
+            for dtype, dims, factor in product(args.dtypes.split(","), args.dims.split(","), args.rescore.split(","))
+        ]
+        for n, (dtype, dims, factor) in enumerate(settings):
+            if n and (dtype, dims, factor) == settings[0]:
+                continue
+            path = root / f"{dtype}-{dims}-{factor}"
+            backend = NumpyBackend(str(path), dtype=dtype, dims=dims, rescore_factor=factor)
+            for start in range(0, rows, 10_000):
+                batch = vectors[start : start + 10_000]
+                backend.upsert([f"chunk_{i}" for i in range(start, start + len(batch))], batch, [""] * len(batch), [{}] * len(batch))
+            backend.save()
+
+            found, ms = timed_search(backend, queries, args.top_k)
+            if not exact:
+                # Uncompressed float32 exact search is the reference
+                exact, baseline_ms = found, np.median(ms)
+            recall = np.mean([len(set(a) & set(e)) / len(e) for a, e in zip(found, exact)])
+
+            row_bytes = backend.dim * np.dtype(backend._vectors.dtype).itemsize + (4 if dtype == "int8" else 0)
+            disk_bytes = row_bytes + (4 * dim if backend.rescore else 0)
+            baseline_bytes = baseline_bytes or row_bytes
+            print(
+                f"{dtype:>8} {backend.dim:>5} {factor or '-':>7} {row_bytes:>7} {disk_bytes:>7} "
+                f"{baseline_bytes / row_bytes:>6.1f}x {recall:>9.3f} {np.median(ms):>7.2f} {baseline_ms / np.median(ms):>6.1f}x"
+            )
+            shutil.rmtree(path, ignore_errors=True)
+        print("\nscan B: bytes per chunk every search reads (RAM to keep hot); disk B adds full vectors kept for rescoring")
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
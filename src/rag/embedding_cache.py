@@ -0,0 +1,222 @@
+# Persistent, content-addressed embedding cache
+import hashlib
+import re
+import sqlite3
+import threading
+import unicodedata
+from pathlib import Path
+from time import time
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from .ingest import EmbeddingFunction
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_text(text: str) -> str:
+    """Normalize text so trivially different copies share a cache entry"""
+    return _WHITESPACE.sub(" ", unicodedata.normalize("NFC", text)).strip()
+
+
+def text_hash(text: str) -> str:
+    return hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    On-disk embedding cache for one embedding model.
+
+    Vectors live as float32 rows in a memory-mapped file and a small sqlite
+    index maps the text hash to its row. Once `max_entries` is reached the
+    least recently used row is overwritten. Several processes can share
+    one cache: rows are allocated under the sqlite write lock.
+    """
+    GROW_BY = 1024
+
+    def __init__(self, cache_dir: str, model_name: str, max_entries: int = 100_000):
+        self.model_name = model_name
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+
+        cache_dir = Path(cache_dir)
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        safe_name = re.sub(r"[^A-Za-z0-9_.-]", "_", model_name) or "default"
+        self.vectors_path = cache_dir / f"{safe_name}.f32"
+
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(cache_dir / f"{safe_name}.sqlite", check_same_thread=False, timeout=30)
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+            CREATE TABLE IF NOT EXISTS entries (
+                hash TEXT PRIMARY KEY,
+                slot INTEGER NOT NULL,
+                last_used REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS entries_last_used ON entries (last_used);
+        """)
+
+        self._count = self._db.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+        row = self._db.execute("SELECT value FROM meta WHERE key = 'dim'").fetchone()
+        self.dim: Optional[int] = int(row[0]) if row else None
+        self._vectors: Optional[np.memmap] = None
+        if self.dim is not None and self.vectors_path.exists():
+            self._open_vectors(min_rows=0)
+
+    def __len__(self) -> int:
+        return self._count
+
+    def _open_vectors(self, min_rows: int = 1):
+        """
+        (Re)map the vector file at its current size, growing it to hold at
+        least `min_rows` rows. Only grow while holding the write lock.
+        """
+        row_bytes = self.dim * 4
+        size = self.vectors_path.stat().st_size if self.vectors_path.exists() else 0
+        rows = size // row_bytes
+
+        if rows < min_rows:
+            rows = min(max(min_rows, rows + self.GROW_BY), self.max_entries)
+            if self._vectors is not None:
+                self._vectors.flush()
+                self._vectors = None
+            with open(self.vectors_path, "ab") as f:
+                f.truncate(rows * row_bytes)
+
+        if rows:
+            self._vectors = np.memmap(self.vectors_path, dtype=np.float32, mode="r+", shape=(rows, self.dim))
+
+    def get_many(self, texts: List[str]) -> List[Optional[List[float]]]:
+        """Return cached vectors (or None) for each text"""
+        hashes = [text_hash(t) for t in texts]
+
+        with self._lock:
+            slots = self._lookup(hashes)
+            now = time()
+            self._db.executemany(
+                "UPDATE entries SET last_used = ? WHERE hash = ?",
+                [(now, h) for h in slots]
+            )
+            self._db.commit()
+
+            results = []
+            for h in hashes:
+                if h in slots:
+                    results.append(self._vectors[slots[h]].tolist())
+                    self.hits += 1
+                else:
+                    results.append(None)
+                    self.misses += 1
+
+        return results
+
+    def put_many(self, texts: List[str], embeddings: List[List[float]]):
+        """Store vectors, evicting least recently used rows when full"""
+        if not texts:
+            return
+
+        with self._lock:
+            # Hold the database write lock from choosing rows to committing them, so
+            # another process sharing the cache can't hand the same row to another text
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                if self.dim is None:
+                    row = self._db.execute("SELECT value FROM meta WHERE key = 'dim'").fetchone()
+                    self.dim = int(row[0]) if row else len(embeddings[0])
+                    self._db.execute("INSERT OR REPLACE INTO meta VALUES ('dim', ?)", (str(self.dim),))
+                if self._vectors is None:
+                    self._open_vectors()
+                self._count = self._db.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+
+                now = time()
+                for text, embedding in zip(texts, embeddings):
+                    h = text_hash(text)
+                    slot, is_new = self._slot_for(h)
+                    if slot >= len(self._vectors):
+                        self._open_vectors(min_rows=slot + 1)
+                    self._vectors[slot] = np.asarray(embedding, dtype=np.float32)
+                    self._db.execute("INSERT OR REPLACE INTO entries VALUES (?, ?, ?)", (h, slot, now))
+                    self._count += is_new
+
+                self._vectors.flush()
+                self._db.commit()
+            except BaseException:
+                self._db.rollback()
+                raise
+
+    def _lookup(self, hashes: List[str]) -> Dict[str, int]:
+        if self._vectors is None and not self._attach():
+            return {}
+
+        slots = {}
+        unique = list(set(hashes))
+        # Stay under sqlite's bound parameter limit
+        for i in range(0, len(unique), 500):
+            part = unique[i : i + 500]
+            placeholders = ",".join("?" * len(part))
+            slots.update(self._db.execute(
+                f"SELECT hash, slot FROM entries WHERE hash IN ({placeholders})", part
+            ).fetchall())
+
+        if slots and max(slots.values()) >= len(self._vectors):
+            # Another process grew the file since it was mapped
+            self._open_vectors(min_rows=0)
+        return slots
+
+    def _attach(self) -> bool:
+        """Map the vector file if another process has created it since"""
+        if self.dim is None:
+            row = self._db.execute("SELECT value FROM meta WHERE key = 'dim'").fetchone()
+            if not row:
+                return False
+            self.dim = int(row[0])
+        if self.vectors_path.exists():
+            self._open_vectors(min_rows=0)
+        return self._vectors is not None
+
+    def _slot_for(self, h: str) -> Tuple[int, bool]:
+        """
+        Row to write `h` into: its existing row, a fresh row, or the LRU
+        victim's row. Also returns whether the entry count grows.
+        """
+        row = self._db.execute("SELECT slot FROM entries WHERE hash = ?", (h,)).fetchone()
+        if row:
+            return row[0], False
+
+        if self._count < self.max_entries:
+            return self._count, True
+
+        victim, slot = self._db.execute(
+            "SELECT hash, slot FROM entries ORDER BY last_used LIMIT 1"
+        ).fetchone()
+        self._db.execute("DELETE FROM entries WHERE hash = ?", (victim,))
+        return slot, False
+
+    def close(self):
+        with self._lock:
+            if self._vectors is not None:
+                self._vectors.flush()
+            self._db.close()
+
+
+class CachedEmbeddingFunction:
+    """Embedding function that only calls the wrapped one for cache misses"""
+    def __init__(self, embedding_function: EmbeddingFunction, cache: EmbeddingCache):
+        self.embedding_function = embedding_function
+        self.cache = cache
+        self.calls = 0
+
+    def __call__(self, texts: List[str]) -> List[List[float]]:
+        results = self.cache.get_many(texts)
+
+        # Embed each distinct missing text once
+        missing = list(dict.fromkeys(t for t, r in zip(texts, results) if r is None))
+        if missing:
+            self.calls += 1
+            fresh = dict(zip(missing, self.embedding_function(missing)))
+            self.cache.put_many(list(fresh), list(fresh.values()))
+            results = [r if r is not None else list(fresh[t]) for t, r in zip(texts, results)]
+
+        return results
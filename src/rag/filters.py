@@ -0,0 +1,192 @@
+# Metadata `where` filters: validation, evaluation and posting-list indexes
+import re
+from array import array
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+# Chroma's operator set, so one filter works on every backend
+COMPARISONS = ("$eq", "$ne", "$gt", "$gte", "$lt", "$lte", "$in", "$nin")
+LOGICAL = ("$and", "$or")
+RANGES = ("$gt", "$gte", "$lt", "$lte")
+
+# Chroma only compares numbers, so each ISO date string is also stored as
+# seconds since the epoch under "<field>#ts" and date ranges filter on that
+TIMESTAMP_SUFFIX = "#ts"
+_ISO_DATE = re.compile(r"\d{4}-\d{2}-\d{2}(?:[T ]\d{2}:\d{2}|$)")
+
+
+def validate_where(where: Dict[str, Any]):
+    """
+    Raise ValueError unless `where` is a filter such as
+    {"source": "faq.md"}, {"source": {"$in": ["faq.md", "terms.md"]}} or
+    {"$and": [{"date": {"$gte": "2024-01-01"}}, {"date": {"$lt": "2025-01-01"}}]}.
+    Several fields in one dict must all match.
+    """
+    if not isinstance(where, dict) or not where:
+        raise ValueError(f"A where filter must be a non-empty dict, got {where!r}")
+
+    for field, condition in where.items():
+        if field in LOGICAL:
+            if not isinstance(condition, list) or not condition:
+                raise ValueError(f"{field} needs a non-empty list of filters")
+            for clause in condition:
+                validate_where(clause)
+        elif field.startswith("$"):
+            raise ValueError(f"Unknown filter operator {field}")
+        elif isinstance(condition, dict):
+            for op, value in condition.items():
+                if op not in COMPARISONS:
+                    raise ValueError(f"Unknown operator {op} on '{field}' (expected one of {', '.join(COMPARISONS)})")
+                if op in ("$in", "$nin") and not isinstance(value, list):
+                    raise ValueError(f"{op} on '{field}' needs a list")
+
+
+def as_timestamp(value: Any) -> Optional[float]:
+    """Seconds since the epoch for an ISO 8601 date or datetime string (UTC unless it says otherwise), else None"""
+    if not isinstance(value, str) or not _ISO_DATE.match(value):
+        return None
+    try:
+        parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.timestamp()
+
+
+def to_chroma_metadata(metadata: Dict[str, Any]) -> Dict[str, Any]:
+    """Metadata as stored in Chroma: scalars only, plus a timestamp field per ISO date"""
+    stored = dict(metadata)
+    for field, value in metadata.items():
+        if isinstance(value, (list, tuple, dict)):
+            raise ValueError(
+                f"Metadata field '{field}' holds a {type(value).__name__}; Chroma only stores "
+                "str, int, float and bool values (use vector_backend='numpy' for list fields such as tags)"
+            )
+        timestamp = as_timestamp(value)
+        if timestamp is not None:
+            stored[field + TIMESTAMP_SUFFIX] = timestamp
+    return stored
+
+
+def from_chroma_metadata(metadata: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    return {field: value for field, value in (metadata or {}).items() if not field.endswith(TIMESTAMP_SUFFIX)}
+
+
+def _chroma_condition(field: str, op: str, value: Any) -> Dict[str, Any]:
+    if op in RANGES and isinstance(value, str):
+        timestamp = as_timestamp(value)
+        if timestamp is None:
+            raise ValueError(
+                f"{op} on '{field}' needs a number or an ISO date on the Chroma backend, got {value!r}"
+            )
+        return {field + TIMESTAMP_SUFFIX: {op: timestamp}}
+    return {field: {op: value}}
+
+
+def to_chroma(where: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Chroma wants exactly one field or operator per dict, so spell out the
+    implicit $and; date ranges become ranges over the stored timestamps
+    """
+    clauses = []
+    for field, condition in where.items():
+        if field in LOGICAL:
+            clauses.append({field: [to_chroma(clause) for clause in condition]})
+        elif isinstance(condition, dict):
+            clauses.extend(_chroma_condition(field, op, value) for op, value in condition.items())
+        else:
+            clauses.append({field: condition})
+    return clauses[0] if len(clauses) == 1 else {"$and": clauses}
+
+
+def _key(value: Any) -> Tuple[str, Any]:
+    """Postings key: numbers compare with numbers and strings (e.g. ISO dates) with strings"""
+    if isinstance(value, bool):
+        return ("b", value)
+    if isinstance(value, (int, float)):
+        return ("n", float(value))
+    if isinstance(value, str):
+        return ("s", value)
+    return ("s", str(value))
+
+
+def _in_range(key: Tuple[str, Any], op: str, bound: Tuple[str, Any]) -> bool:
+    if key[0] != bound[0]:
+        return False
+    if op == "$gt":
+        return key[1] > bound[1]
+    if op == "$gte":
+        return key[1] >= bound[1]
+    if op == "$lt":
+        return key[1] < bound[1]
+    return key[1] <= bound[1]
+
+
+class MetadataIndex:
+    """
+    Posting lists over chunk metadata: for every top-level field, each
+    value maps to the rows that carry it (list values such as tags post
+    every element). A where filter becomes a boolean row mask built from
+    the postings alone, before any vector is scored.
+    """
+
+    def __init__(self):
+        self._postings: Dict[str, Dict[Tuple[str, Any], array]] = {}
+        self.rows = 0
+
+    def add(self, start: int, metadatas: List[Dict[str, Any]]):
+        """Index metadata for rows start, start + 1, ..."""
+        for row, metadata in enumerate(metadatas, start):
+            for field, value in (metadata or {}).items():
+                values = value if isinstance(value, list) else [value]
+                postings = self._postings.setdefault(field, {})
+                for item in values:
+                    postings.setdefault(_key(item), array("I")).append(row)
+        self.rows = max(self.rows, start + len(metadatas))
+
+    def mask(self, where: Dict[str, Any], rows: Optional[int] = None) -> np.ndarray:
+        """Rows [0, rows) matching the filter"""
+        rows = self.rows if rows is None else rows
+        result = np.ones(rows, dtype=bool)
+        for field, condition in where.items():
+            if field == "$and":
+                for clause in condition:
+                    result &= self.mask(clause, rows)
+            elif field == "$or":
+                either = np.zeros(rows, dtype=bool)
+                for clause in condition:
+                    either |= self.mask(clause, rows)
+                result &= either
+            elif isinstance(condition, dict):
+                for op, value in condition.items():
+                    result &= self._condition(field, op, value, rows)
+            else:
+                result &= self._condition(field, "$eq", condition, rows)
+        return result
+
+    def _rows(self, field: str, keys, rows: int) -> np.ndarray:
+        found = np.zeros(rows, dtype=bool)
+        postings = self._postings.get(field, {})
+        for key in keys:
+            posting = postings.get(key)
+            if posting:
+                listed = np.frombuffer(posting, dtype=np.uint32)
+                found[listed[listed < rows]] = True
+        return found
+
+    def _condition(self, field: str, op: str, value: Any, rows: int) -> np.ndarray:
+        if op == "$eq":
+            return self._rows(field, [_key(value)], rows)
+        if op == "$ne":
+            return ~self._rows(field, [_key(value)], rows)
+        if op == "$in":
+            return self._rows(field, [_key(item) for item in value], rows)
+        if op == "$nin":
+            return ~self._rows(field, [_key(item) for item in value], rows)
+
+        bound = _key(value)
+        keys = [key for key in self._postings.get(field, {}) if _in_range(key, op, bound)]
+        return self._rows(field, keys, rows)
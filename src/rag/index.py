@@ -1,5 +1,47 @@
 import tiktoken
-from typing import Dict, Any, List
+import hashlib
+import json
+import multiprocessing
+import os
+import re
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from itertools import accumulate
+from time import perf_counter
+from typing import Dict, Any, Iterable, Iterator, List, Tuple
+
+_PARAGRAPH = re.compile(r"\n\s*\n")
+_SENTENCE = re.compile(r"(?<=[.!?])\s+")
+
+
+@lru_cache(maxsize=None)
+def get_encoding(model: str) -> tiktoken.Encoding:
+    """Cached tiktoken encoder for a model (building one is expensive)"""
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return tiktoken.get_encoding("cl100k_base")
+
+
+def _spans(text: str, separator: re.Pattern, start: int, end: int) -> Iterator[Tuple[int, int]]:
+    """Contiguous (start, end) spans of text[start:end], each keeping its trailing separator"""
+    pos = start
+    for match in separator.finditer(text, start, end):
+        yield pos, match.end()
+        pos = match.end()
+    
+    if pos < end:
+        yield pos, end
+
+
+def make_chunk_id(source: str, start: int, end: int, text: str, metadata: Dict[str, Any]) -> str:
+    """Deterministic chunk ID from source, offsets and a hash of the chunk content"""
+    source_hash = hashlib.sha1(source.encode("utf-8")).hexdigest()[:12]
+    content = json.dumps([text, metadata], sort_keys=True, default=str)
+    content_hash = hashlib.sha1(content.encode("utf-8")).hexdigest()[:12]
+    return f"{source_hash}-{start}-{end}-{content_hash}"
+
 # Document chunking
 class DocumentChunker:
     """Split documents into chunks for embeddings"""
@@ -8,9 +50,11 @@ class DocumentChunker:
         self.chunk_size = chunk_size
         self.overlap = overlap
         
-    def chunk_text(self, text: str, metadata: Dict[str, Any] = {}) -> List[Dict]:
-        chunks = []
+    def iter_chunks(self, text: str, metadata: Dict[str, Any] = {}) -> Iterator[Dict]:
+        """Lazily yield chunks of one text"""
         text = text.strip()
+        metadata = metadata or {}
+        source = str(metadata.get("source", "unknown"))
         
         # Simple Character based chunking
         start = 0
@@ -19,50 +63,68 @@ class DocumentChunker:
         while start < len(text):
             # Get chunk
             end = start + self.chunk_size
-            chunk_text = text[start : end]
             
-            # Try to break at sentence boundary
+            # Try to break at sentence boundary. Search the window in place
+            # rather than slicing it out first
             if end < len(text):
                 last_sentence = max(
-                    chunk_text.rfind('. '),
-                    chunk_text.rfind('? '),
-                    chunk_text.rfind('! ')
+                    text.rfind('. ', start, end),
+                    text.rfind('? ', start, end),
+                    text.rfind('! ', start, end)
                 )
                 
-                if last_sentence != -1:
-                    chunk_text = chunk_text[:last_sentence + 1]
-                    end = start + last_sentence + 1
+                # Only if the chunk still ends past the overlap, otherwise the
+                # next window would find the same boundary again
+                if last_sentence + 1 - start > self.overlap:
+                    end = last_sentence + 1
             
-            # create chunks with metadata
-            chunks.append({
-                "text": chunk_text.strip(),
+            # create chunks with metadata (the only copy of the window we make)
+            chunk_text = text[start : end].strip()
+            yield {
+                "id": make_chunk_id(source, start, end, chunk_text, metadata),
+                "text": chunk_text,
                 "chunk_id": chunk_id,
                 "start_char": start,
                 "end_char": end,
-                "metadata": metadata or {}
-            })
+                "metadata": metadata
+            }
             
-            # Move to next chunk with overlap
-            start = end - self.overlap
+            # The rest of the text would only repeat the overlap
+            if end >= len(text):
+                break
+            
+            # Move to next chunk with overlap, always making progress
+            start = max(end - self.overlap, start + 1)
             chunk_id += 1
-        
-        return chunks
+    
+    def chunk_text(self, text: str, metadata: Dict[str, Any] = {}) -> List[Dict]:
+        return list(self.iter_chunks(text, metadata))
+    
+    def chunk_document(self, doc: Dict) -> List[Dict]:
+        """Chunk a single document"""
+        return self.chunk_text(
+            text = doc.get("content", ""),
+            metadata={
+                "source": doc.get("source", "unknown"),
+                "title": doc.get("title", ""),
+                **doc.get("metadata", {})
+            }
+        )
+    
+    def iter_document_chunks(self, documents: Iterable[Dict]) -> Iterator[Tuple[Dict, List[Dict]]]:
+        """Lazily yield (document, chunks) pairs"""
+        for doc in documents:
+            yield doc, self.chunk_document(doc)
+    
+    def iter_chunk_documents(self, documents: Iterable[Dict]) -> Iterator[Dict]:
+        """Lazily chunk a stream of documents, one document in memory at a time"""
+        for doc in documents:
+            yield from self.chunk_document(doc)
     
     def chunk_documents(self, documents: List[Dict]) -> List[Dict]:
         """Chunk multiple documents"""
-        all_chunks = []
         try: 
-            for doc in documents:
-                chunks = self.chunk_text(
-                    text = doc.get("content", ""),
-                    metadata={
-                        "source": doc.get("source", "unknown"),
-                        "title": doc.get("title", ""),
-                        **doc.get("metadata", {})
-                    }
-                )
-                
-                all_chunks.extend(chunks)
+            all_chunks = list(self.iter_chunk_documents(documents))
         
             print(f"📄 Chunked {len(documents)} documents into {len(all_chunks)} chunks")
             return all_chunks
@@ -71,6 +133,278 @@ class DocumentChunker:
             print(f"❌ Chunking failed: {e}")
             raise
 
+
+class TokenChunker(DocumentChunker):
+    """
+    Split documents into chunks of at most `chunk_tokens` tokens.
+    
+    Text is split by paragraph, then sentence, and only sentences longer than
+    the budget are cut by token. Every sentence is encoded exactly once and
+    packed greedily, so chunks come out close to the budget.
+    """
+    
+    def __init__(self, chunk_tokens: int, overlap_tokens: int, model: str = "text-embedding-3-small"):
+        super().__init__(chunk_size=chunk_tokens, overlap=overlap_tokens)
+        self.model = model
+        self.encoding = get_encoding(model)
+    
+    def __getstate__(self):
+        # Encoders don't pickle cheaply; worker processes rebuild them from the model name
+        state = self.__dict__.copy()
+        del state["encoding"]
+        return state
     
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.encoding = get_encoding(self.model)
+        
+    def iter_chunks(self, text: str, metadata: Dict[str, Any] = {}) -> Iterator[Dict]:
+        """Lazily yield token-budgeted chunks of one text"""
+        text = text.strip()
+        metadata = metadata or {}
+        source = str(metadata.get("source", "unknown"))
+        budget = self.chunk_size
+        
+        window: List[Tuple[int, int, int]] = []  # (start, end, tokens) of packed pieces
+        window_tokens = 0
+        chunk_id = 0
+        
+        def flush():
+            nonlocal window, window_tokens, chunk_id
+            start, end = window[0][0], window[-1][1]
+            chunk_text = text[start : end].strip()
+            chunk = {
+                "id": make_chunk_id(source, start, end, chunk_text, metadata),
+                "text": chunk_text,
+                "chunk_id": chunk_id,
+                "start_char": start,
+                "end_char": end,
+                "tokens": window_tokens,
+                "metadata": metadata
+            }
+            chunk_id += 1
+            
+            # Carry trailing sentences that fit in the overlap into the next chunk
+            carried, carried_tokens = [], 0
+            for piece in reversed(window[1:]):
+                if carried_tokens + piece[2] > self.overlap:
+                    break
+                carried.insert(0, piece)
+                carried_tokens += piece[2]
+            window, window_tokens = carried, carried_tokens
+            return chunk
+        
+        for p_start, p_end in _spans(text, _PARAGRAPH, 0, len(text)):
+            sentences = [
+                (start, end, len(self.encoding.encode_ordinary(text[start : end])))
+                for start, end in _spans(text, _SENTENCE, p_start, p_end)
+            ]
+            paragraph_tokens = sum(tokens for _, _, tokens in sentences)
+            
+            # Prefer to break between paragraphs when the next one won't fit
+            if window and window_tokens + paragraph_tokens > budget and window_tokens >= budget // 2:
+                yield flush()
+            
+            for sentence in sentences:
+                if sentence[2] > budget:
+                    if window:
+                        yield flush()
+                    for chunk in self._split_sentence(text, sentence, source, metadata):
+                        chunk["chunk_id"] = chunk_id
+                        chunk_id += 1
+                        yield chunk
+                    window, window_tokens = [], 0
+                    continue
+                
+                if window_tokens + sentence[2] > budget:
+                    yield flush()
+                    # The carried overlap plus this sentence may still not fit
+                    while window and window_tokens + sentence[2] > budget:
+                        window_tokens -= window.pop(0)[2]
+                
+                window.append(sentence)
+                window_tokens += sentence[2]
+        
+        if window_tokens:
+            yield flush()
+    
+    def _split_sentence(
+        self,
+        text: str,
+        sentence: Tuple[int, int, int],
+        source: str,
+        metadata: Dict[str, Any],
+    ) -> Iterator[Dict]:
+        """Cut one over-long sentence into token windows"""
+        start, end, _ = sentence
+        sentence_text = text[start : end]
+        tokens = self.encoding.encode_ordinary(sentence_text)
+        
+        # Byte offset where each token ends, to map token windows back to characters
+        byte_ends, total = [], 0
+        for token_bytes in self.encoding.decode_tokens_bytes(tokens):
+            total += len(token_bytes)
+            byte_ends.append(total)
+        
+        # Whole characters before each token end, in one walk over both (a token may end mid-character)
+        if sentence_text.isascii():
+            char_ends = byte_ends
+        else:
+            char_ends, chars = [], 0
+            char_byte_ends = accumulate(len(ch.encode("utf-8")) for ch in sentence_text)
+            next_end = next(char_byte_ends, None)
+            for n_bytes in byte_ends:
+                while next_end is not None and next_end <= n_bytes:
+                    chars += 1
+                    next_end = next(char_byte_ends, None)
+                char_ends.append(chars)
+        
+        def char_offset(n_tokens: int) -> int:
+            return start + (char_ends[n_tokens - 1] if n_tokens else 0)
+        
+        step = max(self.chunk_size - self.overlap, 1)
+        for i in range(0, len(tokens), step):
+            j = min(i + self.chunk_size, len(tokens))
+            c_start, c_end = char_offset(i), char_offset(j)
+            chunk_text = text[c_start : c_end].strip()
+            yield {
+                "id": make_chunk_id(source, c_start, c_end, chunk_text, metadata),
+                "text": chunk_text,
+                "start_char": c_start,
+                "end_char": c_end,
+                "tokens": j - i,
+                "metadata": metadata
+            }
+            if j == len(tokens):
+                break
+
+
+# Chunker for the current worker process, set once by the pool initializer
+_worker_chunker = None
+
+
+def _init_worker(chunker: DocumentChunker):
+    global _worker_chunker
+    _worker_chunker = chunker
+
+
+def _chunk_task(documents: List[Dict]) -> Tuple[int, float, List[List[Dict]]]:
+    start = perf_counter()
+    chunks = [_worker_chunker.chunk_document(doc) for doc in documents]
+    return os.getpid(), perf_counter() - start, chunks
+
+
+class ChunkingStats:
+    """Track per-worker chunking throughput"""
+    def __init__(self):
+        self.workers: Dict[int, Dict[str, float]] = {}
+        
+    def log_task(self, pid: int, documents: int, chunks: int, seconds: float):
+        worker = self.workers.setdefault(pid, {"documents": 0, "chunks": 0, "seconds": 0.0})
+        worker["documents"] += documents
+        worker["chunks"] += chunks
+        worker["seconds"] += seconds
+        
+    def get_summary(self) -> Dict[int, Dict[str, float]]:
+        return {
+            pid: {
+                **worker,
+                "documents_per_second": worker["documents"] / worker["seconds"] if worker["seconds"] else 0.0,
+                "chunks_per_second": worker["chunks"] / worker["seconds"] if worker["seconds"] else 0.0,
+            }
+            for pid, worker in self.workers.items()
+        }
+        
+    def print_summary(self):
+        summary = self.get_summary()
+        print(f"📄 Chunking throughput across {len(summary)} workers")
+        for pid, worker in summary.items():
+            print(
+                f"   worker {pid}: {worker['documents']} docs, {worker['chunks']} chunks "
+                f"({worker['documents_per_second']:.1f} docs/s, {worker['chunks_per_second']:.1f} chunks/s)"
+            )
+        return summary
+
+
+class ParallelChunker:
+    """
+    Chunk documents on a process pool.
+    
+    Documents are sent to workers in tasks of `docs_per_task` to keep IPC
+    overhead low, and results come back in input order. At most
+    2 * workers tasks are in flight, so a lazy document stream stays lazy.
+    """
+    
+    def __init__(self, chunker: DocumentChunker, workers: int = os.cpu_count() or 1, docs_per_task: int = 64):
+        self.chunker = chunker
+        self.workers = workers
+        self.docs_per_task = docs_per_task
+        self.stats = ChunkingStats()
+        
+    def __getattr__(self, name):
+        # Single-document helpers run on the wrapped chunker
+        return getattr(self.chunker, name)
+        
+    def iter_document_chunks(self, documents: Iterable[Dict]) -> Iterator[Tuple[Dict, List[Dict]]]:
+        """Lazily yield (document, chunks) pairs, chunked in worker processes"""
+        self.stats = ChunkingStats()
+        pending = deque()
+        
+        # Spawn, not fork: the parent has embedding, HTTP and sqlite threads whose held locks a fork would copy
+        with ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(self.chunker,)
+        ) as pool:
+            task = []
+            for doc in documents:
+                task.append(doc)
+                if len(task) >= self.docs_per_task:
+                    pending.append((task, pool.submit(_chunk_task, task)))
+                    task = []
+                    
+                    if len(pending) >= self.workers * 2:
+                        yield from self._collect(*pending.popleft())
+            
+            if task:
+                pending.append((task, pool.submit(_chunk_task, task)))
+            
+            while pending:
+                yield from self._collect(*pending.popleft())
+        
+        self.stats.print_summary()
+        
+    def _collect(self, task: List[Dict], future) -> Iterator[Tuple[Dict, List[Dict]]]:
+        pid, seconds, chunks = future.result()
+        self.stats.log_task(pid, len(task), sum(len(c) for c in chunks), seconds)
+        yield from zip(task, chunks)
+        
+    def iter_chunk_documents(self, documents: Iterable[Dict]) -> Iterator[Dict]:
+        for _, chunks in self.iter_document_chunks(documents):
+            yield from chunks
+        
+    def chunk_documents(self, documents: List[Dict]) -> List[Dict]:
+        """Chunk multiple documents in parallel"""
+        all_chunks = list(self.iter_chunk_documents(documents))
+        print(f"📄 Chunked {len(documents)} documents into {len(all_chunks)} chunks")
+        return all_chunks
+
+
+def make_chunker(config) -> DocumentChunker:
+    """Build the chunker selected by RagConfig, on a process pool if chunking_workers > 1"""
+    if config.chunking_strategy == "tokens":
+        chunker = TokenChunker(
+            chunk_tokens=config.chunk_tokens,
+            overlap_tokens=config.chunk_overlap_tokens,
+            model=config.embedding_model
+        )
+    else:
+        chunker = DocumentChunker(
+            chunk_size=config.chunk_size,
+            overlap=config.chunk_overlap
+        )
     
-    
\ No newline at end of file
+    if config.chunking_workers > 1:
+        return ParallelChunker(chunker, workers=config.chunking_workers, docs_per_task=config.chunking_docs_per_task)
+    return chunker
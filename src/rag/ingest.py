@@ -0,0 +1,169 @@
+# Batched, concurrent embedding for ingestion
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from time import perf_counter
+from typing import Any, Callable, Deque, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from .rate_limit import priority
+from .resilience import ResiliencePolicy
+
+# Anything that maps a list of texts to a list of vectors (chromadb embedding
+# functions, or a local stub in tests)
+EmbeddingFunction = Callable[[List[str]], List[List[float]]]
+
+
+def iter_batches(items: Iterable, batch_size: int) -> Iterator[List]:
+    """Yield lists of at most `batch_size` items from any iterable"""
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+
+    if batch:
+        yield batch
+
+
+class IngestReport:
+    """Track ingestion progress and throughput"""
+    def __init__(self):
+        self.chunks = 0
+        self.batches = 0
+        self.retries = 0
+        self.failed_batches = 0
+        self.failed_chunks = 0
+        self.failed_ids = set()
+        self.skipped_documents = 0
+        self.duplicate_documents = 0
+        self.deleted_chunks = 0
+        self.errors = []
+        self.start_time = perf_counter()
+        self.end_time: float | None = None
+
+    def log_batch(self, size: int, attempts: int):
+        self.chunks += size
+        self.batches += 1
+        self.retries += attempts - 1
+
+    def log_failure(self, ids: List[str], error: str):
+        self.failed_batches += 1
+        self.failed_chunks += len(ids)
+        self.failed_ids.update(ids)
+        self.errors.append(error)
+
+    def finish(self):
+        self.end_time = perf_counter()
+
+    @property
+    def duration(self) -> float:
+        return (self.end_time or perf_counter()) - self.start_time
+
+    @property
+    def throughput(self) -> float:
+        """Chunks embedded per second"""
+        return self.chunks / self.duration if self.duration > 0 else 0.0
+
+    def get_summary(self) -> Dict[str, Any]:
+        return {
+            "chunks": self.chunks,
+            "batches": self.batches,
+            "retries": self.retries,
+            "failed_batches": self.failed_batches,
+            "failed_chunks": self.failed_chunks,
+            "skipped_documents": self.skipped_documents,
+            "duplicate_documents": self.duplicate_documents,
+            "deleted_chunks": self.deleted_chunks,
+            "errors": len(self.errors),
+            "duration_seconds": self.duration,
+            "chunks_per_second": self.throughput,
+        }
+
+    def print_progress(self):
+        print(f"   ⏳ {self.chunks} chunks in {self.batches} batches ({self.throughput:.1f} chunks/s)")
+
+    def print_summary(self):
+        """Pretty print ingestion stats"""
+        summary = self.get_summary()
+
+        print("\n" + "="*60)
+        print("📊 INGESTION REPORT")
+        print("="*60)
+        print(f"⏱️  Duration: {summary['duration_seconds']:.2f}s")
+        print(f"📦 Chunks: {summary['chunks']} in {summary['batches']} batches")
+        print(f"🚀 Throughput: {summary['chunks_per_second']:.1f} chunks/s")
+        print(f"⏭️  Unchanged documents: {summary['skipped_documents']}")
+        if summary["duplicate_documents"]:
+            print(f"⚠️  Duplicate sources skipped: {summary['duplicate_documents']}")
+        print(f"🗑️  Stale chunks deleted: {summary['deleted_chunks']}")
+        print(f"🔁 Retries: {summary['retries']}")
+        print(f"❌ Failed: {summary['failed_chunks']} chunks in {summary['failed_batches']} batches")
+        print("="*60 + "\n")
+
+        return summary
+
+
+class BatchEmbedder:
+    """Embed chunks in fixed-size batches on a bounded worker pool"""
+    def __init__(
+        self,
+        embedding_function: EmbeddingFunction,
+        batch_size: int = 100,
+        max_workers: int = 4,
+        max_retries: int = 3,
+        policy: Optional[ResiliencePolicy] = None,
+    ):
+        self.embedding_function = embedding_function
+        self.batch_size = batch_size
+        self.max_workers = max_workers
+        self.max_retries = max_retries
+        self.policy = policy or ResiliencePolicy("embeddings", max_attempts=max_retries)
+
+    def _embed_with_retry(self, texts: List[str]) -> Tuple[List[List[float]], int]:
+        """Embed one batch, retrying transient failures. Returns (embeddings, attempts)"""
+        # Ingestion yields rate-limit budget to interactive queries
+        with priority("bulk"):
+            for attempt in self.policy.retrying():
+                with attempt:
+                    embeddings = self.embedding_function(texts)
+
+        return list(embeddings), attempt.retry_state.attempt_number
+
+    def embed(
+        self,
+        chunks: Iterable[Dict],
+        report: Optional[IngestReport] = None,
+    ) -> Iterator[Tuple[List[Dict], List[List[float]]]]:
+        """
+        Yield (batch, embeddings) pairs in input order.
+
+        At most 2 * max_workers batches are in flight, so a slow embedding
+        endpoint pushes back on whatever is producing `chunks`. Batches that
+        still fail after retries are recorded on the report and skipped.
+        """
+        report = report or IngestReport()
+        max_in_flight = self.max_workers * 2
+        pending: Deque = deque()
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            for batch in iter_batches(chunks, self.batch_size):
+                texts = [chunk["text"] for chunk in batch]
+                pending.append((batch, pool.submit(self._embed_with_retry, texts)))
+
+                if len(pending) >= max_in_flight:
+                    yield from self._collect(pending.popleft(), report)
+
+            while pending:
+                yield from self._collect(pending.popleft(), report)
+
+    def _collect(self, item, report: IngestReport):
+        batch, future = item
+        try:
+            embeddings, attempts = future.result()
+        except Exception as e:
+            print(f"❌ Embedding batch failed: {e}")
+            report.log_failure([chunk.get("id") for chunk in batch], str(e))
+            return
+
+        report.log_batch(len(batch), attempts)
+        yield batch, embeddings
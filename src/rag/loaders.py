@@ -0,0 +1,76 @@
+# Streaming document loaders
+import glob
+import json
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, Optional
+
+TEXT_EXTENSIONS = (".txt", ".md", ".rst")
+
+
+def read_file(path: Path) -> Dict:
+    """Load one text file as a document"""
+    return {
+        "content": path.read_text(encoding="utf-8", errors="replace"),
+        "source": str(path),
+        "title": path.stem,
+    }
+
+
+def within(path: Path, root: Optional[Path]) -> bool:
+    """Whether a path, symlinks resolved, is inside `root` (anything is, without a root)"""
+    if root is None:
+        return True
+    resolved = path.resolve()
+    return resolved == root or root in resolved.parents
+
+
+def iter_files(
+    paths: Iterable[Path], extensions: Iterable[str] = TEXT_EXTENSIONS, root: Optional[Path] = None
+) -> Iterator[Dict]:
+    """Yield documents for text files, expanding any .jsonl files line by line. Files outside `root` are skipped"""
+    extensions = tuple(extensions)
+    for path in paths:
+        if not path.is_file() or not within(path, root):
+            continue
+        if path.suffix == ".jsonl":
+            yield from iter_jsonl(path)
+        elif path.suffix in extensions:
+            yield read_file(path)
+
+
+def iter_directory(
+    directory: str, extensions: Iterable[str] = TEXT_EXTENSIONS, root: Optional[Path] = None
+) -> Iterator[Dict]:
+    """Lazily yield every text document under a directory"""
+    yield from iter_files(sorted(Path(directory).rglob("*")), extensions, root)
+
+
+def iter_glob(pattern: str, extensions: Iterable[str] = TEXT_EXTENSIONS, root: Optional[Path] = None) -> Iterator[Dict]:
+    """Lazily yield documents for files matching a glob pattern"""
+    yield from iter_files((Path(p) for p in glob.iglob(pattern, recursive=True)), extensions, root)
+
+
+def iter_jsonl(path: str) -> Iterator[Dict]:
+    """Lazily yield documents from a JSONL file with 'content', 'source', 'title' keys"""
+    with open(path, encoding="utf-8") as f:
+        for line_no, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            doc = json.loads(line)
+            doc.setdefault("source", f"{path}:{line_no}")
+            yield doc
+
+
+def load_documents(location: str, root: Optional[str] = None) -> Iterator[Dict]:
+    """
+    Stream documents from a directory, a JSONL file or a glob pattern.
+    With a `root`, only files that resolve inside it (symlinks followed) are read.
+    """
+    root_path = Path(root).resolve() if root else None
+    path = Path(location)
+    if path.is_dir():
+        return iter_directory(location, root=root_path)
+    if path.is_file() and path.suffix == ".jsonl":
+        return iter_jsonl(location) if within(path, root_path) else iter(())
+    return iter_glob(location, root=root_path)
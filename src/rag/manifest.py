@@ -0,0 +1,141 @@
+# Per-document manifest for incremental ingestion
+import hashlib
+import json
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+
+def document_hash(doc: Dict) -> str:
+    """Hash everything about a document that ends up in its chunks"""
+    payload = json.dumps(
+        [doc.get("content", ""), doc.get("title", ""), doc.get("metadata", {})],
+        sort_keys=True,
+        default=str,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def document_key(doc: Dict) -> str:
+    """Manifest key: the document's source, or its content hash when it has none"""
+    source = doc.get("source")
+    return str(source) if source else f"sha256:{document_hash(doc)}"
+
+
+class IngestManifest:
+    """Record which chunk IDs each document (keyed by `document_key`) has in the collection"""
+    def __init__(self, path: str):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS documents (
+                source TEXT PRIMARY KEY,
+                content_hash TEXT NOT NULL,
+                chunk_ids TEXT NOT NULL
+            )
+        """)
+        self._db.commit()
+
+    def get(self, source: str) -> Optional[Tuple[str, Set[str]]]:
+        """Return (content hash, chunk ids) for a document, if ingested before"""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT content_hash, chunk_ids FROM documents WHERE source = ?", (source,)
+            ).fetchone()
+
+        if row is None:
+            return None
+        return row[0], set(json.loads(row[1]))
+
+    def sources(self) -> List[str]:
+        with self._lock:
+            return [row[0] for row in self._db.execute("SELECT source FROM documents")]
+
+    def update(self, source: str, content_hash: str, chunk_ids: List[str]):
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO documents VALUES (?, ?, ?)",
+                (source, content_hash, json.dumps(chunk_ids))
+            )
+            self._db.commit()
+
+    def remove(self, source: str):
+        with self._lock:
+            self._db.execute("DELETE FROM documents WHERE source = ?", (source,))
+            self._db.commit()
+
+    def clear(self):
+        with self._lock:
+            self._db.execute("DELETE FROM documents")
+            self._db.commit()
+
+
+class ManifestSync:
+    """Diff one ingest run against the manifest, then commit it once chunks are written"""
+    def __init__(self, manifest: IngestManifest):
+        self.manifest = manifest
+        self.pending: Dict[str, Optional[Tuple[str, List[str]]]] = {}
+        self.stale_ids: List[str] = []
+        self.seen: Set[str] = set()
+        self.skipped = 0
+        self.duplicates = 0
+        # document key -> (new content hash, previously stored chunk ids) awaiting chunking
+        self._changed: Dict[str, Tuple[str, Set[str]]] = {}
+
+    def changed_documents(self, documents: Iterable[Dict]) -> Iterator[Dict]:
+        """Yield only documents that are new or changed since the last ingest"""
+        for doc in documents:
+            source = document_key(doc)
+            if source in self.seen:
+                # One manifest entry per key: a second document would overwrite it and get the first's chunks deleted
+                print(f"⚠️  Skipping duplicate document source '{source}' (first one wins)")
+                self.duplicates += 1
+                continue
+            self.seen.add(source)
+
+            content_hash = document_hash(doc)
+            previous = self.manifest.get(source)
+            if previous and previous[0] == content_hash:
+                self.skipped += 1
+                continue
+
+            self._changed[source] = (content_hash, previous[1] if previous else set())
+            yield doc
+
+    def changed_chunks(self, chunked: Iterable[Tuple[Dict, List[Dict]]]) -> Iterator[Dict]:
+        """
+        Yield only chunks that aren't in the collection yet, given
+        (document, chunks) pairs. Chunk IDs that a document no longer
+        produces are queued for deletion.
+        """
+        for doc, chunks in chunked:
+            source = document_key(doc)
+            content_hash, old_ids = self._changed.pop(source, (document_hash(doc), set()))
+            new_ids = [chunk["id"] for chunk in chunks]
+
+            self.stale_ids.extend(old_ids.difference(new_ids))
+            self.pending[source] = (content_hash, new_ids)
+
+            for chunk in chunks:
+                if chunk["id"] not in old_ids:
+                    yield chunk
+
+    def prune_missing(self):
+        """Queue every document that wasn't part of this run for deletion"""
+        for source in self.manifest.sources():
+            if source not in self.seen:
+                self.stale_ids.extend(self.manifest.get(source)[1])
+                self.pending[source] = None
+
+    def commit(self, failed_ids: Set[str]):
+        """
+        Record the new state of each touched document. Documents with failed
+        chunks keep their old entry so the next run retries them.
+        """
+        for source, entry in self.pending.items():
+            if entry is None:
+                self.manifest.remove(source)
+            elif not failed_ids.intersection(entry[1]):
+                self.manifest.update(source, *entry)
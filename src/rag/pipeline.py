@@ -1,3 +1,4 @@
+import json
 import sys
 from pathlib import Path
 
@@ -6,48 +7,143 @@ project_root = Path(__file__).parent
 sys.path.insert(0, str(project_root))
 
 from .retriever import VectorStore
-from .index import DocumentChunker
-from typing import List, Dict
+from .backends import make_backend
+from .index import make_chunker
+from .ingest import EmbeddingFunction, IngestReport
+from .manifest import ManifestSync
+from .loaders import load_documents
+from .query_cache import QueryCache
+from .rerank import make_reranker
+from typing import Any, Iterable, List, Dict, Optional
 
 class RAGPipeline:
-    def __init__(self, config):
-        self.chunker = DocumentChunker(
-            chunk_size=config.chunk_size,
-            overlap=config.chunk_overlap
-        )
+    def __init__(self, config, embedding_function: Optional[EmbeddingFunction] = None):
+        self.chunker = make_chunker(config)
         
         self.vector_store = VectorStore(
-            collection_name=config.collection_name
+            collection_name=config.collection_name,
+            persist_dir=config.persist_dir,
+            embedding_function=embedding_function,
+            embedding_model=config.embedding_model,
+            embedding_provider=config.embedding_provider,
+            backend=make_backend(config),
+            batch_size=config.embedding_batch_size,
+            max_workers=config.embedding_workers,
+            max_retries=config.embedding_max_retries,
+            cache_dir=config.embedding_cache_dir or None,
+            cache_size=config.embedding_cache_size,
+            retrieval_mode=config.retrieval_mode,
+            rrf_k=config.rrf_k,
+            hedge_after=config.embedding_hedge_after_ms / 1000 if config.embedding_hedge_after_ms else None,
+            rpm=config.embedding_rpm,
+            tpm=config.embedding_tpm,
+            rate_limit_path=config.rate_limit_path
         )
         
+        # Optional rerank of over-fetched candidates
+        self.reranker = make_reranker(config)
+        
+        # Repeated (or near-identical) queries skip embedding and search
+        self.query_cache = None
+        if config.query_cache_size:
+            self.query_cache = QueryCache(
+                max_entries=config.query_cache_size,
+                ttl_seconds=config.query_cache_ttl,
+                similarity_threshold=config.query_cache_similarity,
+                embedding_function=self.vector_store.embedding_function
+            )
+        
         print("RAG Agent Initialized")
         
-    def ingest_documents(self, documents: List[Dict]):
+    def ingest_documents(self, documents: Iterable[Dict], prune: bool = False) -> IngestReport:
         """
         Ingest documents into the knowledge base
         
+        Only new or changed documents are chunked, only chunks that aren't
+        stored yet are embedded, and chunks a document no longer has are deleted.
+        Documents may be a lazy iterator: they are chunked as they arrive and
+        embedded in bounded batches, so memory stays flat for any corpus size.
+        
         Args:
-            documents: List of dicts with 'content', 'source', 'title'
+            documents: Iterable of dicts with 'content', 'source', 'title'. The source
+                identifies a document across runs; repeats within one run are skipped
+            prune: Also delete previously ingested documents missing from `documents`
         """
-        print(f"\n📥 Ingesting {len(documents)} documents...")
+        if hasattr(documents, "__len__"):
+            print(f"\n📥 Ingesting {len(documents)} documents...")
+        else:
+            print("\n📥 Ingesting document stream...")
         
-        # Chunk documents
-        chunks = self.chunker.chunk_documents(documents)
+        report = IngestReport()
+        sync = ManifestSync(self.vector_store.manifest)
         
-        # Add to vector store
-        self.vector_store.add_chunks(chunks)
+        # Chunk changed documents, then embed in batches and add to vector store
+        changed = sync.changed_documents(documents)
+        chunks = sync.changed_chunks(self.chunker.iter_document_chunks(changed))
+        self.vector_store.add_chunks(chunks, report)
+        
+        if prune:
+            sync.prune_missing()
+        
+        report.skipped_documents = sync.skipped
+        report.duplicate_documents = sync.duplicates
+        report.deleted_chunks = self.vector_store.delete(sync.stale_ids)
+        sync.commit(report.failed_ids)
+        report.print_summary()
         
         print("Documents ingested successfully")
+        return report
         
-    def retrieve(self, query: str, top_k: int) -> List[Dict]:
-        """Retrieve relevant chunk for a query"""
-        print(f"\n🔍 Searching for: '{query}'")
+    def ingest_from(self, location: str, prune: bool = False, root: Optional[str] = None) -> IngestReport:
+        """
+        Stream documents from a directory, a JSONL file or a glob pattern into the knowledge base.
+        With a `root`, files resolving outside it are never read.
+        """
+        return self.ingest_documents(load_documents(location, root=root), prune=prune)
         
-        chunks = self.vector_store.search(query, top_k=3)
+    def retrieve(self, query: str, top_k: int, where: Optional[Dict[str, Any]] = None) -> List[Dict]:
+        """Retrieve relevant chunk for a query, optionally only among chunks whose metadata matches `where`"""
+        print(f"\n🔍 Searching for: '{query}'" + (f" where {where}" if where else ""))
         
-        print(f"📚 Found {len(chunks)} relevant chunks")
+        chunks = self.retrieve_batch([query], top_k=top_k, where=where)[0]
         
         for i, chunk in enumerate(chunks, 1):
             print(f"  {i}. {chunk['metadata'].get('source', 'unknown')} (distance: {chunk.get('distance', 0):.3f})")
             
-        return chunks
\ No newline at end of file
+        return chunks
+    
+    def retrieve_batch(
+        self, queries: List[str], top_k: int, where: Optional[Dict[str, Any]] = None
+    ) -> List[List[Dict]]:
+        """
+        Retrieve relevant chunks for several queries at once.
+        
+        Cached queries are answered directly; the rest share one embedding
+        call and one vector store query. With a rerank stage, more
+        candidates are fetched and reranked down to top_k. A `where`
+        metadata filter applies to every query and is applied before scoring.
+        """
+        params = (top_k, self.vector_store.retrieval_mode, json.dumps(where, sort_keys=True) if where else None)
+        version = self.vector_store.version
+        results: List[Optional[List[Dict]]] = [None] * len(queries)
+        
+        if self.query_cache is not None:
+            for i, query in enumerate(queries):
+                results[i] = self.query_cache.get(query, params, version)
+        
+        cached = sum(r is not None for r in results)
+        
+        # Search each distinct uncached query once
+        misses = list(dict.fromkeys(q for q, r in zip(queries, results) if r is None))
+        if misses:
+            n_candidates = self.reranker.candidates(top_k) if self.reranker else top_k
+            found = dict(zip(misses, self.vector_store.search_many(misses, top_k=n_candidates, where=where)))
+            for query, chunks in found.items():
+                if self.reranker:
+                    found[query] = chunks = self.reranker.apply(query, chunks, top_k)
+                if self.query_cache is not None:
+                    self.query_cache.put(query, params, version, chunks)
+            results = [r if r is not None else found[q] for q, r in zip(queries, results)]
+        
+        print(f"📚 Found {sum(len(r) for r in results)} relevant chunks ({cached} of {len(queries)} queries cached)")
+        return results
@@ -0,0 +1,128 @@
+# Query-result cache for retrieval
+import threading
+from collections import OrderedDict
+from time import monotonic
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from .embedding_cache import normalize_text
+from .ingest import EmbeddingFunction
+
+
+class QueryCache:
+    """
+    TTL + LRU cache of retrieval results.
+
+    Exact tier: keyed by the normalized query and its search parameters.
+    Near-duplicate tier (optional): a miss falls back to the cached query
+    whose embedding is most similar, if it clears `similarity_threshold`.
+    Entries are dropped as soon as the collection version they were
+    computed against changes.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 1024,
+        ttl_seconds: float = 300.0,
+        similarity_threshold: Optional[float] = None,
+        embedding_function: Optional[EmbeddingFunction] = None,
+    ):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.similarity_threshold = similarity_threshold if embedding_function else None
+        self.embedding_function = embedding_function
+
+        self.hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+
+        self._lock = threading.Lock()
+        self._version = None
+        # key -> (results, expires_at, unit query embedding or None)
+        self._entries: "OrderedDict[Tuple, Tuple[List[Dict], float, Optional[np.ndarray]]]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @staticmethod
+    def _key(query: str, params: Tuple) -> Tuple:
+        return (normalize_text(query).lower(), *params)
+
+    def _embed(self, query: str) -> np.ndarray:
+        vector = np.asarray(self.embedding_function([query])[0], dtype=np.float32)
+        return vector / (np.linalg.norm(vector) or 1.0)
+
+    def _sync_version(self, version: Any):
+        if version != self._version:
+            self._entries.clear()
+            self._version = version
+
+    def get(self, query: str, params: Tuple, version: Any) -> Optional[List[Dict]]:
+        """Cached results for a query, or None"""
+        key = self._key(query, params)
+        now = monotonic()
+
+        with self._lock:
+            self._sync_version(version)
+
+            entry = self._entries.get(key)
+            if entry and entry[1] > now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return [dict(chunk) for chunk in entry[0]]
+
+        if self.similarity_threshold is not None:
+            results = self._get_similar(query, params, now)
+            if results is not None:
+                return results
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def _get_similar(self, query: str, params: Tuple, now: float) -> Optional[List[Dict]]:
+        vector = self._embed(query)
+
+        with self._lock:
+            candidates = [
+                (key, entry) for key, entry in self._entries.items()
+                if key[1:] == params and entry[1] > now and entry[2] is not None
+            ]
+            if not candidates:
+                return None
+
+            similarities = np.stack([entry[2] for _, entry in candidates]) @ vector
+            best = int(np.argmax(similarities))
+            if similarities[best] < self.similarity_threshold:
+                return None
+
+            key, entry = candidates[best]
+            self._entries.move_to_end(key)
+            self.semantic_hits += 1
+            return [dict(chunk) for chunk in entry[0]]
+
+    def put(self, query: str, params: Tuple, version: Any, results: List[Dict]):
+        key = self._key(query, params)
+        vector = self._embed(query) if self.similarity_threshold is not None else None
+
+        with self._lock:
+            self._sync_version(version)
+            self._entries[key] = (results, monotonic() + self.ttl_seconds, vector)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.semantic_hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "semantic_hits": self.semantic_hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits + self.semantic_hits) / lookups if lookups else 0.0,
+        }
@@ -0,0 +1,224 @@
+# Client-side RPM/TPM limiter for OpenAI traffic
+import asyncio
+import heapq
+import itertools
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from .index import get_encoding
+
+# Lower is served first. Bulk work also leaves `bulk_reserve` of each bucket to interactive calls
+PRIORITIES = {"interactive": 0, "bulk": 1}
+
+_priority: ContextVar[str] = ContextVar("rate_limit_priority", default="interactive")
+
+
+@contextmanager
+def priority(name: str):
+    """Run the enclosed calls at a priority class (e.g. "bulk" for ingestion)"""
+    token = _priority.set(name)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def current_priority() -> str:
+    return _priority.get()
+
+
+def estimate_tokens(texts: List[str], model: str = "text-embedding-3-small") -> int:
+    encoding = get_encoding(model)
+    return sum(len(encoding.encode(text)) for text in texts)
+
+
+def estimate_chat_tokens(request: Dict) -> int:
+    """Prompt tokens plus max_tokens, which is what TPM limits are charged against"""
+    texts = []
+    for message in request.get("messages", []):
+        for value in message.values():
+            if value:
+                texts.append(str(value))
+    return estimate_tokens(texts, request.get("model", "gpt-4o-mini")) + 4 * len(texts) + request.get("max_tokens", 0)
+
+
+class _MemoryBuckets:
+    """Bucket levels for one process"""
+
+    def __init__(self, name: str, rates: Dict[str, Tuple[float, float]]):
+        self.rates = rates
+        now = time.time()
+        self._levels = {bucket: (capacity, now) for bucket, (capacity, _) in rates.items()}
+
+    def _load(self) -> Dict[str, Tuple[float, float]]:
+        return self._levels
+
+    def _store(self, levels: Dict[str, Tuple[float, float]]):
+        self._levels = levels
+
+    def take(self, costs: Dict[str, float], floor: float) -> float:
+        """
+        Take every cost at once if each bucket stays above floor * capacity.
+        Returns 0 when taken, else the seconds until it could be.
+        """
+        now = time.time()
+        stored = self._load()
+        levels, wait = {}, 0.0
+        for bucket, (capacity, per_second) in self.rates.items():
+            level, updated_at = stored.get(bucket, (capacity, now))
+            level = min(capacity, level + (now - updated_at) * per_second)
+            cost = min(costs.get(bucket, 0.0), capacity * (1 - floor))
+            shortfall = cost + floor * capacity - level
+            if shortfall > 0:
+                wait = max(wait, shortfall / per_second)
+            levels[bucket] = (level - cost, now)
+
+        if wait == 0:
+            self._store(levels)
+        return wait
+
+
+class _SQLiteBuckets(_MemoryBuckets):
+    """Bucket levels in a sqlite file, shared by every process on the host"""
+
+    def __init__(self, name: str, rates: Dict[str, Tuple[float, float]], path: str):
+        super().__init__(name, rates)
+        self.name = name
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS buckets (name TEXT PRIMARY KEY, level REAL NOT NULL, updated_at REAL NOT NULL)"
+        )
+
+    def _key(self, bucket: str) -> str:
+        return f"{self.name}:{bucket}"
+
+    def _load(self) -> Dict[str, Tuple[float, float]]:
+        rows = self._conn.execute(
+            f"SELECT name, level, updated_at FROM buckets WHERE name IN ({','.join('?' * len(self.rates))})",
+            [self._key(bucket) for bucket in self.rates],
+        ).fetchall()
+        by_key = {name: (level, updated_at) for name, level, updated_at in rows}
+        return {bucket: by_key[self._key(bucket)] for bucket in self.rates if self._key(bucket) in by_key}
+
+    def _store(self, levels: Dict[str, Tuple[float, float]]):
+        self._conn.executemany(
+            "INSERT OR REPLACE INTO buckets VALUES (?, ?, ?)",
+            [(self._key(bucket), level, updated_at) for bucket, (level, updated_at) in levels.items()],
+        )
+
+    def take(self, costs: Dict[str, float], floor: float) -> float:
+        # Read-modify-write under the database write lock, so processes can't double-spend
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            wait = super().take(costs, floor)
+            self._conn.execute("COMMIT")
+        except BaseException:
+            self._conn.execute("ROLLBACK")
+            raise
+        return wait
+
+
+class RateLimiter:
+    """
+    Requests-per-minute and tokens-per-minute token buckets for one endpoint.
+
+    Waiters are served by priority class, then arrival order. Threads and
+    coroutines share the same queue; with `path` set, bucket levels live in
+    a sqlite file so all workers on the host draw from one budget.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        rpm: Optional[int] = None,
+        tpm: Optional[int] = None,
+        path: Optional[str] = None,
+        bulk_reserve: float = 0.2,
+    ):
+        self.name = name
+        self.bulk_reserve = bulk_reserve
+
+        rates = {}
+        if rpm:
+            rates["requests"] = (float(rpm), rpm / 60.0)
+        if tpm:
+            rates["tokens"] = (float(tpm), tpm / 60.0)
+        self._buckets = _SQLiteBuckets(name, rates, path) if path else _MemoryBuckets(name, rates)
+
+        self._lock = threading.Lock()
+        self._waiters: List[Tuple[int, int]] = []
+        self._tickets = itertools.count()
+
+        self.waited_seconds = 0.0
+
+    def _enqueue(self, priority_name: Optional[str]) -> Tuple[int, int]:
+        ticket = (PRIORITIES.get(priority_name or _priority.get(), 0), next(self._tickets))
+        with self._lock:
+            heapq.heappush(self._waiters, ticket)
+        return ticket
+
+    def _dequeue(self, ticket: Tuple[int, int]):
+        with self._lock:
+            if ticket in self._waiters:
+                self._waiters.remove(ticket)
+                heapq.heapify(self._waiters)
+
+    def _try(self, ticket: Tuple[int, int], tokens: int) -> float:
+        with self._lock:
+            if self._waiters[0] != ticket:
+                return 0.01
+            floor = self.bulk_reserve if ticket[0] > 0 else 0.0
+            wait = self._buckets.take({"requests": 1, "tokens": tokens}, floor)
+            if wait == 0:
+                heapq.heappop(self._waiters)
+            return wait
+
+    def acquire(self, tokens: int = 0, priority: Optional[str] = None):
+        """Block until one request of `tokens` tokens fits the budget"""
+        ticket = self._enqueue(priority)
+        start = time.monotonic()
+        try:
+            while True:
+                wait = self._try(ticket, tokens)
+                if wait == 0:
+                    break
+                time.sleep(min(wait, 0.25))
+        finally:
+            self._dequeue(ticket)
+        self.waited_seconds += time.monotonic() - start
+
+    async def aacquire(self, tokens: int = 0, priority: Optional[str] = None):
+        ticket = self._enqueue(priority)
+        start = time.monotonic()
+        # Shared buckets take a sqlite write lock, which must not stall the event loop
+        blocking = isinstance(self._buckets, _SQLiteBuckets)
+        try:
+            while True:
+                wait = await asyncio.to_thread(self._try, ticket, tokens) if blocking else self._try(ticket, tokens)
+                if wait == 0:
+                    break
+                await asyncio.sleep(min(wait, 0.25))
+        finally:
+            self._dequeue(ticket)
+        self.waited_seconds += time.monotonic() - start
+
+
+_limiters: Dict[str, RateLimiter] = {}
+_limiters_lock = threading.Lock()
+
+
+def get_limiter(name: str, rpm: Optional[int] = None, tpm: Optional[int] = None, path: Optional[str] = None) -> Optional[RateLimiter]:
+    """Process-wide limiter per endpoint, or None when no limits are configured"""
+    if not (rpm or tpm):
+        return None
+    with _limiters_lock:
+        if name not in _limiters:
+            _limiters[name] = RateLimiter(name, rpm=rpm, tpm=tpm, path=path)
+        return _limiters[name]
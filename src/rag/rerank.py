@@ -0,0 +1,161 @@
+# Rerank stage: rescore over-fetched candidates before they reach the LLM
+import threading
+from time import perf_counter
+from typing import Dict, List, Optional, Set
+
+from .sparse import tokenize
+
+
+class Reranker:
+    """Rescore candidate chunks for a query. Subclasses implement `scores`"""
+
+    def scores(self, query: str, chunks: List[Dict]) -> List[float]:
+        raise NotImplementedError
+
+    def rerank(self, query: str, chunks: List[Dict], top_k: int) -> List[Dict]:
+        scores = self.scores(query, chunks)
+        order = sorted(range(len(chunks)), key=lambda i: scores[i], reverse=True)
+        return [{**chunks[i], "rerank_score": scores[i]} for i in order[:top_k]]
+
+
+class LexicalReranker(Reranker):
+    """
+    Blend query-term coverage with the retriever's own ranking.
+    `alpha` is the weight of coverage; the rest goes to the original rank.
+    """
+
+    def __init__(self, alpha: float = 0.5):
+        self.alpha = alpha
+
+    def scores(self, query: str, chunks: List[Dict]) -> List[float]:
+        return self._relevance(set(tokenize(query)), [set(tokenize(chunk["text"])) for chunk in chunks])
+
+    def _relevance(self, query_terms: Set[str], chunk_terms: List[Set[str]]) -> List[float]:
+        n = len(chunk_terms)
+        scores = []
+        for rank, terms in enumerate(chunk_terms):
+            coverage = len(query_terms & terms) / len(query_terms) if query_terms else 0.0
+            prior = 1.0 - rank / n
+            scores.append(self.alpha * coverage + (1 - self.alpha) * prior)
+        return scores
+
+
+class MMRReranker(LexicalReranker):
+    """
+    Maximal marginal relevance over lexical scores: each pick trades
+    relevance against token overlap with chunks already picked, so
+    near-duplicate chunks (e.g. from chunk overlap) don't crowd the context.
+    """
+
+    def __init__(self, alpha: float = 0.5, diversity: float = 0.3):
+        super().__init__(alpha)
+        self.diversity = diversity
+
+    def rerank(self, query: str, chunks: List[Dict], top_k: int) -> List[Dict]:
+        terms: List[Set[str]] = [set(tokenize(chunk["text"])) for chunk in chunks]
+        relevance = self._relevance(set(tokenize(query)), terms)
+
+        selected: List[int] = []
+        remaining = list(range(len(chunks)))
+        picked_scores = []
+        while remaining and len(selected) < top_k:
+            def mmr(i: int) -> float:
+                redundancy = max((_jaccard(terms[i], terms[j]) for j in selected), default=0.0)
+                return (1 - self.diversity) * relevance[i] - self.diversity * redundancy
+
+            best = max(remaining, key=mmr)
+            picked_scores.append(mmr(best))
+            selected.append(best)
+            remaining.remove(best)
+
+        return [{**chunks[i], "rerank_score": score} for i, score in zip(selected, picked_scores)]
+
+
+class CrossEncoderReranker(Reranker):
+    """Score (query, chunk) pairs with a small local cross-encoder (needs sentence-transformers)"""
+
+    def __init__(self, model_name: str = "cross-encoder/ms-marco-MiniLM-L-6-v2"):
+        try:
+            from sentence_transformers import CrossEncoder
+        except ImportError as e:
+            raise ImportError(
+                "CrossEncoderReranker needs sentence-transformers: pip install sentence-transformers"
+            ) from e
+
+        self.model = CrossEncoder(model_name)
+
+    def scores(self, query: str, chunks: List[Dict]) -> List[float]:
+        return [float(s) for s in self.model.predict([(query, chunk["text"]) for chunk in chunks])]
+
+
+def _jaccard(a: Set[str], b: Set[str]) -> float:
+    return len(a & b) / len(a | b) if a or b else 0.0
+
+
+class RerankStage:
+    """
+    Over-fetch candidates and rerank them within a latency budget.
+
+    The stage keeps a running estimate of rerank cost per candidate. When
+    the estimate says a call would blow `budget_ms`, it returns the
+    retriever's order instead, re-measuring every `probe_every` skipped calls.
+    """
+
+    def __init__(self, reranker: Reranker, overfetch: int = 3, budget_ms: float = 50.0, probe_every: int = 50):
+        self.reranker = reranker
+        self.overfetch = overfetch
+        self.budget_ms = budget_ms
+        self.probe_every = probe_every
+
+        self.reranked = 0
+        self.fallbacks = 0
+        self._ms_per_candidate: Optional[float] = None
+        self._skipped_since_probe = 0
+        self._lock = threading.Lock()
+
+    def candidates(self, top_k: int) -> int:
+        """How many candidates to fetch for a final top_k"""
+        return top_k * self.overfetch
+
+    def apply(self, query: str, chunks: List[Dict], top_k: int) -> List[Dict]:
+        if len(chunks) <= 1:
+            return chunks[:top_k]
+
+        with self._lock:
+            predicted = self._ms_per_candidate * len(chunks) if self._ms_per_candidate else 0.0
+            if predicted > self.budget_ms and self._skipped_since_probe < self.probe_every:
+                self._skipped_since_probe += 1
+                self.fallbacks += 1
+                return chunks[:top_k]
+            self._skipped_since_probe = 0
+
+        start = perf_counter()
+        reranked = self.reranker.rerank(query, chunks, top_k)
+        elapsed_ms = (perf_counter() - start) * 1000
+
+        with self._lock:
+            per_candidate = elapsed_ms / len(chunks)
+            self._ms_per_candidate = (
+                per_candidate if self._ms_per_candidate is None
+                else 0.8 * self._ms_per_candidate + 0.2 * per_candidate
+            )
+            self.reranked += 1
+
+        return reranked
+
+
+def make_reranker(config) -> Optional[RerankStage]:
+    """Build the rerank stage selected by RagConfig.rerank_strategy"""
+    rerankers = {
+        "lexical": LexicalReranker,
+        "mmr": MMRReranker,
+        "cross_encoder": CrossEncoderReranker,
+    }
+    if config.rerank_strategy not in rerankers:
+        return None
+
+    return RerankStage(
+        rerankers[config.rerank_strategy](),
+        overfetch=config.rerank_overfetch,
+        budget_ms=config.rerank_budget_ms
+    )
@@ -0,0 +1,298 @@
+# Resilience for upstream API calls (chat completions, embeddings):
+# error classification, Retry-After aware backoff, circuit breakers, hedging
+import asyncio
+import logging
+import random
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from email.utils import parsedate_to_datetime
+from datetime import datetime, timezone
+from time import monotonic
+from typing import Awaitable, Callable, Dict, List, Optional, TypeVar
+
+import openai
+from tenacity import AsyncRetrying, Retrying, before_sleep_log, retry_if_exception, stop_after_attempt
+
+from .rate_limit import RateLimiter, current_priority, estimate_tokens
+
+T = TypeVar("T")
+
+_TRANSIENT_STATUS = {408, 409, 429}
+
+
+class CircuitOpenError(RuntimeError):
+    """Upstream is failing; calls are refused until the breaker's cool-down ends"""
+
+
+def is_transient(error: BaseException) -> bool:
+    """Worth retrying: rate limits, timeouts, connection errors and 5xx"""
+    if isinstance(error, (openai.APITimeoutError, openai.APIConnectionError)):
+        return True
+    if isinstance(error, openai.APIStatusError):
+        return error.status_code in _TRANSIENT_STATUS or error.status_code >= 500
+    return isinstance(error, (TimeoutError, ConnectionError))
+
+
+def retry_after(error: BaseException) -> Optional[float]:
+    """Seconds the server asked us to wait, from retry-after-ms / retry-after headers"""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000
+        value = headers.get("retry-after")
+        if not value:
+            return None
+        try:
+            return float(value)
+        except ValueError:
+            return (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds()
+    except (TypeError, ValueError):
+        return None
+
+
+class wait_retry_after:
+    """Tenacity wait: the server's Retry-After if given, else full-jitter exponential backoff"""
+
+    def __init__(self, base: float = 0.5, max_wait: float = 30.0):
+        self.base = base
+        self.max_wait = max_wait
+
+    def __call__(self, retry_state) -> float:
+        backoff = random.uniform(0, min(self.max_wait, self.base * 2 ** retry_state.attempt_number))
+        requested = retry_after(retry_state.outcome.exception())
+        if requested is not None and requested > 0:
+            return min(self.max_wait, requested + random.uniform(0, 0.1 * requested))
+        return backoff
+
+
+class CircuitBreaker:
+    """
+    Opens after `failure_threshold` consecutive transient failures and
+    refuses calls for `reset_timeout` seconds. Then one trial call is let
+    through (half-open): success closes the breaker, failure re-opens it.
+    """
+
+    def __init__(self, name: str, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._trial_in_flight = False
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._opened_at is None:
+                return "closed"
+            return "half_open" if monotonic() - self._opened_at >= self.reset_timeout else "open"
+
+    def before_call(self):
+        with self._lock:
+            if self._opened_at is None:
+                return
+            if monotonic() - self._opened_at < self.reset_timeout or self._trial_in_flight:
+                raise CircuitOpenError(f"Circuit '{self.name}' is open")
+            self._trial_in_flight = True
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_in_flight = False
+
+    def release(self):
+        """The call ended without telling us anything (e.g. it was cancelled)"""
+        with self._lock:
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._trial_in_flight = False
+            if self._opened_at is not None or self._failures >= self.failure_threshold:
+                if self._opened_at is None:
+                    print(f"⚠️  Circuit '{self.name}' opened after {self._failures} failures")
+                self._opened_at = monotonic()
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(name: str, failure_threshold: int = 5, reset_timeout: float = 30.0) -> CircuitBreaker:
+    """Process-wide breaker per endpoint, so every caller of an endpoint sees its health"""
+    with _breakers_lock:
+        if name not in _breakers:
+            _breakers[name] = CircuitBreaker(name, failure_threshold, reset_timeout)
+        return _breakers[name]
+
+
+_hedge_pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix="hedge")
+
+
+class ResiliencePolicy:
+    """
+    How one endpoint is called: each attempt passes the endpoint's circuit
+    breaker and, with `hedge_after` set, sends a duplicate request if the
+    first hasn't answered within that many seconds (first answer wins).
+    Every request sent upstream (retries and hedges included) first waits
+    for the endpoint's rate limiter, if any. Only transient failures are
+    retried, honouring Retry-After.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        max_attempts: int = 3,
+        max_wait: float = 30.0,
+        failure_threshold: int = 5,
+        reset_timeout: float = 30.0,
+        hedge_after: Optional[float] = None,
+        limiter: Optional[RateLimiter] = None,
+        logger: Optional[logging.Logger] = None,
+    ):
+        self.name = name
+        self.limiter = limiter
+        self.max_attempts = max_attempts
+        self.max_wait = max_wait
+        self.hedge_after = hedge_after
+        self.breaker = get_breaker(name, failure_threshold, reset_timeout)
+        self.logger = logger or logging.getLogger(name)
+
+    def _retry_kwargs(self) -> dict:
+        return dict(
+            retry=retry_if_exception(is_transient),
+            wait=wait_retry_after(max_wait=self.max_wait),
+            stop=stop_after_attempt(self.max_attempts),
+            reraise=True,
+            before_sleep=before_sleep_log(self.logger, logging.WARNING),
+        )
+
+    def retrying(self) -> Retrying:
+        """Tenacity loop for callers that drive attempts themselves"""
+        return Retrying(**self._retry_kwargs())
+
+    def _record(self, error: Optional[BaseException]):
+        if error is not None and is_transient(error):
+            self.breaker.record_failure()
+        elif error is None or isinstance(error, openai.APIStatusError):
+            # A client error (bad request, auth) still means upstream answered
+            self.breaker.record_success()
+        else:
+            # Cancelled, refused by a breaker, or failed before reaching upstream: no verdict
+            self.breaker.release()
+
+    def _limited(self, fn: Callable[[], T], tokens: int) -> Callable[[], T]:
+        if self.limiter is None:
+            return fn
+
+        # Captured here: the hedge pool's threads don't inherit the caller's context
+        priority_name = current_priority()
+
+        def limited():
+            self.limiter.acquire(tokens, priority_name)
+            return fn()
+        return limited
+
+    def attempt(self, fn: Callable[[], T], hedge: bool = True, tokens: int = 0) -> T:
+        """One attempt through the breaker (hedged if configured)"""
+        self.breaker.before_call()
+        if self.limiter is not None:
+            try:
+                self.limiter.acquire(tokens)
+            except BaseException:
+                # Failed or cancelled waiting on our own budget: free a half-open trial
+                self.breaker.release()
+                raise
+        try:
+            result = self._hedged(fn, self._limited(fn, tokens)) if hedge and self.hedge_after else fn()
+        except BaseException as e:
+            self._record(e)
+            raise
+        self._record(None)
+        return result
+
+    def _hedged(self, fn: Callable[[], T], duplicate: Callable[[], T]) -> T:
+        futures = [_hedge_pool.submit(fn)]
+        done, _ = wait(futures, timeout=self.hedge_after)
+        if not done:
+            futures.append(_hedge_pool.submit(duplicate))
+
+        pending = set(futures)
+        while True:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            succeeded = [future for future in done if future.exception() is None]
+            if succeeded or not pending:
+                # The slower duplicate keeps running; its result is dropped
+                return (succeeded or list(done))[0].result()
+
+    def call(self, fn: Callable[[], T], hedge: bool = True, tokens: int = 0) -> T:
+        for attempt in self.retrying():
+            with attempt:
+                return self.attempt(fn, hedge, tokens)
+
+    def _alimited(self, fn: Callable[[], Awaitable[T]], tokens: int) -> Callable[[], Awaitable[T]]:
+        if self.limiter is None:
+            return fn
+
+        async def limited():
+            await self.limiter.aacquire(tokens)
+            return await fn()
+        return limited
+
+    async def aattempt(self, fn: Callable[[], Awaitable[T]], hedge: bool = True, tokens: int = 0) -> T:
+        self.breaker.before_call()
+        if self.limiter is not None:
+            try:
+                await self.limiter.aacquire(tokens)
+            except BaseException:
+                self.breaker.release()
+                raise
+        try:
+            result = await (self._ahedged(fn, self._alimited(fn, tokens)) if hedge and self.hedge_after else fn())
+        except BaseException as e:
+            self._record(e)
+            raise
+        self._record(None)
+        return result
+
+    async def _ahedged(self, fn: Callable[[], Awaitable[T]], duplicate: Callable[[], Awaitable[T]]) -> T:
+        tasks = [asyncio.ensure_future(fn())]
+        done, _ = await asyncio.wait(tasks, timeout=self.hedge_after)
+        if not done:
+            tasks.append(asyncio.ensure_future(duplicate()))
+
+        pending = set(tasks)
+        try:
+            while True:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                succeeded = [task for task in done if task.exception() is None]
+                if succeeded or not pending:
+                    return (succeeded or list(done))[0].result()
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def acall(self, fn: Callable[[], Awaitable[T]], hedge: bool = True, tokens: int = 0) -> T:
+        async for attempt in AsyncRetrying(**self._retry_kwargs()):
+            with attempt:
+                return await self.aattempt(fn, hedge, tokens)
+
+
+class ResilientEmbeddingFunction:
+    """Embedding function whose calls go through a policy's breaker and hedging (retries stay with the caller)"""
+
+    def __init__(self, embedding_function: Callable[[List[str]], List[List[float]]], policy: ResiliencePolicy):
+        self.embedding_function = embedding_function
+        self.policy = policy
+
+    def __call__(self, texts: List[str]) -> List[List[float]]:
+        tokens = estimate_tokens(texts) if self.policy.limiter else 0
+        return self.policy.attempt(lambda: self.embedding_function(texts), tokens=tokens)
@@ -1,76 +1,267 @@
 # Vector/ hybrid search logic -> right now embedding in this file because we are using chromaDB 
 from pathlib import Path
-import chromadb
-from chromadb.utils import embedding_functions
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Iterable, Optional
 import os
 from dotenv import load_dotenv
 
+from .backends import ChromaBackend, VectorBackend
+from .ingest import BatchEmbedder, EmbeddingFunction, IngestReport
+from .filters import validate_where
+from .index import make_chunk_id
+from .embedding_cache import CachedEmbeddingFunction, EmbeddingCache
+from .manifest import IngestManifest
+from .rate_limit import get_limiter
+from .resilience import ResiliencePolicy, ResilientEmbeddingFunction
+from .sparse import BM25Index, reciprocal_rank_fusion
+
 load_dotenv()
 
 filename = Path(".\knowledge_base")
+
+
+def default_embedding_function(provider: str, model: str) -> EmbeddingFunction:
+    """OpenAI embeddings, or a local sentence-transformers model that needs no network"""
+    if provider == "sentence_transformers":
+        try:
+            from sentence_transformers import SentenceTransformer
+        except ImportError as e:
+            raise ImportError(
+                "Local embeddings need sentence-transformers: pip install sentence-transformers"
+            ) from e
+        encoder = SentenceTransformer(model)
+        return lambda texts: encoder.encode(texts, normalize_embeddings=True).tolist()
+    
+    from chromadb.utils import embedding_functions
+    return embedding_functions.OpenAIEmbeddingFunction(
+        api_key=os.getenv("OPENAI_API_KEY"),
+        model_name=model
+    )
+
+
 class VectorStore:
     """Store and retrieve document embeddings"""
-    def __init__(self, collection_name: str = "knowledge_base", persist_dir: str = "./chroma_db"):
-        self.client = chromadb.PersistentClient(path=persist_dir)
+    def __init__(
+        self,
+        collection_name: str = "knowledge_base",
+        persist_dir: str = "./chroma_db",
+        embedding_function: Optional[EmbeddingFunction] = None,
+        embedding_model: str = "text-embedding-3-small",
+        embedding_provider: str = "openai",
+        backend: Optional[VectorBackend] = None,
+        batch_size: int = 100,
+        max_workers: int = 4,
+        max_retries: int = 3,
+        cache_dir: Optional[str] = "./embedding_cache",
+        cache_size: int = 100_000,
+        retrieval_mode: str = "hybrid",
+        rrf_k: int = 60,
+        hedge_after: Optional[float] = None,
+        rpm: Optional[int] = None,
+        tpm: Optional[int] = None,
+        rate_limit_path: Optional[str] = None,
+    ):
+        # A chromadb collection unless another backend (e.g. the native numpy one) is given
+        self.backend = backend or ChromaBackend(persist_dir, collection_name)
+        
+        # Using the configured provider unless a function is injected (e.g. a stub in tests)
+        if embedding_function is None:
+            embedding_function = default_embedding_function(embedding_provider, embedding_model)
         
-        # Using openai embeddings
-        openai_ef = embedding_functions.OpenAIEmbeddingFunction(
-            api_key=os.getenv("OPENAI_API_KEY"),
-            model_name="text-embedding-3-small"
+        # Upstream calls pass the embeddings circuit breaker (and hedging);
+        # retries happen per ingest batch and per search
+        self.embedding_policy = ResiliencePolicy(
+            "embeddings",
+            max_attempts=max_retries,
+            hedge_after=hedge_after,
+            limiter=get_limiter("embeddings", rpm=rpm, tpm=tpm, path=rate_limit_path),
         )
+        embedding_function = ResilientEmbeddingFunction(embedding_function, self.embedding_policy)
         
-        # Get or create collection
-        self.collection = self.client.get_or_create_collection(
-            name=collection_name,
-            embedding_function=openai_ef
+        # Re-ingests and repeated queries are served from disk instead of re-embedding
+        if cache_dir:
+            embedding_function = CachedEmbeddingFunction(
+                embedding_function,
+                EmbeddingCache(cache_dir, model_name=embedding_model, max_entries=cache_size)
+            )
+        self.embedding_function = embedding_function
+        
+        self.embedder = BatchEmbedder(
+            embedding_function,
+            batch_size=batch_size,
+            max_workers=max_workers,
+            max_retries=max_retries,
+            policy=self.embedding_policy,
         )
         
+        # Which chunk IDs each document currently has in the collection
+        self.manifest = IngestManifest(str(Path(persist_dir) / f"{collection_name}.manifest.sqlite"))
+        
+        # Bumped on every write so result caches know when they are stale
+        self.version = 0
+        
+        # Keyword index over the same chunk IDs, for sparse and hybrid search
+        self.retrieval_mode = retrieval_mode
+        self.rrf_k = rrf_k
+        self.sparse = BM25Index(str(Path(persist_dir) / f"{collection_name}.bm25.npz"))
+        if not len(self.sparse) and self.backend.count():
+            self._rebuild_sparse()
+        
+        self.collection_name = collection_name
         print(f"[OK] Vector store initialized: {collection_name}")
-        print(f"   Documents: {self.collection.count()}")
+        print(f"   Documents: {self.backend.count()}")
         
-    def add_chunks(self, chunks: List[Dict]):
-        """Add document chunks to vector store"""
-        if not chunks:
+    def add_chunks(self, chunks: Iterable[Dict], report: Optional[IngestReport] = None) -> IngestReport:
+        """Embed chunks in concurrent batches and upsert them into vector store"""
+        report = report or IngestReport()
+        
+        try:
+            for batch, embeddings in self.embedder.embed(self._with_ids(chunks), report):
+                # Embeddings are precomputed, so the backend only stores them.
+                # Upsert keeps re-ingesting the same chunk IDs idempotent
+                self.backend.upsert(
+                    ids=[chunk["id"] for chunk in batch],
+                    embeddings=embeddings,
+                    documents=[chunk["text"] for chunk in batch],
+                    metadatas=[chunk["metadata"] for chunk in batch]
+                )
+                self.sparse.add([chunk["id"] for chunk in batch], [chunk["text"] for chunk in batch])
+                self.version += 1
+                report.print_progress()
+        finally:
+            # Saving also ends the backend's write cycle, so a failed ingest doesn't keep other writers out
+            report.finish()
+            self.backend.save()
+            self.sparse.save()
+        
+        if not report.chunks and not report.failed_chunks:
             print("No chunk found")
-            return
-        
-        # Prepare data for chromaDB
-        documents = [chunk["text"] for chunk in chunks]
-        metadatas = [chunk["metadata"] for chunk in chunks]
-        ids = [f"chunk_{i}" for i in range(len(chunks))]
-        
-        # Add to collections (ChromaDB automatically generates embeddings)
-        self.collection.add(
-            documents=documents,
-            metadatas=metadatas,
-            ids=ids
-        )
+            return report
         
-        print(f"✅ Added {len(chunks)} chunks to vector store")
+        print(f"✅ Added {report.chunks} chunks to vector store")
+        return report
+    
+    @staticmethod
+    def _with_ids(chunks: Iterable[Dict]) -> Iterable[Dict]:
+        """Give chunks without one the ID ingest would: source, offsets and a content hash"""
+        for chunk in chunks:
+            if "id" not in chunk:
+                metadata = chunk.get("metadata") or {}
+                text = chunk["text"]
+                chunk["id"] = make_chunk_id(
+                    str(metadata.get("source", "unknown")),
+                    chunk.get("start_char", 0),
+                    chunk.get("end_char", len(text)),
+                    text,
+                    metadata,
+                )
+            yield chunk
         
-    def search(self, query: str, top_k: int = 3) -> List[Dict]:
-        """Semantic search for relevant chunks"""
-        results = self.collection.query(
-            query_texts=[query],
-            n_results=top_k
-        )
+    def delete(self, ids: List[str], batch_size: int = 500) -> int:
+        """Delete chunks by ID"""
+        for i in range(0, len(ids), batch_size):
+            self.backend.delete(ids[i : i + batch_size])
+        
+        if ids:
+            self.backend.save()
+            self.sparse.delete(ids)
+            self.sparse.save()
+            self.version += 1
+        return len(ids)
+    
+    def _rebuild_sparse(self, page_size: int = 1000):
+        """Index every chunk already in the collection (e.g. one ingested before BM25 existed)"""
+        print("🔤 Building keyword index from collection...")
+        for ids, documents in self.backend.iter_documents(page_size):
+            self.sparse.add(ids, documents)
+        self.sparse.save()
+    
+    def search(
+        self, query: str, top_k: int = 3, mode: Optional[str] = None, where: Optional[Dict[str, Any]] = None
+    ) -> List[Dict]:
+        """
+        Search for relevant chunks.
+        
+        mode is "dense" (embeddings), "sparse" (BM25, no embedding call) or
+        "hybrid" (both, fused by reciprocal rank). Defaults to retrieval_mode.
+        where restricts the search to chunks whose metadata matches, e.g.
+        {"source": "faq.md"} or {"date": {"$gte": "2024-01-01"}}. Range
+        bounds are numbers or ISO dates; list-valued fields need the numpy backend.
+        """
+        return self.search_many([query], top_k=top_k, mode=mode, where=where)[0]
+    
+    def search_many(
+        self,
+        queries: List[str],
+        top_k: int = 3,
+        mode: Optional[str] = None,
+        where: Optional[Dict[str, Any]] = None,
+    ) -> List[List[Dict]]:
+        """
+        Search for several queries at once: one embedding call and one ANN
+        query for all of them. Returns one result list per query.
+        """
+        if not queries:
+            return []
         
-        # Format results
-        chunks = []
+        mode = mode or self.retrieval_mode
         
-        if results['documents'] and results['documents'][0]:
-            for i, doc in enumerate(results['documents'][0]):
-                chunks.append({
-                    "text": doc,
-                    "metadata": results['metadatas'][0][i] if results['metadatas'] else {},
-                    "distance": results['distances'][0][i] if results['distances'] else 0,
-                    "id": results['ids'][0][i] if results['ids'] else f"chunk_{i}"
-                })
+        if where:
+            validate_where(where)
         
-        return chunks
+        if mode == "dense":
+            return self._dense_search_many(queries, top_k, where)
+        
+        # Keyword search checks its best candidates against the filter, never the whole corpus
+        keep = (lambda ids: self.backend.match_ids(ids, where)) if where else None
+        
+        if mode == "sparse":
+            return self._fetch_many([self.sparse.search(query, top_k, keep) for query in queries], {})
+        
+        # Fuse deeper candidate lists from both sides, then keep the top_k
+        candidates = top_k * 4
+        dense = self._dense_search_many(queries, candidates, where)
+        fused = [
+            reciprocal_rank_fusion(
+                [
+                    [chunk["id"] for chunk in dense_hits],
+                    [chunk_id for chunk_id, _ in self.sparse.search(query, candidates, keep)]
+                ],
+                k=self.rrf_k
+            )[:top_k]
+            for query, dense_hits in zip(queries, dense)
+        ]
+        known = {chunk["id"]: chunk for hits in dense for chunk in hits}
+        return self._fetch_many(fused, known)
+    
+    def _fetch_many(self, rankings: List[List[tuple]], known: Dict[str, Dict]) -> List[List[Dict]]:
+        """Build result chunks for lists of (id, score) pairs, loading any not already in `known`"""
+        missing = list({
+            chunk_id for ranked in rankings for chunk_id, _ in ranked
+            if chunk_id not in known
+        })
+        if missing:
+            for chunk in self.backend.get(missing):
+                known[chunk["id"]] = chunk
+        
+        return [
+            [{**known[chunk_id], "score": score} for chunk_id, score in ranked if chunk_id in known]
+            for ranked in rankings
+        ]
+    
+    def _dense_search_many(
+        self, queries: List[str], top_k: int, where: Optional[Dict[str, Any]] = None
+    ) -> List[List[Dict]]:
+        """Semantic search for relevant chunks, one list per query"""
+        # The embedding function already passes the breaker, limiter and hedging; only retry it here
+        for attempt in self.embedding_policy.retrying():
+            with attempt:
+                embeddings = self.embedding_function(queries)
+        return self.backend.query(embeddings, top_k, where)
     
     def clear(self):
         """Clear all documents from collection"""
-        self.client.delete_collection(self.collection.name)
-        print(f"🗑️  Cleared collection: {self.collection.name}")
\ No newline at end of file
+        self.backend.clear()
+        self.manifest.clear()
+        self.sparse.clear()
+        self.version += 1
+        print(f"🗑️  Cleared collection: {self.collection_name}")
\ No newline at end of file
@@ -0,0 +1,173 @@
+# Partitioning the knowledge base across independent vector backends
+import json
+import re
+import threading
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional, Set, Tuple
+
+from .backends import VectorBackend
+
+# Shard for chunks without the shard field
+DEFAULT_SHARD = "_default"
+
+
+def shard_name(value: Any) -> str:
+    """Directory-safe, collision-free shard name for a shard field value"""
+    # Numbers match numerically in filters (5 == 5.0), so they must route alike
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    text = str(value)
+    safe = re.sub(r"[^A-Za-z0-9_.-]", "_", text)[:48]
+    return f"{safe}-{zlib.crc32(text.encode('utf-8')):08x}"
+
+
+class ShardedBackend(VectorBackend):
+    """
+    One independent backend per shard, each with its own files and client.
+
+    Chunks are routed by a scalar metadata field (e.g. one shard per
+    tenant or per source) or, without a field, by a hash of their ID.
+    Searches fan out concurrently to the shards a filter can match and
+    their top-k lists are merged by distance, so a query pinned to one
+    tenant never waits on another tenant's shard.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        open_shard: Callable[[Path], VectorBackend],
+        field: Optional[str] = None,
+        shard_count: int = 8,
+        max_workers: int = 8,
+    ):
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.open_shard = open_shard
+        self.field = field
+        self.shard_count = shard_count
+
+        # Routing can't change under existing data: chunks would be looked up in the wrong shard
+        layout = {"field": field, "shard_count": None if field else shard_count}
+        layout_path = self.path / "shards.json"
+        if layout_path.exists():
+            stored = json.loads(layout_path.read_text())
+            if stored != layout:
+                raise ValueError(f"Shards in {self.path} were built with {stored}, not {layout}; re-ingest to change")
+        else:
+            layout_path.write_text(json.dumps(layout))
+
+        self._lock = threading.Lock()
+        self._shards: Dict[str, VectorBackend] = {}
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="shard")
+
+        for shard_dir in sorted(p for p in self.path.iterdir() if p.is_dir()):
+            self._shard(shard_dir.name)
+        print(f"   Shards: {len(self._shards)}")
+
+    def _shard(self, name: str) -> VectorBackend:
+        with self._lock:
+            if name not in self._shards:
+                self._shards[name] = self.open_shard(self.path / name)
+            return self._shards[name]
+
+    def _all(self) -> List[VectorBackend]:
+        with self._lock:
+            return list(self._shards.values())
+
+    def _route(self, chunk_id: str, metadata: Optional[Dict]) -> str:
+        if self.field is None:
+            return f"{zlib.crc32(chunk_id.encode('utf-8')) % self.shard_count:03d}"
+        value = (metadata or {}).get(self.field)
+        return DEFAULT_SHARD if value is None else shard_name(value)
+
+    def _by_shard(self, ids: List[str]) -> List[Tuple[VectorBackend, List[str]]]:
+        """Where each ID can live: its hash shard, or any shard when routing by a field"""
+        if self.field is not None:
+            return [(shard, ids) for shard in self._all()]
+
+        groups: Dict[str, List[str]] = {}
+        for chunk_id in ids:
+            groups.setdefault(self._route(chunk_id, None), []).append(chunk_id)
+        with self._lock:
+            return [(self._shards[name], group) for name, group in groups.items() if name in self._shards]
+
+    def _pinned(self, where: Dict[str, Any]) -> Optional[Set[str]]:
+        """Shard names a filter restricts the shard field to, or None if it could match any shard"""
+        condition = where.get(self.field)
+        if isinstance(condition, dict):
+            values = [condition["$eq"]] if "$eq" in condition else condition.get("$in")
+        else:
+            values = None if condition is None else [condition]
+
+        if values is not None:
+            return {shard_name(value) for value in values}
+        for clause in where.get("$and", []):
+            pinned = self._pinned(clause)
+            if pinned is not None:
+                return pinned
+        return None
+
+    def _targets(self, where: Optional[Dict[str, Any]]) -> List[VectorBackend]:
+        pinned = self._pinned(where) if where and self.field else None
+        if pinned is None:
+            return self._all()
+        with self._lock:
+            return [self._shards[name] for name in pinned if name in self._shards]
+
+    def count(self) -> int:
+        return sum(shard.count() for shard in self._all())
+
+    def upsert(self, ids: List[str], embeddings: List[List[float]], documents: List[str], metadatas: List[Dict]):
+        groups: Dict[str, List[int]] = {}
+        for i, (chunk_id, metadata) in enumerate(zip(ids, metadatas)):
+            groups.setdefault(self._route(chunk_id, metadata), []).append(i)
+
+        def write(name: str, rows: List[int]):
+            self._shard(name).upsert(
+                [ids[i] for i in rows],
+                [embeddings[i] for i in rows],
+                [documents[i] for i in rows],
+                [metadatas[i] for i in rows],
+            )
+        list(self._pool.map(lambda group: write(*group), groups.items()))
+
+    def delete(self, ids: List[str]):
+        list(self._pool.map(lambda target: target[0].delete(target[1]), self._by_shard(ids)))
+
+    def get(self, ids: List[str]) -> List[Dict]:
+        pages = self._pool.map(lambda target: target[0].get(target[1]), self._by_shard(ids))
+        return [chunk for page in pages for chunk in page]
+
+    def iter_documents(self, page_size: int = 1000) -> Iterator[Tuple[List[str], List[str]]]:
+        for shard in self._all():
+            yield from shard.iter_documents(page_size)
+
+    def query(
+        self, embeddings: List[List[float]], top_k: int, where: Optional[Dict[str, Any]] = None
+    ) -> List[List[Dict]]:
+        targets = self._targets(where)
+        if len(targets) == 1:
+            return targets[0].query(embeddings, top_k, where)
+
+        # Every shard's own top-k, then the best top_k of their union
+        per_shard = list(self._pool.map(lambda shard: shard.query(embeddings, top_k, where), targets))
+        return [
+            sorted((chunk for hits in per_query for chunk in hits), key=lambda chunk: chunk["distance"])[:top_k]
+            for per_query in zip(*per_shard)
+        ] if per_shard else [[] for _ in embeddings]
+
+    def match_ids(self, ids: List[str], where: Dict[str, Any]) -> Set[str]:
+        if self.field is None:
+            targets = self._by_shard(ids)
+        else:
+            targets = [(shard, ids) for shard in self._targets(where)]
+        found = self._pool.map(lambda target: target[0].match_ids(target[1], where), targets)
+        return set().union(*found)
+
+    def save(self):
+        list(self._pool.map(lambda shard: shard.save(), self._all()))
+
+    def clear(self):
+        list(self._pool.map(lambda shard: shard.clear(), self._all()))
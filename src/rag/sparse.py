@@ -0,0 +1,235 @@
+# Sparse (BM25) keyword index over the same chunk IDs as the vector store
+import json
+import math
+import os
+import re
+import threading
+from array import array
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+import numpy as np
+
+_TOKEN = re.compile(r"\w+(?:[-.:/]\w+)*")
+_TOKEN_SEPARATOR = re.compile(r"[-.:/]")
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Lowercase word tokens. Compound tokens such as IDs and error codes
+    ("ERR-1042", "v2.3.1") are kept whole and also split into their parts.
+    """
+    tokens = []
+    for token in _TOKEN.findall(text.lower()):
+        tokens.append(token)
+        parts = _TOKEN_SEPARATOR.split(token)
+        if len(parts) > 1:
+            tokens.extend(part for part in parts if part)
+    return tokens
+
+
+def reciprocal_rank_fusion(rankings: Iterable[List[str]], k: int = 60) -> List[Tuple[str, float]]:
+    """Fuse ranked ID lists: score(id) = sum over lists of 1 / (k + rank)"""
+    scores: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, chunk_id in enumerate(ranking, 1):
+            scores[chunk_id] = scores.get(chunk_id, 0.0) + 1.0 / (k + rank)
+
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
+
+class BM25Index:
+    """
+    In-process BM25 index.
+
+    Each term maps to two compact arrays (document rows and term
+    frequencies). Deleted rows are tombstoned and dropped on the next
+    compaction, and the whole index persists to a single .npz file.
+    """
+
+    def __init__(self, path: str, k1: float = 1.5, b: float = 0.75):
+        self.path = Path(path)
+        self.k1 = k1
+        self.b = b
+
+        self._lock = threading.RLock()
+        self._reset()
+
+        if self.path.exists():
+            self._load()
+
+    def _reset(self):
+        self._ids: List[str] = []
+        self._rows: Dict[str, int] = {}
+        self._lengths = array("I")
+        self._alive = bytearray()
+        self._postings: Dict[str, Tuple[array, array]] = {}
+        self._total_length = 0
+        self._deleted = 0
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def add(self, ids: List[str], texts: List[str]):
+        """Index (or re-index) chunks"""
+        with self._lock:
+            for chunk_id, text in zip(ids, texts):
+                self._remove(chunk_id)
+
+                row = len(self._ids)
+                tokens = tokenize(text)
+                counts: Dict[str, int] = {}
+                for token in tokens:
+                    counts[token] = counts.get(token, 0) + 1
+
+                for term, tf in counts.items():
+                    rows, tfs = self._postings.setdefault(term, (array("I"), array("I")))
+                    rows.append(row)
+                    tfs.append(tf)
+
+                self._ids.append(chunk_id)
+                self._rows[chunk_id] = row
+                self._lengths.append(len(tokens))
+                self._alive.append(1)
+                self._total_length += len(tokens)
+
+    def delete(self, ids: Iterable[str]):
+        with self._lock:
+            for chunk_id in ids:
+                self._remove(chunk_id)
+
+            if self._deleted > max(1000, len(self._ids) // 4):
+                self._compact()
+
+    def clear(self):
+        with self._lock:
+            self._reset()
+            if self.path.exists():
+                self.path.unlink()
+
+    def _remove(self, chunk_id: str):
+        row = self._rows.pop(chunk_id, None)
+        if row is not None:
+            self._alive[row] = 0
+            self._total_length -= self._lengths[row]
+            self._deleted += 1
+
+    def search(
+        self, query: str, top_k: int = 3, keep: Optional[Callable[[List[str]], Set[str]]] = None
+    ) -> List[Tuple[str, float]]:
+        """
+        Return (chunk id, BM25 score) pairs, best first. `keep` picks which
+        of a list of candidate IDs may be returned (e.g. those passing a
+        metadata filter); it sees the best-scoring candidates a page at a
+        time, not every matching chunk.
+        """
+        with self._lock:
+            n_docs = len(self._rows)
+            if not n_docs:
+                return []
+
+            avg_length = self._total_length / n_docs
+            lengths = np.frombuffer(self._lengths, dtype=np.uint32)
+            alive = np.frombuffer(self._alive, dtype=np.uint8)
+
+            all_rows, all_scores = [], []
+            for term in set(tokenize(query)):
+                posting = self._postings.get(term)
+                if not posting:
+                    continue
+
+                rows = np.frombuffer(posting[0], dtype=np.uint32)
+                tfs = np.frombuffer(posting[1], dtype=np.uint32).astype(np.float32)
+                df = int(alive[rows].sum())
+                if not df:
+                    continue
+
+                idf = math.log(1 + (n_docs - df + 0.5) / (df + 0.5))
+                norm = self.k1 * (1 - self.b + self.b * lengths[rows] / avg_length)
+                all_rows.append(rows)
+                all_scores.append(idf * tfs * (self.k1 + 1) / (tfs + norm))
+
+            if not all_rows:
+                return []
+
+            # Sum per row over the query terms, touching only matching postings
+            rows, inverse = np.unique(np.concatenate(all_rows), return_inverse=True)
+            scores = np.bincount(inverse, weights=np.concatenate(all_scores))
+            scores[alive[rows] == 0] = 0
+            # Compaction replaces the list rather than renumbering it, so this stays in step with rows
+            ids = self._ids
+
+        if keep is None:
+            k = min(top_k, len(rows))
+            best = np.argpartition(-scores, k - 1)[:k]
+            best = best[np.argsort(-scores[best])]
+            return [(ids[rows[i]], float(scores[i])) for i in best if scores[i] > 0]
+
+        order = np.argsort(-scores)[: int(np.count_nonzero(scores > 0))]
+        found: List[Tuple[str, float]] = []
+        start, page = 0, max(top_k * 4, 64)
+        while start < len(order) and len(found) < top_k:
+            best = order[start : start + page]
+            candidates = [ids[rows[i]] for i in best]
+            kept = keep(candidates)
+            found.extend((chunk_id, float(scores[i])) for chunk_id, i in zip(candidates, best) if chunk_id in kept)
+            start, page = start + page, page * 4
+        return found[:top_k]
+
+    def _compact(self):
+        """Rebuild arrays without tombstoned rows"""
+        live = [(self._ids[row], row) for row in range(len(self._ids)) if self._alive[row]]
+        remap = {old: new for new, (_, old) in enumerate(live)}
+
+        postings = {}
+        for term, (rows, tfs) in self._postings.items():
+            kept = [(remap[r], tf) for r, tf in zip(rows, tfs) if r in remap]
+            if kept:
+                postings[term] = (array("I", (r for r, _ in kept)), array("I", (tf for _, tf in kept)))
+
+        self._postings = postings
+        self._lengths = array("I", (self._lengths[old] for _, old in live))
+        self._ids = [chunk_id for chunk_id, _ in live]
+        self._rows = {chunk_id: row for row, chunk_id in enumerate(self._ids)}
+        self._alive = bytearray(b"\x01" * len(self._ids))
+        self._deleted = 0
+
+    def save(self):
+        """Persist to disk (compacted), replacing the previous file atomically"""
+        with self._lock:
+            if self._deleted:
+                self._compact()
+
+            terms = list(self._postings)
+            offsets = np.zeros(len(terms) + 1, dtype=np.uint64)
+            offsets[1:] = np.cumsum([len(self._postings[t][0]) for t in terms])
+
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = self.path.with_suffix(".tmp.npz")
+            np.savez(
+                tmp_path,
+                meta=np.frombuffer(json.dumps({"ids": self._ids, "terms": terms}).encode("utf-8"), dtype=np.uint8),
+                offsets=offsets,
+                rows=np.concatenate([np.frombuffer(self._postings[t][0], dtype=np.uint32) for t in terms] or [np.zeros(0, np.uint32)]),
+                tfs=np.concatenate([np.frombuffer(self._postings[t][1], dtype=np.uint32) for t in terms] or [np.zeros(0, np.uint32)]),
+                lengths=np.frombuffer(self._lengths, dtype=np.uint32),
+            )
+            os.replace(tmp_path, self.path)
+
+    def _load(self):
+        data = np.load(self.path)
+        meta = json.loads(data["meta"].tobytes().decode("utf-8"))
+        offsets, rows, tfs = data["offsets"], data["rows"], data["tfs"]
+
+        self._ids = meta["ids"]
+        self._rows = {chunk_id: row for row, chunk_id in enumerate(self._ids)}
+        self._lengths = array("I", data["lengths"].tobytes())
+        self._alive = bytearray(b"\x01" * len(self._ids))
+        self._total_length = int(data["lengths"].sum())
+        self._postings = {
+            term: (
+                array("I", rows[offsets[i]:offsets[i + 1]].tobytes()),
+                array("I", tfs[offsets[i]:offsets[i + 1]].tobytes()),
+            )
+            for i, term in enumerate(meta["terms"])
+        }
@@ -0,0 +1,129 @@
+# Persistence backends for ConversationManager
+import json
+import sqlite3
+import threading
+from pathlib import Path
+from time import time
+from typing import List
+
+
+class ConversationConflict(Exception):
+    """Another process appended to the conversation first"""
+
+
+class ConversationBackend:
+    """
+    Append-only message log per conversation. Messages are addressed by
+    position, so a process only reads and writes the tail it doesn't have.
+    """
+
+    def load(self, conversation_id: str, start: int = 0) -> List[dict]:
+        raise NotImplementedError
+
+    def append(self, conversation_id: str, start: int, messages: List[dict]):
+        """Write messages at positions start.., raising ConversationConflict if any is taken"""
+        raise NotImplementedError
+
+    def delete(self, conversation_id: str):
+        raise NotImplementedError
+
+
+class MemoryConversationBackend(ConversationBackend):
+    """No persistence: history lives only as long as the process cache keeps it"""
+
+    def load(self, conversation_id: str, start: int = 0) -> List[dict]:
+        return []
+
+    def append(self, conversation_id: str, start: int, messages: List[dict]):
+        pass
+
+    def delete(self, conversation_id: str):
+        pass
+
+
+class SQLiteConversationBackend(ConversationBackend):
+    """Single sqlite file shared by every worker on the host"""
+
+    def __init__(self, path: str = "./conversations.sqlite"):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS messages (
+                conversation_id TEXT NOT NULL,
+                seq INTEGER NOT NULL,
+                message TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                PRIMARY KEY (conversation_id, seq)
+            )
+            """
+        )
+        self._conn.commit()
+
+    def load(self, conversation_id: str, start: int = 0) -> List[dict]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT message FROM messages WHERE conversation_id = ? AND seq >= ? ORDER BY seq",
+                (conversation_id, start),
+            ).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def append(self, conversation_id: str, start: int, messages: List[dict]):
+        now = time()
+        rows = [
+            (conversation_id, start + i, json.dumps(message), now)
+            for i, message in enumerate(messages)
+        ]
+        with self._lock:
+            try:
+                with self._conn:
+                    self._conn.executemany("INSERT INTO messages VALUES (?, ?, ?, ?)", rows)
+            except sqlite3.IntegrityError as e:
+                raise ConversationConflict(conversation_id) from e
+
+    def delete(self, conversation_id: str):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM messages WHERE conversation_id = ?", (conversation_id,))
+
+
+class RedisConversationBackend(ConversationBackend):
+    """One Redis list per conversation (needs the redis package)"""
+
+    def __init__(self, url: str = "redis://localhost:6379/0", prefix: str = "conversation:"):
+        try:
+            import redis
+        except ImportError as e:
+            raise ImportError("RedisConversationBackend needs redis: pip install redis") from e
+
+        self._redis = redis.Redis.from_url(url)
+        self.prefix = prefix
+
+        # Appends only if the list is still `start` long, so concurrent writers can't interleave
+        self._append = self._redis.register_script(
+            """
+            if redis.call('LLEN', KEYS[1]) ~= tonumber(ARGV[1]) then return 0 end
+            for i = 2, #ARGV do redis.call('RPUSH', KEYS[1], ARGV[i]) end
+            return 1
+            """
+        )
+
+    def load(self, conversation_id: str, start: int = 0) -> List[dict]:
+        return [json.loads(item) for item in self._redis.lrange(self.prefix + conversation_id, start, -1)]
+
+    def append(self, conversation_id: str, start: int, messages: List[dict]):
+        if not self._append(keys=[self.prefix + conversation_id], args=[start, *map(json.dumps, messages)]):
+            raise ConversationConflict(conversation_id)
+
+    def delete(self, conversation_id: str):
+        self._redis.delete(self.prefix + conversation_id)
+
+
+def make_conversation_backend(config) -> ConversationBackend:
+    """Build the backend selected by AgentConfig.conversation_store"""
+    if config.conversation_store == "sqlite":
+        return SQLiteConversationBackend(config.conversation_db_path)
+    if config.conversation_store == "redis":
+        return RedisConversationBackend(config.conversation_redis_url)
+    return MemoryConversationBackend()
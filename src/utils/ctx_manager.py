@@ -1,56 +1,381 @@
-import tiktoken
-from typing import Dict, List
+import asyncio
+import hashlib
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager, contextmanager
+from time import monotonic
+from typing import Callable, List, Optional, Tuple
+
+from rag.index import get_encoding
+from utils.conversation_store import ConversationBackend, ConversationConflict, MemoryConversationBackend
+
+
+def _role(message) -> Optional[str]:
+    return message.get("role") if isinstance(message, dict) else getattr(message, "role", None)
+
+
 class ContextWindowManager:
+    """
+    Token accounting for chat messages.
+
+    Per-message counts are memoized in a shared LRU side table keyed by a
+    digest of the message's content, so the table holds no reference to
+    the messages themselves. Each message is encoded once however many
+    iterations it stays in context.
+    """
+    _counts: "OrderedDict[Tuple[str, bytes], int]" = OrderedDict()
+    _counts_lock = threading.Lock()
+    max_cached_messages = 20_000
+
+    @staticmethod
+    def _fields(message) -> List[str]:
+        """The text that is counted for a message"""
+        if isinstance(message, dict):
+            return [str(value) for value in message.values() if value]
+        # Handle ChatCompletionMessage objects
+        fields = []
+        if getattr(message, "content", None):
+            fields.append(message.content)
+        if getattr(message, "tool_calls", None):
+            fields.append(str(message.tool_calls))
+        return fields
+
+    def message_tokens(self, message, model: str = "gpt-4o-mini") -> int:
+        """Tokens for one message, including the per-message overhead"""
+        fields = self._fields(message)
+        key = (model, hashlib.blake2b("\x1f".join(fields).encode("utf-8", "surrogatepass"), digest_size=16).digest())
+        with self._counts_lock:
+            count = self._counts.get(key)
+            if count is not None:
+                self._counts.move_to_end(key)
+                return count
+
+        encoding = get_encoding(model)
+        num_tokens = 4  # Every message has overhead
+        for field in fields:
+            num_tokens += len(encoding.encode(field))
+
+        with self._counts_lock:
+            self._counts[key] = num_tokens
+            self._counts.move_to_end(key)
+            while len(self._counts) > self.max_cached_messages:
+                self._counts.popitem(last=False)
+
+        return num_tokens
+
     def count_tokens(self, messages: list, model: str = "gpt-4o-mini") -> int:
         """Count tokens in messages"""
-        try:
-            encoding = tiktoken.encoding_for_model(model)
-        except KeyError:
-            encoding = tiktoken.get_encoding("cl100k_base")
-        
-        num_tokens = 0
-        for message in messages:
-            # Count tokens for each message
-            num_tokens += 4  # Every message has overhead
-            
-            if isinstance(message, dict):
-                for key, value in message.items():
-                    if value:
-                        num_tokens += len(encoding.encode(str(value)))
-            else:
-                # Handle ChatCompletionMessage objects
-                if hasattr(message, 'content') and message.content:
-                    num_tokens += len(encoding.encode(message.content))
-                if hasattr(message, 'tool_calls') and message.tool_calls:
-                    num_tokens += len(encoding.encode(str(message.tool_calls)))
-        
-        return num_tokens
+        return sum(self.message_tokens(message, model) for message in messages)
 
 
-    def truncate_messages(self, messages: list, max_tokens: int = 3000) -> list:
+    def truncate_messages(self, messages: list, max_tokens: int = 3000, model: str = "gpt-4o-mini") -> list:
         """Truncate messages to fit token limit"""
-        while self.count_tokens(messages) > max_tokens and len(messages) > 2:
-            # Keep system message (index 0) and remove oldest
-            messages.pop(1)
-            print(f"⚠️  Token limit reached, removed old message")
-        
+        counts = [self.message_tokens(message, model) for message in messages]
+        total = sum(counts)
+
+        # Keep system message (index 0) and remove oldest, in one pass over a running total
+        removed = 0
+        while total > max_tokens and len(messages) - removed > 2:
+            removed += 1
+            total -= counts[removed]
+            # Tool results go together with the assistant message that requested them
+            while 1 + removed < len(messages) and _role(messages[1 + removed]) == "tool":
+                removed += 1
+                total -= counts[removed]
+
+        if removed:
+            del messages[1:1 + removed]
+            print(f"⚠️  Token limit reached, removed {removed} old message(s)")
+
         return messages
 
+class ContextCompactor:
+    """
+    Fold turns that no longer fit the context into a rolling summary.
+
+    The cached summary of a conversation covers history[1:covered], in
+    positions of the full append-only history; `offset` is how many old
+    messages after the system prompt the in-memory history has dropped. Building a request
+    never waits on the LLM: when the tail nears the budget a background job
+    extends the summary, and until it lands the oldest whole turns are
+    dropped. An assistant message and its tool results are one turn.
+    """
+    def __init__(
+        self,
+        summarize: Callable[[str, str], str],
+        max_conversations: int = 1000,
+        trigger_ratio: float = 0.8,
+        keep_ratio: float = 0.5,
+        model: str = "gpt-4o-mini",
+    ):
+        self.summarize = summarize
+        self.max_conversations = max_conversations
+        self.trigger_ratio = trigger_ratio
+        self.keep_ratio = keep_ratio
+        self.model = model
+        self.window = ContextWindowManager()
+
+        self._lock = threading.Lock()
+        self._summaries: "OrderedDict[str, Tuple[int, str]]" = OrderedDict()
+        self._pending = set()
+        self._executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="compactor")
+
+    @staticmethod
+    def _turn_starts(messages: list, start: int) -> List[int]:
+        return [i for i in range(start, len(messages)) if _role(messages[i]) != "tool"]
+
+    def build_context(self, conversation_id: str, history: list, max_tokens: int, offset: int = 0) -> list:
+        """System prompt + summary + as many recent turns as fit in max_tokens"""
+        with self._lock:
+            covered, summary = self._summaries.get(conversation_id, (1, ""))
+            if conversation_id in self._summaries:
+                self._summaries.move_to_end(conversation_id)
+        covered = max(covered - offset, 1)
+        if covered > len(history):
+            covered, summary = 1, ""
+
+        head = [history[0]]
+        if summary:
+            head.append({"role": "system", "content": f"Summary of the earlier conversation:\n{summary}"})
+        budget = max_tokens - self.window.count_tokens(head, self.model)
+
+        starts = self._turn_starts(history, covered)
+        counts = [self.window.message_tokens(message, self.model) for message in history[covered:]]
+        total = sum(counts)
+
+        if total > self.trigger_ratio * budget:
+            self._schedule(conversation_id, history, covered, summary, budget, offset)
+
+        # Until the summary catches up, drop the oldest whole turns (always keep the latest)
+        first = 0
+        while total > budget and first + 1 < len(starts):
+            total -= sum(counts[starts[first] - covered:starts[first + 1] - covered])
+            first += 1
+        if first:
+            print(f"⚠️  Token limit reached, {first} old turn(s) left out while the summary catches up")
+
+        return head + history[starts[first]:] if starts else head
+
+    def _schedule(self, conversation_id: str, history: list, covered: int, summary: str, budget: int, offset: int):
+        # Summarize up to the turn after which the rest fits in keep_ratio of the budget
+        keep = self.keep_ratio * budget
+        target = covered
+        running = self.window.count_tokens(history[covered:], self.model)
+        for start in self._turn_starts(history, covered)[1:]:
+            running -= self.window.count_tokens(history[target:start], self.model)
+            target = start
+            if running <= keep:
+                break
+        if target <= covered:
+            return
+
+        with self._lock:
+            if conversation_id in self._pending:
+                return
+            self._pending.add(conversation_id)
+
+        # Snapshot now: the run keeps appending to history while the job runs
+        self._executor.submit(self._compact, conversation_id, list(history[covered:target]), summary, target + offset)
+
+    def _compact(self, conversation_id: str, messages: list, summary: str, covered: int):
+        try:
+            updated = self.summarize(summary, _transcript(messages))
+            with self._lock:
+                if covered > self._summaries.get(conversation_id, (1, ""))[0]:
+                    self._summaries[conversation_id] = (covered, updated)
+                    self._summaries.move_to_end(conversation_id)
+                    while len(self._summaries) > self.max_conversations:
+                        self._summaries.popitem(last=False)
+        except Exception as e:
+            print(f"⚠️  Context summarization failed: {e}")
+        finally:
+            with self._lock:
+                self._pending.discard(conversation_id)
+
+    def forget(self, conversation_id: str):
+        with self._lock:
+            self._summaries.pop(conversation_id, None)
+
+
+def _transcript(messages: list) -> str:
+    lines = []
+    for message in messages:
+        role = _role(message)
+        if role == "tool":
+            lines.append(f"tool result: {str(message.get('content'))[:1000]}")
+            continue
+        if message.get("content"):
+            lines.append(f"{role}: {message['content']}")
+        for tool_call in message.get("tool_calls") or []:
+            lines.append(f"{role} called {tool_call['function']['name']}({tool_call['function']['arguments']})")
+    return "\n".join(lines)
+
+
+class _Conversation:
+    def __init__(self, messages: List[dict]):
+        self.messages = messages
+        # messages[i] (i >= 1) is backend position dropped + i; persisted counts backend positions
+        self.dropped = 0
+        self.persisted = len(messages)
+        self.lock = threading.Lock()
+        self.alock: Optional[asyncio.Lock] = None
+        # Sessions holding or waiting for the entry: it can't be evicted while any do
+        self.users = 0
+        self.last_used = monotonic()
+
+
 class ConversationManager:
-    """Manage multi-turn conversation"""
-    def __init__(self):
-        self.conversations: Dict[str, List[dict]] = {}
-        
+    """
+    Manage multi-turn conversation
+
+    Histories are cached in memory (LRU, idle entries expire after
+    `ttl_seconds`) in front of an append-only backend. A session holds the
+    conversation's lock, pulls messages other workers appended, and on exit
+    appends only the new messages, or drops them if the run failed. Only
+    the system prompt and the last `max_messages` messages stay in memory;
+    the backend keeps everything.
+    """
+    def __init__(
+        self,
+        backend: Optional[ConversationBackend] = None,
+        max_conversations: int = 1000,
+        ttl_seconds: float = 3600.0,
+        system_prompt: str = "You are a helpful assistant",
+        max_messages: int = 200,
+    ):
+        self.backend = backend or MemoryConversationBackend()
+        self.max_conversations = max_conversations
+        self.ttl_seconds = ttl_seconds
+        self.max_messages = max_messages
+        self.system_prompt = system_prompt
+
+        self._lock = threading.Lock()
+        self.conversations: "OrderedDict[str, _Conversation]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self.conversations)
+
+    def _entry(self, conversation_id: str) -> _Conversation:
+        with self._lock:
+            entry = self.conversations.get(conversation_id)
+            if entry is None:
+                entry = _Conversation([])
+                self.conversations[conversation_id] = entry
+            self.conversations.move_to_end(conversation_id)
+            entry.last_used = monotonic()
+            entry.users += 1
+            self._evict()
+            return entry
+
+    def _release(self, entry: _Conversation):
+        with self._lock:
+            entry.users -= 1
+            entry.last_used = monotonic()
+
+    def _evict(self):
+        """Drop expired and least recently used histories; they reload from the backend on demand"""
+        now = monotonic()
+        for conversation_id, entry in list(self.conversations.items()):
+            over_capacity = len(self.conversations) > self.max_conversations
+            expired = now - entry.last_used > self.ttl_seconds
+            if not (over_capacity or expired):
+                break
+            if not entry.users:
+                del self.conversations[conversation_id]
+
+    def _sync(self, conversation_id: str, entry: _Conversation):
+        entry.messages.extend(self.backend.load(conversation_id, start=entry.persisted))
+        entry.persisted = entry.dropped + len(entry.messages)
+        if not entry.messages:
+            entry.messages.append({"role": "system", "content": self.system_prompt})
+        self._trim(entry)
+
+    def _commit(self, conversation_id: str, entry: _Conversation):
+        new_messages = entry.messages[entry.persisted - entry.dropped:]
+        if not new_messages:
+            return
+        try:
+            self.backend.append(conversation_id, entry.persisted, new_messages)
+            entry.persisted = entry.dropped + len(entry.messages)
+            self._trim(entry)
+        except ConversationConflict:
+            # Another worker wrote this turn's positions first; keep its version
+            print(f"⚠️  Conversation {conversation_id} changed concurrently, turn not saved")
+            self._rollback(entry)
+
+    @staticmethod
+    def _rollback(entry: _Conversation):
+        del entry.messages[entry.persisted - entry.dropped:]
+
+    def _trim(self, entry: _Conversation):
+        """Drop the oldest saved messages past max_messages (never the system prompt, nor a turn's tool results alone)"""
+        cut = len(entry.messages) - 1 - self.max_messages
+        if cut <= 0 or entry.dropped + len(entry.messages) != entry.persisted:
+            return
+        while 1 + cut < len(entry.messages) and _role(entry.messages[1 + cut]) == "tool":
+            cut += 1
+        del entry.messages[1:1 + cut]
+        entry.dropped += cut
+
+    def offset(self, conversation_id: str) -> int:
+        """Messages after the system prompt that the in-memory history has dropped"""
+        with self._lock:
+            entry = self.conversations.get(conversation_id)
+            return entry.dropped if entry else 0
+
+    @contextmanager
+    def session(self, conversation_id: str):
+        """Exclusive access to a conversation's history for one run"""
+        entry = self._entry(conversation_id)
+        try:
+            with entry.lock:
+                self._sync(conversation_id, entry)
+                try:
+                    yield entry.messages
+                except BaseException:
+                    self._rollback(entry)
+                    raise
+                self._commit(conversation_id, entry)
+        finally:
+            self._release(entry)
+
+    @asynccontextmanager
+    async def asession(self, conversation_id: str):
+        """session() for coroutines: waits for the lock without blocking the event loop"""
+        entry = self._entry(conversation_id)
+        try:
+            # Coroutines queue on the entry's asyncio lock (created on the event loop, so no race)
+            if entry.alock is None:
+                entry.alock = asyncio.Lock()
+            async with entry.alock:
+                # Only synchronous session() users can still hold the thread lock
+                while not entry.lock.acquire(blocking=False):
+                    await asyncio.sleep(0.01)
+                try:
+                    await asyncio.to_thread(self._sync, conversation_id, entry)
+                    try:
+                        yield entry.messages
+                    except BaseException:
+                        self._rollback(entry)
+                        raise
+                    await asyncio.to_thread(self._commit, conversation_id, entry)
+                finally:
+                    entry.lock.release()
+        finally:
+            self._release(entry)
+
     def get_or_create(self, conversation_id: str) -> List[dict]:
         """Get conversation history"""
-        if conversation_id not in self.conversations:
-            self.conversations[conversation_id] = [
-                {
-                    "role": "system",
-                    "content": "You are a helpful assistant"
-                }
-            ]
-            
-        return self.conversations[conversation_id]
-    
-    # Add other stuff to like add message, clear etc
\ No newline at end of file
+        entry = self._entry(conversation_id)
+        try:
+            with entry.lock:
+                self._sync(conversation_id, entry)
+                return entry.messages
+        finally:
+            self._release(entry)
+
+    def clear(self, conversation_id: str):
+        with self._lock:
+            self.conversations.pop(conversation_id, None)
+        self.backend.delete(conversation_id)
@@ -0,0 +1,205 @@
+# Response cache + single-flight for chat completion requests
+import asyncio
+import hashlib
+import json
+import sqlite3
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from pathlib import Path
+from time import time
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from openai.types.chat import ChatCompletion
+
+
+def request_key(request: Dict[str, Any]) -> str:
+    """Canonical hash of a request: key order and whitespace don't matter"""
+    canonical = json.dumps(request, sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class _LeaderCancelled(Exception):
+    """The single-flight leader was cancelled; a waiting follower takes over"""
+
+
+class LLMResponseCache:
+    """
+    TTL + LRU cache of chat completions, keyed by the canonical request hash.
+
+    Memory tier in front of an optional sqlite tier that survives restarts
+    and is shared by workers. Concurrent identical requests are
+    single-flighted: the first caller goes upstream, the rest wait for its
+    result (or its exception). If the first caller is cancelled, one of
+    the waiting callers goes upstream in its place.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 1024,
+        ttl_seconds: float = 3600.0,
+        path: Optional[str] = None,
+        any_temperature: bool = False,
+    ):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.any_temperature = any_temperature
+
+        self.hits = 0
+        self.disk_hits = 0
+        self.shared = 0
+        self.misses = 0
+
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, Tuple[ChatCompletion, float]]" = OrderedDict()
+        self._in_flight: Dict[str, Future] = {}
+
+        self._conn = None
+        if path:
+            Path(path).parent.mkdir(parents=True, exist_ok=True)
+            self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, response TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+            self._conn.commit()
+
+    def cacheable(self, request: Dict[str, Any]) -> bool:
+        """Only deterministic requests by default; streams are never cached"""
+        if request.get("stream"):
+            return False
+        return self.any_temperature or request.get("temperature") == 0
+
+    def get(self, key: str) -> Optional[ChatCompletion]:
+        now = time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[1] > now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+
+            if self._conn is None:
+                return None
+            row = self._conn.execute(
+                "SELECT response, expires_at FROM responses WHERE key = ? AND expires_at > ?", (key, now)
+            ).fetchone()
+            if row is None:
+                return None
+
+            response = ChatCompletion.model_validate_json(row[0])
+            self._remember(key, response, row[1])
+            self.disk_hits += 1
+            return response
+
+    def put(self, key: str, response: ChatCompletion):
+        expires_at = time() + self.ttl_seconds
+        with self._lock:
+            self._remember(key, response, expires_at)
+            if self._conn is not None:
+                with self._conn:
+                    self._conn.execute(
+                        "INSERT OR REPLACE INTO responses VALUES (?, ?, ?)",
+                        (key, response.model_dump_json(), expires_at),
+                    )
+                    self._conn.execute("DELETE FROM responses WHERE expires_at <= ?", (time(),))
+
+    def _remember(self, key: str, response: ChatCompletion, expires_at: float):
+        self._entries[key] = (response, expires_at)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _claim(self, key: str) -> Tuple[Future, bool]:
+        """The in-flight future for key, and whether this caller must produce it"""
+        with self._lock:
+            future = self._in_flight.get(key)
+            if future is not None:
+                self.shared += 1
+                return future, False
+            future = Future()
+            self._in_flight[key] = future
+            self.misses += 1
+            return future, True
+
+    def _settle(self, key: str, future: Future, response=None, error: Optional[BaseException] = None):
+        """Hand the outcome to the followers and release the key, whatever happens"""
+        if isinstance(error, asyncio.CancelledError):
+            # Nobody cancelled the followers: free the key, then wake them to retry
+            with self._lock:
+                self._in_flight.pop(key, None)
+            if not future.done():
+                future.set_exception(_LeaderCancelled())
+            return
+        try:
+            if not future.done():
+                if error is None:
+                    future.set_result(response)
+                else:
+                    future.set_exception(error)
+            if error is None:
+                self.put(key, response)
+        finally:
+            with self._lock:
+                self._in_flight.pop(key, None)
+
+    def get_or_create(self, request: Dict[str, Any], create: Callable[[], ChatCompletion]) -> ChatCompletion:
+        key = request_key(request)
+        cached = self.get(key)
+        if cached is not None:
+            return cached
+
+        while True:
+            future, leader = self._claim(key)
+            if leader:
+                break
+            try:
+                return future.result()
+            except _LeaderCancelled:
+                continue
+
+        try:
+            response = create()
+        except BaseException as e:
+            self._settle(key, future, error=e)
+            raise
+        self._settle(key, future, response)
+        return response
+
+    async def aget_or_create(
+        self, request: Dict[str, Any], create: Callable[[], Awaitable[ChatCompletion]]
+    ) -> ChatCompletion:
+        key = request_key(request)
+        # The sqlite tier blocks, so it runs off the event loop
+        cached = await asyncio.to_thread(self.get, key)
+        if cached is not None:
+            return cached
+
+        while True:
+            future, leader = self._claim(key)
+            if leader:
+                break
+            try:
+                # Shielded: a follower that gives up must not cancel the result everyone shares
+                return await asyncio.shield(asyncio.wrap_future(future))
+            except _LeaderCancelled:
+                continue
+
+        try:
+            response = await create()
+        except BaseException as e:
+            await asyncio.to_thread(self._settle, key, future, error=e)
+            raise
+        await asyncio.to_thread(self._settle, key, future, response)
+        return response
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.disk_hits + self.shared + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "shared_in_flight": self.shared,
+            "misses": self.misses,
+            "hit_rate": (self.hits + self.disk_hits + self.shared) / lookups if lookups else 0.0,
+        }
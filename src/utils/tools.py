@@ -8,14 +8,29 @@ sys.path.insert(0, str(project_root))
 # --------------------------------------------------------
 # PYDANTIC MODELS for Tool args
 # --------------------------------------------------------
-from pydantic import BaseModel, Field
-from tool_schema import Tool
-from rag.pipeline import RAGPipeline
+import json
+import threading
+from pydantic import BaseModel, Field, field_validator
+from typing import Any, Dict, List, Optional
+from utils.tool_schema import Tool
 from config.config import RagConfig
+from rag.filters import validate_where
 
-config = RagConfig()
+_rag_pipeline = None
+_rag_pipeline_lock = threading.Lock()
+
+
+def get_rag_pipeline():
+    """The shared RAG pipeline, built on first use (opening the vector store takes seconds)"""
+    global _rag_pipeline
+    if _rag_pipeline is None:
+        with _rag_pipeline_lock:
+            if _rag_pipeline is None:
+                # Imported here too: chromadb itself is slow to import
+                from rag.pipeline import RAGPipeline
+                _rag_pipeline = RAGPipeline(config=RagConfig())
+    return _rag_pipeline
 
-rag_pipeline = RAGPipeline(config=config)
 
 class CalculatorParam(BaseModel):
     expression: str = Field(description="mathematical expression")
@@ -26,6 +41,21 @@ class WebSearchParam(BaseModel):
 class RagSearchParam(BaseModel):
     query: str
     k: int = Field(default=5, ge=1, le=10)
+    where: Optional[Dict[str, Any]] = Field(
+        default=None,
+        description=(
+            "Only search chunks whose metadata matches, e.g. {\"source\": \"faq.md\"}, "
+            "{\"source\": {\"$in\": [\"faq.md\", \"terms.md\"]}} or {\"date\": {\"$gte\": \"2024-01-01\", \"$lt\": \"2025-01-01\"}}. "
+            "Operators: $eq $ne $gt $gte $lt $lte $in $nin $and $or; ranges take numbers or ISO dates"
+        )
+    )
+    
+    @field_validator("where")
+    @classmethod
+    def _check_where(cls, where):
+        if where:
+            validate_where(where)
+        return where or None
 # --------------------------------------------------------
 # TOOLS
 # --------------------------------------------------------
@@ -41,16 +71,32 @@ def web_search(query) -> str:
     """Web search not implemented yet."""
     pass
 
-def rag_search(query: str, k: int = 5) -> str:
+def rag_search(query: str, k: int = 5, where: Optional[Dict[str, Any]] = None) -> str:
     """Retrieve relevant documents for a query"""
-    chunks = rag_pipeline.retrieve(query=query, top_k=k)
+    chunks = get_rag_pipeline().retrieve(query=query, top_k=k, where=where)
     
-    context = "\n\n".join(
+    return format_chunks(chunks)
+
+def format_chunks(chunks) -> str:
+    return "\n\n".join(
         f"[Source: {c['metadata'].get('source', 'unknown')}]\n{c['text']}"
         for c in chunks
     )
+
+def rag_search_batch(params: List[RagSearchParam]) -> List[str]:
+    """Run several rag_search calls with one batched retrieval per distinct filter"""
+    groups: Dict[str, List[int]] = {}
+    for i, p in enumerate(params):
+        groups.setdefault(json.dumps(p.where, sort_keys=True), []).append(i)
     
-    return context
+    outputs = [""] * len(params)
+    for indices in groups.values():
+        where = params[indices[0]].where
+        max_k = max(params[i].k for i in indices)
+        results = get_rag_pipeline().retrieve_batch([params[i].query for i in indices], top_k=max_k, where=where)
+        for i, chunks in zip(indices, results):
+            outputs[i] = format_chunks(chunks[:params[i].k])
+    return outputs
 
 # ----------------------------------------------------------
 # OPENAI TOOL Schema
@@ -84,4 +130,9 @@ tool_map = {
     "calculator": (calculator, CalculatorParam),
     "web_search": (web_search, WebSearchParam),
     "rag_search": (rag_search, RagSearchParam)
-}
\ No newline at end of file
+}
+
+# Tools whose calls within one LLM turn can be served by a single batched call
+batch_tool_map = {
+    "rag_search": rag_search_batch
+}